@@ -1,32 +1,51 @@
-from langchain.prompts import PromptTemplate
 import json
-import requests
 import time
 import os  # Used to create directories
-import openai
+import shutil
 
-# ✅ Load the Visual_Style configuration file
-with open("config.json", "r", encoding="utf-8") as f:
-    config = json.load(f)
+import instrumentation
+from response_cache import ResponseCache, load_cache
+from scene_store import open_novel
 
-visual_style = config["Visual_Style"]  # Retrieve the Lovecraftian horror style settings
+# Parameters of every DALL·E request (also part of the cache key)
+image_params = {"model": "dall-e-3", "n": 1, "size": "1024x1024"}
 
-# ✅ Load the scenes_1.json file
-with open("scripts/The_Call_of_Cthulhu/scenes_1.json", "r", encoding="utf-8") as f:
-    scene_list = json.load(f)  # Load all scene details
+# Every PNG file starts with these bytes; anything else is an error page, not an image
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
 
-# ✅ Generate image prompts
-prompts = []
 
-for scene in scene_list:  
+def describe_entity(index, kind, name):
+    """
+    Returns "<canonical name> (<description>)" from the entity index, or the name itself without an index.
+    """
+    entity = index.lookup(kind, name) if index is not None else None
+    if entity is None:
+        return name
+    return f"{entity['name']} ({entity['description']})" if entity["description"] else entity["name"]
+
+
+def build_prompt(scene, visual_style, index=None):
+    """
+    Builds the DALL·E prompt of one scene from its details and the visual style settings.
+
+    Parameters:
+        scene (dict): A scene from the scene store (scene_store.SceneStore.scene).
+        visual_style (dict): The "Visual_Style" section of config.json.
+        index (EntityIndex): Optional character/location index; name variants are replaced by the canonical
+            name and its fixed description, so a character looks the same in every scene.
+
+    Returns:
+        str: The image prompt.
+    """
     # Extract scene details
     scene_desc = scene["summary"]
-    location = scene["location"]
-    characters = ", ".join(scene["characters"])  # Convert character list to a string
+    location = describe_entity(index, "locations", scene["location"])
+    # Convert character list to a string (variants of the same character only appear once)
+    characters = ", ".join(dict.fromkeys(describe_entity(index, "characters", name) for name in scene["characters"]))
     events = ", ".join(scene["events"])  # Convert event list to a string
-    
+
     # ✅ Construct the final prompt using visual style settings
-    prompt = (
+    return (
         f"A {visual_style['mood']} scene set in {visual_style['time_period']}. "
         f"The art style is {visual_style['art_style']}, using {visual_style['color_palette']} colors. "
         f"The environment is {visual_style['details']['environment']} under {visual_style['details']['weather']}. "
@@ -35,46 +54,123 @@ for scene in scene_list:
         f"The scene is illuminated by {visual_style['details']['lighting']}. "
         f"Scene description: {scene_desc}."
     )
-    
-    prompts.append(prompt)
 
-# ✅ Output all generated prompts
-for i, p in enumerate(prompts):
-    print(f"Prompt {i + 1}: {p}\n")
-    
-# **📂 Directory to save generated images**
-save_dir = "images/The_Call_of_Cthulhu"
 
-# **📌 Check and create directory if it does not exist**
-os.makedirs(save_dir, exist_ok=True)
+@instrumentation.instrumented("image")
+def generate_image(prompt, file_name, cache=None):
+    """
+    Generates one image with DALL·E 3 and saves it as a PNG file.
+
+    Parameters:
+        prompt (str): The image prompt.
+        file_name (str): The path of the PNG file to write.
+        cache (ResponseCache): Optional response cache; an unchanged prompt reuses the downloaded image.
 
-# **🎨 Loop through prompts to generate images**
-for i, prompt in enumerate(prompts):
-    try:
-        print(f"Generating image {i + 1} / {len(prompts)}: {prompt}")
+    Returns:
+        bool: True if the image came from the cache, False if the API was called.
+
+    Raises:
+        requests.HTTPError: If downloading the image failed (e.g. an expired URL).
+        ValueError: If the download is not a PNG image.
+    """
+    key = ResponseCache.make_key(params=image_params, prompt=prompt)
+    img_data = cache.get("image", key) if cache is not None else None
+    if img_data is not None and not img_data.startswith(PNG_SIGNATURE):
+        img_data = None  # Cached before downloads were checked: an error page, fetch the image again
+    from_cache = img_data is not None
+
+    if img_data is None:
+        import openai  # Imported on first use: it takes most of the startup time
+        import requests
 
         # **🖼️ Generate the image using DALL·E 3**
-        response = openai.Image.create(
+        response = openai.images.generate(
             prompt=prompt,
-            model="dall-e-3",  # Uses the DALL·E 3 model
-            n=1,  # Generates 1 image per request
-            size="1024x1024"  # Image resolution
+            model=image_params["model"],  # Uses the DALL·E 3 model
+            n=image_params["n"],  # Generates 1 image per request
+            size=image_params["size"]  # Image resolution
         )
 
         # **🔗 Retrieve the image URL from the response**
-        image_url = response["data"][0]["url"]
-        print(f"✅ Image {i + 1} generated successfully, URL: {image_url}")
+        image_url = response.data[0].url
+        print(f"✅ Image generated successfully, URL: {image_url}")
+
+        # **📥 Download the image** (only a real PNG is cached and written)
+        download = requests.get(image_url, timeout=120)
+        download.raise_for_status()
+        img_data = download.content
+        if not img_data.startswith(PNG_SIGNATURE):
+            raise ValueError(f"{image_url} returned {download.headers.get('Content-Type', 'unknown content')} "
+                             f"instead of a PNG image")
+        instrumentation.annotate(model=image_params["model"], images=image_params["n"])
+        if cache is not None:
+            cache.put("image", key, img_data)
+
+    os.makedirs(os.path.dirname(file_name) or ".", exist_ok=True)
+    with open(file_name, "wb") as img_file:
+        img_file.write(img_data)
+    instrumentation.annotate(cached=from_cache, bytes=len(img_data))
+
+    return from_cache
+
+
+if __name__ == "__main__":
+    # ✅ Load the Visual_Style configuration file
+    with open("config.json", "r", encoding="utf-8") as f:
+        config = json.load(f)
+
+    visual_style = config["Visual_Style"]  # Retrieve the Lovecraftian horror style settings
+
+    # ✅ Load only the scenes that have no image yet from the scene store
+    novel = "The_Call_of_Cthulhu"
+    store = open_novel(novel)
+    missing = store.missing(novel, "image")
+    scene_list = store.scenes(novel, missing)
+
+    # ✅ Use the character/location index when it was built (python entity_index.py)
+    index_path = "scripts/The_Call_of_Cthulhu/entities.json"
+    index = None
+    if os.path.exists(index_path):
+        from entity_index import EntityIndex
+
+        index = EntityIndex.load(index_path)
+
+    # ✅ Generate image prompts
+    prompts = [build_prompt(scene, visual_style, index) for scene in scene_list]
+
+    # ✅ Output all generated prompts
+    for i, p in zip(missing, prompts):
+        print(f"Prompt {i}: {p}\n")
+
+    # **📂 Directory to save generated images**
+    save_dir = "images/The_Call_of_Cthulhu"
+
+    # **📌 Check and create directory if it does not exist**
+    os.makedirs(save_dir, exist_ok=True)
+
+    # **📦 Response cache: unchanged prompts reuse the previously downloaded image**
+    cache = load_cache(config)
 
-        # **📥 Download the image**
-        img_data = requests.get(image_url).content
-        file_name = os.path.join(save_dir, f"generated_image_{i + 1}.png")
-        with open(file_name, "wb") as img_file:
-            img_file.write(img_data)
+    # **🎨 Loop through prompts to generate images**
+    for i, prompt in zip(missing, prompts):
+        file_name = os.path.join(save_dir, f"generated_image_{i}.png")
+        try:
+            print(f"Generating image {i} / {store.count(novel)}: {prompt}")
 
-        print(f"📂 Image saved as {file_name}\n")
+            source = index.duplicates.get(i) if index is not None else None
+            if source is not None:
+                # **♻️ A near-duplicate of an earlier scene reuses its image instead of a new DALL·E call**
+                shutil.copyfile(os.path.join(save_dir, f"generated_image_{source}.png"), file_name)
+                print(f"♻️ Image {i} reuses image {source}")
+            elif generate_image(prompt, file_name, cache=cache):
+                print(f"📦 Image {i} loaded from cache")
+            else:
+                # **⏳ Delay to avoid API rate limits**
+                time.sleep(2)
 
-        # **⏳ Delay to avoid API rate limits**
-        time.sleep(2)
+            store.set_artifact(novel, i, "image", file_name)
+            print(f"📂 Image saved as {file_name}\n")
 
-    except Exception as e:
-        print(f"❌ Error generating image {i + 1}: {e}\n")
+        except Exception as e:
+            store.set_artifact(novel, i, "image", file_name, status="failed", error=str(e)[:300])
+            print(f"❌ Error generating image {i}: {e}\n")
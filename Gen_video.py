@@ -1,47 +1,253 @@
 import os
 import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
 
-# ✅ Number of files (Modify this according to your dataset)
-num_files = 4  
-video_list = []  # Store generated video filenames
+import instrumentation
+from media_utils import available_cores, probe_duration, run_ffmpeg
+from mp3_stream import read_duration
+from scene_store import DONE, FAILED, open_novel
 
-# ✅ Ensure the output directory exists
-os.makedirs("videos/The_Call_of_Cthulhu", exist_ok=True)
 
-# ✅ Loop through each scene to generate individual videos
-for i in range(1, num_files + 1):
-    img_file = f"images/The_Call_of_Cthulhu/generated_image_{i}.png"  # Input image file
-    audio_file = f"voices/The_Call_of_Cthulhu/MP3_{i}.mp3"  # Input audio file
-    output_video_file = f"videos/The_Call_of_Cthulhu/temp_video_{i}.mp4"  # Output video file
+def render_clip(img_file, audio_file, output_video_file, threads=None, capture_output=False):
+    """
+    Encodes one scene (a still image plus its narration) into an MP4 clip with FFmpeg.
+
+    Parameters:
+        img_file (str): The input image file.
+        audio_file (str): The input audio file.
+        output_video_file (str): The output video file.
+        threads (int): The number of encoder threads. Default lets FFmpeg decide.
+        capture_output (bool): Capture FFmpeg's log instead of printing it (used by the worker pool).
+    """
+    os.makedirs(os.path.dirname(output_video_file) or ".", exist_ok=True)
 
     # ✅ Generate a single video using FFmpeg
     ffmpeg_cmd = [
-        "ffmpeg", "-loop", "1", "-i", img_file,  # Load image as a still frame
+        "ffmpeg", "-y", "-loop", "1", "-i", img_file,  # Load image as a still frame
         "-i", audio_file,  # Load audio file
         "-c:v", "libx264", "-tune", "stillimage",  # Encode video using H.264 codec optimized for still images
         "-c:a", "aac", "-b:a", "192k",  # Encode audio using AAC codec with 192kbps bitrate
         "-pix_fmt", "yuv420p",  # Set pixel format for broad compatibility
         "-shortest", output_video_file  # Ensure video duration matches audio length
     ]
+    if threads:
+        ffmpeg_cmd[-2:-2] = ["-threads", str(threads)]  # Limit encoder threads when clips run in parallel
 
     # ✅ Execute FFmpeg command
-    subprocess.run(ffmpeg_cmd, check=True)
-    video_list.append(f"temp_video_{i}.mp4")  # Store generated video filename
-
-    print(f"✅ Video generated: {output_video_file}")
-
-# ✅ Create a file list for concatenation
-concat_file = "videos/The_Call_of_Cthulhu/video_list.txt"
-with open(concat_file, "w") as f:
-    for video in video_list:
-        f.write(f"file '{video}'\n")
-
-# ✅ Concatenate all videos into a final output file
-final_output = "Output/final_output.mp4"
-ffmpeg_concat_cmd = [
-    "ffmpeg", "-f", "concat", "-safe", "0", "-i", concat_file,  # Use FFmpeg to concatenate videos
-    "-c", "copy", final_output  # Copy streams without re-encoding
-]
-
-subprocess.run(ffmpeg_concat_cmd, check=True)
-print(f"✅ Video concatenation complete: {final_output}")
+    run_ffmpeg("ffmpeg.clip", ffmpeg_cmd, output_video_file, capture_output=capture_output)
+
+
+def render_clips(jobs, max_workers=None, scenes=None):
+    """
+    Encodes many scene clips concurrently, one FFmpeg process per worker.
+
+    Parameters:
+        jobs (list): (img_file, audio_file, output_video_file) tuples, one per scene.
+        max_workers (int): The number of FFmpeg processes to run at once. Default is the number of available cores.
+        scenes (list): Optional scene numbers of the jobs, attached to their instrumentation records.
+
+    Returns:
+        dict: {job index: error message} for every clip that failed; empty if all clips succeeded.
+    """
+    cores = available_cores()
+    max_workers = max(1, min(max_workers or cores, len(jobs) or 1))
+    # Share the cores between the parallel encoders instead of oversubscribing them
+    threads = max(1, cores // max_workers)
+    context = instrumentation.current_context()  # e.g. the novel, for the worker threads
+
+    def render(i, job):
+        with instrumentation.context(**dict(context, scene=scenes[i] if scenes else None)):
+            render_clip(*job, threads=threads, capture_output=True)
+
+    failures = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(render, i, job): i
+            for i, job in enumerate(jobs)
+        }
+        for future, i in futures.items():
+            output_video_file = jobs[i][2]
+            try:
+                future.result()
+                print(f"✅ Video generated: {output_video_file}")
+            except subprocess.CalledProcessError as e:
+                # Keep the tail of FFmpeg's log, which holds the actual error
+                log = (e.stderr or b"").decode("utf-8", errors="replace").strip().splitlines()
+                failures[i] = "\n".join(log[-5:]) or str(e)
+                print(f"❌ Failed to generate {output_video_file} (exit code {e.returncode})")
+            except OSError as e:
+                failures[i] = str(e)
+                print(f"❌ Failed to generate {output_video_file}: {e}")
+    return failures
+
+
+def _concat_entry(path, concat_dir):
+    # Paths in an FFmpeg concat list are relative to the list file; single quotes must be escaped
+    relative = os.path.relpath(os.path.abspath(path), concat_dir)
+    return "file '" + relative.replace("'", "'\\''") + "'\n"
+
+
+def concat_clips(video_files, concat_file, final_output):
+    """
+    Concatenates scene clips into the final video without re-encoding.
+
+    Parameters:
+        video_files (list): The clip paths, in playback order.
+        concat_file (str): The path of the FFmpeg concat list to write.
+        final_output (str): The path of the final video.
+    """
+    # ✅ Create a file list for concatenation (paths are relative to the list file)
+    concat_dir = os.path.dirname(os.path.abspath(concat_file))
+    with open(concat_file, "w") as f:
+        for video in video_files:
+            f.write(_concat_entry(video, concat_dir))
+
+    # ✅ Concatenate all videos into a final output file
+    os.makedirs(os.path.dirname(final_output) or ".", exist_ok=True)
+    ffmpeg_concat_cmd = [
+        "ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", concat_file,  # Use FFmpeg to concatenate videos
+        "-c", "copy", final_output  # Copy streams without re-encoding
+    ]
+
+    run_ffmpeg("ffmpeg.concat", ffmpeg_concat_cmd, final_output)
+
+
+def assemble_video(img_files, audio_files, final_output, list_dir=None, durations=None, size=(1024, 1024),
+                   fps=25, threads=None, capture_output=False):
+    """
+    Encodes the whole video in one FFmpeg run, without per-scene intermediate clips.
+
+    The images are fed through a concat list in which every image lasts as long as its scene's
+    audio, and the audio files through a second concat list, so FFmpeg opens two inputs however
+    many scenes there are. Every image is scaled and padded to the same frame size, so scenes
+    with different image sizes or audio formats cannot break the assembly.
+
+    Parameters:
+        img_files (list): The scene images, in playback order.
+        audio_files (list): The scene audio files, in the same order.
+        final_output (str): The path of the final video.
+        list_dir (str): Where to write the two concat lists. Default is the directory of final_output.
+        durations (list): Known audio durations in seconds. Scenes without one (None) use the duration
+            stored in the MP3's ID3 tag by tts_backends, and are probed only if it has none.
+        size (tuple): The output frame (width, height). Default is 1024x1024, the DALL·E image size.
+        fps (int): The output frame rate. Default is 25, the rate of the per-scene clips.
+        threads (int): The number of encoder threads. Default lets FFmpeg decide.
+        capture_output (bool): Capture FFmpeg's log instead of printing it.
+    """
+    durations = list(durations or [None] * len(img_files))
+    for i, duration in enumerate(durations):
+        if duration is None:
+            durations[i] = read_duration(audio_files[i])
+    missing = [i for i, duration in enumerate(durations) if duration is None]
+    if missing:
+        # ✅ Probe the audio lengths concurrently; each ffprobe call mostly waits on process start-up
+        with ThreadPoolExecutor(max_workers=min(8, len(missing))) as executor:
+            for i, duration in zip(missing, executor.map(probe_duration, [audio_files[i] for i in missing])):
+                durations[i] = duration
+
+    list_dir = list_dir or os.path.dirname(final_output) or "."
+    os.makedirs(list_dir, exist_ok=True)
+    concat_dir = os.path.abspath(list_dir)
+    image_list = os.path.join(list_dir, "image_list.txt")
+    audio_list = os.path.join(list_dir, "audio_list.txt")
+
+    # ✅ Each image is shown for exactly the length of its narration
+    with open(image_list, "w") as f:
+        f.write("ffconcat version 1.0\n")
+        for img_file, duration in zip(img_files, durations):
+            f.write(_concat_entry(img_file, concat_dir))
+            f.write(f"duration {duration:.6f}\n")
+        # The concat demuxer ignores the duration of the last entry unless the file is repeated
+        f.write(_concat_entry(img_files[-1], concat_dir))
+    with open(audio_list, "w") as f:
+        f.write("ffconcat version 1.0\n")
+        for audio_file in audio_files:
+            f.write(_concat_entry(audio_file, concat_dir))
+
+    width, height = size
+    video_filter = (
+        f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+        f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1,fps={fps},format=yuv420p"
+    )
+    os.makedirs(os.path.dirname(final_output) or ".", exist_ok=True)
+    ffmpeg_cmd = [
+        "ffmpeg", "-y",
+        "-f", "concat", "-safe", "0", "-i", image_list,  # One still image per scene
+        "-f", "concat", "-safe", "0", "-i", audio_list,  # The narration of every scene back to back
+        "-map", "0:v", "-map", "1:a",
+        "-vf", video_filter,  # Uniform frame size and rate whatever the source images look like
+        "-c:v", "libx264", "-tune", "stillimage",
+        "-c:a", "aac", "-b:a", "192k",
+        "-shortest", final_output
+    ]
+    if threads:
+        ffmpeg_cmd[-2:-2] = ["-threads", str(threads)]
+
+    run_ffmpeg("ffmpeg.assemble", ffmpeg_cmd, final_output, capture_output=capture_output)
+
+
+if __name__ == "__main__":
+    single_pass = "--single-pass" in sys.argv[1:]
+
+    # ✅ Discover the scenes from the scene store instead of a hardcoded count
+    store = open_novel("The_Call_of_Cthulhu")
+    num_files = store.count("The_Call_of_Cthulhu")
+    for kind in ("image", "voice"):
+        missing = store.missing("The_Call_of_Cthulhu", kind)
+        if missing:
+            sys.exit(f"❌ Scene(s) {', '.join(map(str, missing))} have no {kind} yet")
+
+    # ✅ Ensure the output directory exists
+    os.makedirs("videos/The_Call_of_Cthulhu", exist_ok=True)
+
+    if single_pass:
+        # ✅ Encode the final video directly from the images and audio, without temp_video_*.mp4 clips
+        final_output = "Output/final_output.mp4"
+        assemble_video(
+            [f"images/The_Call_of_Cthulhu/generated_image_{i}.png" for i in range(1, num_files + 1)],
+            [f"voices/The_Call_of_Cthulhu/MP3_{i}.mp3" for i in range(1, num_files + 1)],
+            final_output,
+            list_dir="videos/The_Call_of_Cthulhu",
+            durations=store.durations("The_Call_of_Cthulhu"),  # Recorded by Gen_voice, no probing
+        )
+        print(f"✅ Single-pass assembly complete: {final_output}")
+        sys.exit(0)
+
+    # ✅ Only encode the scenes without a finished clip (new, edited or failed scenes, or deleted files),
+    # or whose image or audio was regenerated after the clip was encoded
+    missing = sorted(set(store.missing("The_Call_of_Cthulhu", "clip")) | {
+        i for i in range(1, num_files + 1)
+        if os.path.exists(f"videos/The_Call_of_Cthulhu/temp_video_{i}.mp4") and os.path.getmtime(
+            f"videos/The_Call_of_Cthulhu/temp_video_{i}.mp4"
+        ) < max(os.path.getmtime(f"images/The_Call_of_Cthulhu/generated_image_{i}.png"),
+                os.path.getmtime(f"voices/The_Call_of_Cthulhu/MP3_{i}.mp3"))
+    })
+    jobs = [
+        (
+            f"images/The_Call_of_Cthulhu/generated_image_{i}.png",  # Input image file
+            f"voices/The_Call_of_Cthulhu/MP3_{i}.mp3",  # Input audio file
+            f"videos/The_Call_of_Cthulhu/temp_video_{i}.mp4",  # Output video file
+        )
+        for i in missing
+    ]
+
+    # ✅ Encode those scenes with a pool of FFmpeg workers and record every outcome
+    failures = render_clips(jobs, scenes=missing)
+    store.set_artifacts("The_Call_of_Cthulhu", "clip", [
+        (i, job[2], FAILED, None, None, str(failures[job_index])[:300]) if job_index in failures
+        else (i, job[2], DONE, None, None, None)
+        for job_index, (i, job) in enumerate(zip(missing, jobs))
+    ])
+    if failures:
+        for job_index, error in sorted(failures.items()):
+            print(f"❌ Scene {missing[job_index]}: {error}")
+        # Only concatenate once every clip exists
+        sys.exit(f"❌ {len(failures)} of {len(jobs)} scene(s) failed, skipping concatenation")
+
+    final_output = "Output/final_output.mp4"
+    concat_clips(
+        [f"videos/The_Call_of_Cthulhu/temp_video_{i}.mp4" for i in range(1, num_files + 1)],
+        "videos/The_Call_of_Cthulhu/video_list.txt", final_output
+    )
+    print(f"✅ Video concatenation complete: {final_output}")
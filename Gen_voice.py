@@ -1,31 +1,48 @@
-from pathlib import Path
-import openai
 import json
-from gtts import gTTS  # Google Text-to-Speech (optional alternative)
 
-# ✅ Load the scenes_1.json file
-with open("scripts/The_Call_of_Cthulhu/scenes_1.json", "r", encoding="utf-8") as f:
-    scene_list = json.load(f)  # Read all scene data
+from response_cache import load_cache
+from scene_store import open_novel
+from tts_backends import OpenAITTS, synthesize_to_mp3
 
-inputs = []  # Store scene text inputs for speech synthesis
+voice_params = {
+    "model": "tts-1",  # Select the text-to-speech model (options: tts-1, tts-1-hd)
+    "voice": "onyx",  # Choose a voice (options: alloy, echo, fable, onyx, nova, shimmer)
+}
 
-# ✅ Iterate through each scene to generate speech
-for i, scene in enumerate(scene_list):
-    # Extract the original scene text
-    input_text = scene["original_text"]
 
-    # ✅ Generate speech using OpenAI TTS
-    response = openai.Audio.speech.create(
-        model="tts-1",  # Select the text-to-speech model (options: tts-1, tts-1-hd)
-        voice="onyx",  # Choose a voice (options: alloy, echo, fable, onyx, nova, shimmer)
-        input=input_text  # The text content to be converted into speech
-    )
+def generate_voice(input_text, output_path, cache=None):
+    """
+    Synthesizes speech for one scene with OpenAI TTS and saves it as an MP3 file.
 
-    # ✅ Save the generated audio file
-    output_path = f"voice/The_Call_of_Cthulhu/MP3_{i + 1}.mp3"
-    response.stream_to_file(output_path)  # Stream the response directly to a file
+    The text is sent sentence by sentence in parallel and streamed into the file (see tts_backends).
 
-    print(f"🎵 Audio saved as {output_path}")
+    Parameters:
+        input_text (str): The text content to be converted into speech.
+        output_path (str): The path of the MP3 file to write.
+        cache (ResponseCache): Optional response cache; unchanged sentences reuse the previous audio.
 
-# ✅ List available voices in OpenAI TTS
-openai.audio.speech.list()
+    Returns:
+        float: The duration of the audio in seconds.
+    """
+    return synthesize_to_mp3(input_text, output_path, OpenAITTS(voice_params), cache=cache)
+
+
+if __name__ == "__main__":
+    # ✅ Load the configuration file (only used for the optional response cache settings)
+    with open("config.json", "r", encoding="utf-8") as f:
+        config = json.load(f)
+
+    cache = load_cache(config)
+
+    # ✅ Load only the scenes that have no audio yet from the scene store
+    novel = "The_Call_of_Cthulhu"
+    store = open_novel(novel)
+    missing = store.missing(novel, "voice")
+
+    # ✅ Iterate through those scenes to generate speech
+    for i, scene in zip(missing, store.scenes(novel, missing)):
+        output_path = f"voices/{novel}/MP3_{i}.mp3"
+        duration = generate_voice(scene["original_text"], output_path, cache=cache)
+        store.set_artifact(novel, i, "voice", output_path, duration=duration)
+
+        print(f"🎵 Audio saved as {output_path}")
@@ -0,0 +1,44 @@
+import json
+
+from response_cache import load_cache
+from scene_store import open_novel
+from tts_backends import GTTSBackend, synthesize_to_mp3
+
+
+def generate_voice_gtts(input_text, output_path, cache=None, lang="en"):
+    """
+    Synthesizes speech for one scene with Google Text-to-Speech and saves it as an MP3 file.
+
+    The text is sent sentence by sentence in parallel and streamed into the file (see tts_backends).
+
+    Parameters:
+        input_text (str): The text content to be converted into speech.
+        output_path (str): The path of the MP3 file to write.
+        cache (ResponseCache): Optional response cache; unchanged sentences reuse the previous audio.
+        lang (str): The gTTS language code. Default is "en".
+
+    Returns:
+        float: The duration of the audio in seconds.
+    """
+    return synthesize_to_mp3(input_text, output_path, GTTSBackend(lang), cache=cache)
+
+
+if __name__ == "__main__":
+    # ✅ Load the configuration file (only used for the optional response cache settings)
+    with open("config.json", "r", encoding="utf-8") as f:
+        config = json.load(f)
+
+    cache = load_cache(config)
+
+    # ✅ Load only the scenes that have no audio yet from the scene store
+    novel = "The_Call_of_Cthulhu"
+    store = open_novel(novel)
+    missing = store.missing(novel, "voice")
+
+    # ✅ Iterate through those scenes to generate speech
+    for i, scene in zip(missing, store.scenes(novel, missing)):
+        output_path = f"voices/{novel}/MP3_{i}.mp3"
+        duration = generate_voice_gtts(scene["original_text"], output_path, cache=cache)
+        store.set_artifact(novel, i, "voice", output_path, duration=duration)
+
+        print(f"✅ Audio file generated: {output_path}")
@@ -0,0 +1,543 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import instrumentation
+from llm_batching import RequestStats, TruncatedResponse, iter_batches, run_batched
+from rate_limiter import RateLimiter, call_with_rate_limit, estimate_tokens
+from response_cache import ResponseCache, load_cache
+
+
+class LazyPromptTemplate:
+    """
+    A langchain PromptTemplate that is only built on the first format() call.
+
+    Importing langchain takes about a second, which every script and stage importing this module
+    would otherwise pay at startup even when all segmentation results come from the cache.
+    """
+
+    def __init__(self, **kwargs):
+        self._kwargs = kwargs
+        self._template = None
+
+    def format(self, **kwargs):
+        if self._template is None:
+            from langchain.prompts import PromptTemplate
+
+            self._template = PromptTemplate(**self._kwargs)
+        return self._template.format(**kwargs)
+
+
+prompt_template = LazyPromptTemplate(
+    input_variables=["text"],
+    template="""
+You are a professional scriptwriter. Analyze the following novel text and divide it into multiple scenes.
+Each scene should include:
+- **Scene ID**
+- **Scene Summary** (a brief description of what happens)
+- **Main Characters**
+- **Main Location**
+- **Key Events**
+- **Scene Transition Reason** (Why is this a new scene?)
+- **Original Text** (The original text corresponding to this scene)
+
+**Always return a strict JSON format** with **no extra text or explanations**, only pure JSON.
+Return the output in **JSON format array**, following this example:
+"scenes":[
+    {{
+        "scene_id": 1,
+        "summary": "The protagonist finds a mysterious letter at home.",
+        "characters": ["Protagonist"],
+        "location": "Protagonist's house",
+        "events": ["Finds the letter", "Reads the content"],
+        "atmosphere": "Mysterious",
+        "transition_reason": "A new event begins",
+        "original_text": "He entered his home, only to find a dusty envelope on the table."
+    }},
+    {{
+        "scene_id": 2,
+        "summary": "The protagonist visits the mysterious location.",
+        "characters": ["Protagonist", "Antagonist"],
+        "location": "Mysterious forest",
+        "events": ["Meets the antagonist", "Fights the antagonist"],
+        "atmosphere": "Tense",
+        "transition_reason": "The protagonist arrives at the location",
+        "original_text": "He entered the forest, where he met the antagonist."
+    }}
+    ...
+]
+
+Here is the novel text:
+{text}
+"""
+)
+
+# Several chunks in one request: the instructions and system prompt are paid once per batch
+batch_prompt_template = LazyPromptTemplate(
+    input_variables=["passages"],
+    template="""
+You are a professional scriptwriter. You will receive several passages of a novel as a JSON array of
+{{"index": ..., "text": ...}} objects. Divide EACH passage independently into multiple scenes.
+Each scene must have the fields "scene_id" (numbered from 1 within its passage), "summary", "characters" (list),
+"location", "events" (list), "atmosphere", "transition_reason" and "original_text" (the passage text of the scene).
+
+**Always return a strict JSON format** with **no extra text or explanations**, only pure JSON, shaped as:
+{{"results": [{{"index": 0, "scenes": [...]}}, {{"index": 1, "scenes": [...]}}]}}
+with exactly one entry per passage.
+
+Here are the passages:
+{passages}
+"""
+)
+
+
+class Chatbot:
+    def __init__(self, system_prompt, model="gpt-4-turbo", cache=None):
+        """
+        Initializes the chatbot with a system prompt.
+
+        Parameters:
+            system_prompt (str): A predefined instruction that sets the chatbot's behavior.
+            model (str): The chat model to use. Default is "gpt-4-turbo".
+            cache (ResponseCache): Optional response cache; identical prompts are answered from disk.
+        """
+        self.system_prompt = system_prompt
+        self.model = model
+        self.cache = cache
+        self.params = {
+            "temperature": 0.5,  # Lowers randomness to ensure structured and stable responses
+            "top_p": 0.9,  # Prevents extreme or highly unlikely outputs
+            "n": 1,  # Generates only one response
+            "response_format": {"type": "json_object"},  # Forces GPT to return a JSON object
+            "presence_penalty": 0.2,  # Slightly encourages new content in responses
+            "frequency_penalty": 0.2,  # Slightly reduces repetitive phrases
+            "stop": ["\n\n"],  # Stops response at the end of a paragraph
+        }
+        self.stats = RequestStats()  # Requests and tokens used, for batching measurements
+
+    def _cache_key(self, prompt):
+        return ResponseCache.make_key(
+            model=self.model, params=self.params, system_prompt=self.system_prompt, prompt=prompt
+        )
+
+    def request(self, prompt):
+        """
+        Sends one uncached chat completion and returns the raw response (with finish_reason and usage).
+
+        Parameters:
+            prompt (str): The user input message.
+
+        Returns:
+            The chat completion response.
+        """
+        import openai  # Imported on first use: it takes most of the startup time
+
+        response = openai.chat.completions.create(
+            model=self.model,  # Uses the GPT-4 Turbo model by default for optimized performance
+            messages=[
+                {"role": "system", "content": self.system_prompt},  # Defines system-level behavior
+                {"role": "user", "content": prompt}  # User input prompt
+            ],
+            **self.params
+        )
+        self.stats.record(response)
+        return response
+
+    def generate_response(self, prompt, validate=None, stage="segmentation"):
+        """
+        Generates a response from OpenAI's GPT-4 Turbo model.
+
+        Parameters:
+            prompt (str): The user input message to which the chatbot responds.
+            validate (callable): Optional check of the parsed JSON reply. It raises ValueError for a
+                reply that must not be used; such replies are never cached.
+            stage (str): The instrumentation stage the call (and its cost) is reported under, which
+                is also the cache folder of the reply. Default is "segmentation".
+
+        Returns:
+            str: The generated response as a JSON-formatted string.
+        """
+        with instrumentation.span(stage):
+            key = self._cache_key(prompt)
+            if self.cache is not None:
+                cached = self.cache.get_text(stage, key)
+                if cached is not None:
+                    instrumentation.annotate(cached=True)
+                    return cached
+
+            instrumentation.annotate(model=self.model)
+            response = self.request(prompt)
+            content = response.choices[0].message.content
+            try:
+                # Only cache replies that are valid JSON so a bad answer is retried next time
+                data = json.loads(content)
+            except (TypeError, json.JSONDecodeError) as e:
+                print(f"JSON ERROR: {e}")  # Prints error message if JSON decoding fails
+                return None
+            if validate is not None:
+                validate(data)
+            if self.cache is not None:
+                self.cache.put_text(stage, key, content)
+            return content
+
+
+# Required fields of every scene and their types ("atmosphere" is optional)
+SCENE_SCHEMA = {
+    "scene_id": int,
+    "summary": str,
+    "characters": list,
+    "location": str,
+    "events": list,
+    "transition_reason": str,
+    "original_text": str,
+}
+
+
+def validate_scenes(data):
+    """
+    Checks a parsed model reply against the scene schema.
+
+    Parameters:
+        data (dict): The parsed JSON reply.
+
+    Raises:
+        ValueError: If there is no non-empty "scenes" list or a scene has missing or mistyped fields.
+    """
+    scenes = data.get("scenes") if isinstance(data, dict) else None
+    if not isinstance(scenes, list) or not scenes:
+        raise ValueError("The model response has no \"scenes\" list")
+    for i, scene in enumerate(scenes):
+        if not isinstance(scene, dict):
+            raise ValueError(f"Scene {i + 1} is not an object")
+        for field, field_type in SCENE_SCHEMA.items():
+            if not isinstance(scene.get(field), field_type):
+                raise ValueError(f"Scene {i + 1} has no valid \"{field}\" ({field_type.__name__})")
+        if not all(isinstance(item, str) for item in scene["characters"] + scene["events"]):
+            raise ValueError(f"Scene {i + 1} has non-string characters or events")
+        if not scene["original_text"].strip():
+            raise ValueError(f"Scene {i + 1} has an empty \"original_text\"")
+
+
+def segment_text(chatbot, text):
+    """
+    Splits a piece of novel text into scenes.
+
+    Parameters:
+        chatbot (Chatbot): The chatbot used to analyze the text.
+        text (str): The novel text (typically one chunk from Text_Splitter).
+
+    Returns:
+        list: The scene dictionaries, numbered from 1 within this text.
+
+    Raises:
+        ValueError: If the model does not return valid JSON matching the scene schema.
+    """
+    scene_data = chatbot.generate_response(prompt_template.format(text=text), validate=validate_scenes)
+    if scene_data is None:
+        raise ValueError("The model did not return valid JSON")
+    return json.loads(scene_data)["scenes"]
+
+
+def segment_texts_batched(chatbot, texts, batch_tokens=3000, call=None):
+    """
+    Splits several pieces of novel text into scenes using as few requests as possible.
+
+    Texts are packed into requests of up to `batch_tokens` input tokens. A batch whose reply is
+    truncated (finish_reason == "length") or cannot be split back per text is halved and retried;
+    a single text that still fails falls back to segment_text. Results are cached per text under
+    the same key as segment_text, so both modes reuse each other's answers.
+
+    Parameters:
+        chatbot (Chatbot): The chatbot used to analyze the texts.
+        texts (list): The novel texts.
+        batch_tokens (int): The maximum number of input tokens per request. Default is 3000.
+        call (callable): Optional wrapper of every request, e.g. for rate limiting: call(fn, texts) -> fn(),
+            where `texts` are the texts the request carries.
+
+    Returns:
+        list: One list of scenes per text.
+    """
+    call = call or (lambda fn, batch: fn())
+    results = [None] * len(texts)
+    missing = []
+    for i, text in enumerate(texts):
+        key = chatbot._cache_key(prompt_template.format(text=text))
+        cached = chatbot.cache.get_text("segmentation", key) if chatbot.cache is not None else None
+        if cached is None:
+            missing.append(i)
+        else:
+            results[i] = json.loads(cached)["scenes"]
+
+    def call_batch(batch):
+        passages = json.dumps([{"index": k, "text": text} for k, text in enumerate(batch)], ensure_ascii=False)
+        prompt = batch_prompt_template.format(passages=passages)
+
+        def send():
+            with instrumentation.span("segmentation", model=chatbot.model, passages=len(batch)):
+                return chatbot.request(prompt)
+
+        response = call(send, batch)
+        if response.choices[0].finish_reason == "length":
+            raise TruncatedResponse(f"The reply for {len(batch)} passages was truncated")
+        try:
+            entries = json.loads(response.choices[0].message.content)["results"]
+            by_index = {entry["index"]: entry["scenes"] for entry in entries}
+        except (TypeError, KeyError, json.JSONDecodeError) as e:
+            raise ValueError(f"The batch reply is not the expected JSON: {e}")
+        if sorted(by_index) != list(range(len(batch))):
+            raise ValueError(f"The batch reply covers passages {sorted(by_index)}, expected {len(batch)}")
+        outputs = []
+        for k, text in enumerate(batch):
+            validate_scenes({"scenes": by_index[k]})
+            if chatbot.cache is not None:
+                key = chatbot._cache_key(prompt_template.format(text=text))
+                chatbot.cache.put_text("segmentation", key, json.dumps({"scenes": by_index[k]}, ensure_ascii=False))
+            outputs.append(by_index[k])
+        return outputs
+
+    segmented = run_batched([texts[i] for i in missing], call_batch, batch_tokens,
+                            fallback=lambda text: call(lambda: segment_text(chatbot, text), [text]))
+    for i, scenes in zip(missing, segmented):
+        results[i] = scenes
+    return results
+
+
+def _normalize(text):
+    return " ".join(text.split())
+
+
+def _suffix_prefix_overlap(a, b):
+    # Length of the longest suffix of `a` that is also a prefix of `b` (KMP prefix function, linear time)
+    s = b + "\0" + a
+    prefix = [0] * len(s)
+    for i in range(1, len(s)):
+        k = prefix[i - 1]
+        while k and s[i] != s[k]:
+            k = prefix[k - 1]
+        if s[i] == s[k]:
+            k += 1
+        prefix[i] = k
+    return prefix[-1]
+
+
+def _merge_unique(first, second):
+    return first + [item for item in second if item not in first]
+
+
+def _strip_prefix(text, prefix):
+    """
+    Removes `prefix` (whitespace-normalized) from the start of `text`, comparing only non-whitespace
+    characters so that the rest of `text` keeps its original line breaks and spacing.
+
+    Returns:
+        str: The rest of `text`, or None if `text` does not start with `prefix`.
+    """
+    position = 0
+    for char in prefix:
+        if char.isspace():
+            continue
+        while position < len(text) and text[position].isspace():
+            position += 1
+        if position == len(text) or text[position] != char:
+            return None
+        position += 1
+    return text[position:]
+
+
+def _same_scene(previous, first):
+    # The model describes a scene that continues across the boundary with the same place or cast
+    location = previous["location"].strip().casefold()
+    if location and location == first["location"].strip().casefold():
+        return True
+    characters = {name.strip().casefold() for name in previous["characters"]}
+    return bool(characters) and characters == {name.strip().casefold() for name in first["characters"]}
+
+
+def merge_boundary_scenes(chunk_scenes, chunks=None, min_overlap=20):
+    """
+    Joins the per-chunk scene lists into one list, stitching scenes that cross a chunk boundary.
+
+    Text_Splitter repeats the last sentences of each chunk at the start of the next one. That repeated
+    text is removed from the first scene(s) of the next chunk; a scene lying entirely inside it is a
+    duplicate and is dropped. The repetition itself says nothing about where scenes change, so the
+    rest of the first scene is only merged into the previous scene when the previous scene runs to
+    the end of its chunk and both take place at the same location or with the same characters.
+
+    Parameters:
+        chunk_scenes (list): One list of scenes per chunk, in reading order.
+        chunks (list): The chunk texts, used to find exactly what each chunk repeats. Without them
+            the repeated text is taken to be the longest end of the previous scene that starts the
+            next one.
+        min_overlap (int): Without chunks, the minimum shared text (in characters) that counts as
+            repeated. Default is 20.
+
+    Returns:
+        list: The merged scenes (scene IDs are not renumbered).
+    """
+    merged = []
+    for k, scenes in enumerate(chunk_scenes):
+        scenes = [dict(scene) for scene in scenes]
+        if not merged or not scenes:
+            merged.extend(scenes)
+            continue
+        previous = merged[-1]
+        previous_text = _normalize(previous["original_text"])
+        if chunks is not None:
+            before, after = _normalize(chunks[k - 1]), _normalize(chunks[k])
+            repeated = after[:_suffix_prefix_overlap(before[-len(after):], after)]
+            # The previous scene was cut by the boundary only if it reaches the end of its chunk
+            cut = before.endswith(previous_text[-min_overlap:])
+        else:
+            first_text = _normalize(scenes[0]["original_text"])
+            overlap = _suffix_prefix_overlap(previous_text[-len(first_text):], first_text)
+            repeated = first_text[:overlap] if overlap >= min_overlap else ""
+            cut = True
+
+        # Drop the scenes that only repeat the end of the previous chunk, then trim the one that straddles it
+        while repeated and scenes:
+            first_text = _normalize(scenes[0]["original_text"])
+            if repeated.startswith(first_text):
+                scenes.pop(0)
+                repeated = repeated[len(first_text):].strip()
+                continue
+            rest = _strip_prefix(scenes[0]["original_text"], repeated)
+            if rest is not None and rest.strip():
+                scenes[0]["original_text"] = rest
+            break
+
+        if scenes and cut and _same_scene(previous, scenes[0]):
+            first = scenes.pop(0)
+            text, rest = previous["original_text"], first["original_text"]
+            separator = "" if text[-1:].isspace() or rest[:1].isspace() else " "
+            previous["original_text"] = text + separator + rest
+            previous["summary"] = f"{previous['summary']} {first['summary']}"
+            previous["characters"] = _merge_unique(previous["characters"], first["characters"])
+            previous["events"] = _merge_unique(previous["events"], first["events"])
+        elif scenes:
+            scenes[0]["original_text"] = scenes[0]["original_text"].lstrip()
+        merged.extend(scenes)
+    return merged
+
+
+def renumber_scenes(scenes):
+    """
+    Assigns global, consecutive scene IDs starting at 1.
+    """
+    for scene_id, scene in enumerate(scenes, start=1):
+        scene["scene_id"] = scene_id
+    return scenes
+
+
+def segment_novel(chatbot, chunks, max_workers=8, max_rounds=3, requests_per_minute=None, tokens_per_minute=None,
+                  batch_tokens=None):
+    """
+    Segments every chunk of a novel concurrently and stitches the results into one scene list.
+
+    All chunks are sent at once (up to `max_workers` in flight, within the rate limits), so the
+    whole book takes about as long as its slowest chunk. Replies that are not valid JSON or fail
+    the scene schema are retried in later rounds; chunks that already succeeded are not re-sent.
+
+    Parameters:
+        chatbot (Chatbot): The chatbot used to analyze the text.
+        chunks (list): The text chunks from Text_Splitter, in reading order.
+        max_workers (int): The maximum number of concurrent requests. Default is 8.
+        max_rounds (int): How many times a failing chunk is attempted. Default is 3.
+        requests_per_minute (int): Optional requests-per-minute budget.
+        tokens_per_minute (int): Optional tokens-per-minute budget.
+        batch_tokens (int): If set, pack several chunks into each request, up to this many input tokens
+            (see segment_texts_batched).
+
+    Returns:
+        list: The scenes of the whole novel with global scene IDs.
+
+    Raises:
+        RuntimeError: If some chunks still fail after `max_rounds` attempts.
+    """
+    limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+    results = [None] * len(chunks)
+    errors = {}
+    if batch_tokens:
+        pending = [[i for i, _ in batch] for batch in iter_batches(chunks, batch_tokens)]
+    else:
+        pending = [[i] for i in range(len(chunks))]
+
+    def rate_limited(fn, texts):
+        # The reply (scene JSON including the original text) is roughly as long as the prompt
+        tokens = 2 * sum(estimate_tokens(prompt_template.format(text=text)) for text in texts)
+        return call_with_rate_limit(fn, limiter, tokens)
+
+    def segment_job(job):
+        if batch_tokens:
+            # Every request of the batch (including halved retries and per-chunk fallbacks) is limited
+            # and retried on its own
+            return segment_texts_batched(chatbot, [chunks[i] for i in job], batch_tokens, call=rate_limited)
+        return [rate_limited(lambda: segment_text(chatbot, chunks[job[0]]), [chunks[job[0]]])]
+
+    for round_number in range(1, max_rounds + 1):
+        if not pending:
+            break
+        if round_number > 1:
+            print(f"🔁 Retrying {len(pending)} request(s), round {round_number} / {max_rounds}")
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [(job, executor.submit(segment_job, job)) for job in pending]
+        failed = []
+        for job, future in futures:
+            try:
+                for i, scenes in zip(job, future.result()):
+                    results[i] = scenes
+                    errors.pop(i, None)
+                    print(f"✅ Chunk {i + 1} / {len(chunks)}: {len(scenes)} scene(s)")
+            except Exception as e:
+                failed.append(job)
+                for i in job:
+                    errors[i] = e
+                    print(f"❌ Chunk {i + 1} / {len(chunks)}: {e}")
+        pending = failed
+
+    if pending:
+        failed_chunks = [i for job in pending for i in job]
+        raise RuntimeError(f"{len(failed_chunks)} chunk(s) could not be segmented: "
+                           + ", ".join(f"{i + 1} ({errors[i]})" for i in failed_chunks))
+    return renumber_scenes(merge_boundary_scenes(results, chunks))
+
+
+if __name__ == "__main__":
+    # 读取 JSON 文件
+    with open("config.json", "r", encoding="utf-8") as f:
+        config = json.load(f)
+    import openai
+
+    openai.api_key = config["KEY"]["OPENAI_API_KEY"]
+
+    from Text_Splitter import load_and_split_text
+    from sentence_splitter import token_settings
+
+    # 读取小说文本并拆分成片段（chunk 大小以 token 计，旧的字符设置会被换算）
+    novel_pth = config["project_paths"]["data_dir"]
+    chunk_size, chunk_overlap = token_settings(config["text_splitter"], "chunk", "chunk_overlap", 500, 50)
+    novel_chunks = load_and_split_text(novel_pth, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    print(f"Total {len(novel_chunks)} chunks to segment")
+
+    # 初始化 Chatbot 并并发解析整本小说
+    chatbot = Chatbot(
+        system_prompt="You are a screenplay expert. Return a structured JSON array.",
+        cache=load_cache(config),
+    )
+    settings = config.get("segmentation", {})
+    scenes = segment_novel(
+        chatbot,
+        novel_chunks,
+        max_workers=settings.get("max_workers", 8),
+        requests_per_minute=settings.get("requests_per_minute"),
+        tokens_per_minute=settings.get("tokens_per_minute"),
+        batch_tokens=settings.get("batch_tokens"),
+    )
+    print(f"共解析出 {len(scenes)} 个场景")
+
+    # ✅ Save the scene list of the whole novel in the scene store (offsets into the novel, not text copies)
+    from scene_store import SceneStore
+
+    novel_name = os.path.splitext(os.path.basename(novel_pth))[0]
+    with SceneStore() as store:
+        store.put_scenes(novel_name, scenes, novel_pth)
+    print(f"✅ Scenes of {novel_name} saved to {store.path}")
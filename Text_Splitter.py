@@ -1,42 +1,39 @@
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 import json
 
-# 读取 JSON 文件
-with open("config.json", "r", encoding="utf-8") as f:
-    config = json.load(f)
+import sentence_splitter
 
 
-def load_and_split_text(file_path, chunk_size=2000, chunk_overlap=200):
+def load_and_split_text(file_path, chunk_size=500, chunk_overlap=50):
     """
     Reads a novel text file and splits it into smaller chunks for processing.
 
+    Chunks are packed from whole sentences (see sentence_splitter), so they never end mid-sentence.
+
     Parameters:
         file_path (str): The path to the novel text file.
-        chunk_size (int): The maximum number of characters per chunk. Default is 2000.
-        chunk_overlap (int): The number of overlapping characters between chunks to preserve context. Default is 200.
+        chunk_size (int): The maximum number of tokens per chunk. Default is 500.
+        chunk_overlap (int): The number of overlapping tokens between chunks to preserve context. Default is 50.
 
     Returns:
         list: A list of text chunks.
     """
-    # Read the novel text file
-    with open(file_path, "r", encoding="utf-8") as f:
-        text = f.read()
-
-    # Use recursive text splitting to maintain coherence
-    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-    chunks = splitter.split_text(text)
-
-    return chunks
+    return sentence_splitter.load_and_split_text(file_path, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
 
 if __name__ == "__main__":
+    # 读取 JSON 文件
+    with open("config.json", "r", encoding="utf-8") as f:
+        config = json.load(f)
+
     # 访问配置数据
     novel_pth = config["project_paths"]["data_dir"]
-    chunk_size=config["text_splitter"]["chunk_size"]
-    chunk_overlap=config["text_splitter"]["chunk_overlap"]
+    # chunk_tokens / chunk_overlap_tokens; the older chunk_size / chunk_overlap (characters) are converted
+    chunk_size, chunk_overlap = sentence_splitter.token_settings(
+        config["text_splitter"], "chunk", "chunk_overlap", 500, 50
+    )
     # 读取小说文本并拆分成片段
     novel_chunks = load_and_split_text(novel_pth, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-    print("chunk_size:", chunk_size)
-    print("chunk_overlap:", chunk_overlap)
+    print("chunk_tokens:", chunk_size)
+    print("chunk_overlap_tokens:", chunk_overlap)
     # ✅ Verify the output
     print(type(novel_chunks))  # Check the data type of the output
     print(f"Total {len(novel_chunks)} scene segments extracted")  # Display the number of text chunks
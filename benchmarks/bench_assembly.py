@@ -0,0 +1,73 @@
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_parallel_render import make_scene  # noqa: E402
+from Gen_video import assemble_video, concat_clips, render_clips  # noqa: E402
+
+
+def measure(run):
+    """
+    Runs `run()` and returns its wall time and the bytes FFmpeg wrote to the block device.
+
+    Written blocks come from getrusage(RUSAGE_CHILDREN), so on tmpfs they stay at 0; the
+    file sizes reported next to them are the size of what each path leaves on disk.
+    """
+    before = resource.getrusage(resource.RUSAGE_CHILDREN).ru_oublock
+    start = time.perf_counter()
+    run()
+    elapsed = time.perf_counter() - start
+    written = (resource.getrusage(resource.RUSAGE_CHILDREN).ru_oublock - before) * 512
+    return elapsed, written
+
+
+def size_of(paths):
+    return sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare two-stage (clips + concat) and single-pass video assembly.")
+    parser.add_argument("--scenes", type=int, default=20)
+    parser.add_argument("--seconds", type=float, default=20.0, help="Audio length of each synthetic scene")
+    parser.add_argument("--workers", type=int, default=None, help="Clip encoder pool size (default: available cores)")
+    parser.add_argument("--dir", default=None, help="Work directory (default: a temporary directory; "
+                                                     "use a disk-backed path to see written blocks)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        media = [make_scene(directory, i, args.seconds) for i in range(1, args.scenes + 1)]
+        images = [img for img, _ in media]
+        voices = [audio for _, audio in media]
+
+        clips = [os.path.join(directory, f"temp_video_{i}.mp4") for i in range(1, args.scenes + 1)]
+        two_stage_output = os.path.join(directory, "two_stage.mp4")
+
+        def two_stage():
+            failures = render_clips(list(zip(images, voices, clips)), max_workers=args.workers)
+            if failures:
+                sys.exit(f"❌ {len(failures)} clip(s) failed: {failures}")
+            concat_clips(clips, os.path.join(directory, "video_list.txt"), two_stage_output)
+
+        single_pass_output = os.path.join(directory, "single_pass.mp4")
+
+        def single_pass():
+            assemble_video(images, voices, single_pass_output, capture_output=True)
+
+        two_stage_time, two_stage_written = measure(two_stage)
+        two_stage_files = size_of(clips + [two_stage_output])
+        single_pass_time, single_pass_written = measure(single_pass)
+        single_pass_files = size_of([single_pass_output])
+
+    mib = 1024 * 1024
+    print(f"scenes:                 {args.scenes} x {args.seconds:.0f}s")
+    print(f"two-stage wall time:    {two_stage_time:.2f}s")
+    print(f"single-pass wall time:  {single_pass_time:.2f}s")
+    print(f"two-stage files:        {two_stage_files / mib:.1f} MiB ({args.scenes} clips + final)")
+    print(f"single-pass files:      {single_pass_files / mib:.1f} MiB (final only)")
+    print(f"two-stage written:      {two_stage_written / mib:.1f} MiB (block device)")
+    print(f"single-pass written:    {single_pass_written / mib:.1f} MiB (block device)")
@@ -0,0 +1,103 @@
+import argparse
+import json
+import os
+import sys
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import openai  # noqa: E402
+
+from rate_limiter import estimate_tokens  # noqa: E402
+from sentence_splitter import load_and_split_text, split_sentences  # noqa: E402
+
+MAX_OUTPUT_TOKENS = 4096  # gpt-4-turbo's completion limit
+
+
+def fake_completion(reply):
+    """
+    Builds a stand-in for openai.chat.completions.create whose answer is computed by `reply(prompt)`.
+    Usage is estimated from the message sizes, and replies above MAX_OUTPUT_TOKENS are truncated.
+    """
+    def create(model, messages, **params):
+        prompt_tokens = sum(estimate_tokens(message["content"]) + 4 for message in messages)
+        content = reply(messages[-1]["content"])
+        finish_reason = "stop"
+        if estimate_tokens(content) > MAX_OUTPUT_TOKENS:
+            content, finish_reason = content[:MAX_OUTPUT_TOKENS * 4], "length"
+        usage = types.SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=estimate_tokens(content))
+        message = types.SimpleNamespace(content=content)
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message, finish_reason=finish_reason)],
+                                     usage=usage)
+    return create
+
+
+def translation_reply(prompt):
+    # The "translation" is the upper-cased input, so output tokens track input tokens like a real one
+    if "Texts to translate: " in prompt:
+        texts = json.loads(prompt.split("Texts to translate: ", 1)[1])
+        return json.dumps({"translations": [text.upper() for text in texts]}, ensure_ascii=False)
+    return prompt.split("Text to translate: ", 1)[1].upper()
+
+
+def fake_scenes(text):
+    sentences = split_sentences(text)
+    middle = max(1, len(sentences) // 2)
+    return [
+        {"scene_id": k + 1, "summary": " ".join(" ".join(part).split()[:12]), "characters": ["Narrator"],
+         "location": "Providence",
+         "events": ["An event"], "atmosphere": "Tense", "transition_reason": "A new event begins",
+         "original_text": " ".join(part)}
+        for k, part in enumerate([sentences[:middle], sentences[middle:]]) if part
+    ]
+
+
+def segmentation_reply(prompt):
+    if "Here are the passages:" in prompt:
+        passages = json.loads(prompt.split("Here are the passages:", 1)[1])
+        return json.dumps({"results": [{"index": p["index"], "scenes": fake_scenes(p["text"])} for p in passages]})
+    return json.dumps({"scenes": fake_scenes(prompt.split("Here is the novel text:", 1)[1].strip())})
+
+
+def report(name, stats, items):
+    summary = stats.summary(items)
+    print(f"{name:<34} {summary['requests']:5d} requests  {summary['requests_per_item']:.2f} req/item  "
+          f"{summary['tokens_per_item']:7.1f} tokens/item  {summary['truncated']} truncated")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure requests and tokens per item with and without batching.")
+    parser.add_argument("--input", default=os.path.join(ROOT, "Input", "The_Call_of_Cthulhu.txt"))
+    parser.add_argument("--chunk-tokens", type=int, default=150, help="Size of the (short) chunks")
+    parser.add_argument("--batch-tokens", type=int, default=2000)
+    args = parser.parse_args()
+
+    chunks = load_and_split_text(args.input, chunk_size=args.chunk_tokens, chunk_overlap=0)
+    print(f"{len(chunks)} chunks of <= {args.chunk_tokens} tokens, batch budget {args.batch_tokens} tokens\n")
+
+    from translate_novel import Translator
+
+    openai.chat.completions.create = fake_completion(translation_reply)
+    single = Translator(api_key="stub")
+    for chunk in chunks:
+        single.translate_text(chunk)
+    batched = Translator(api_key="stub")
+    batched.translate_texts(chunks, batch_tokens=args.batch_tokens)
+    report("translation, one chunk per request", single.stats, len(chunks))
+    report("translation, batched", batched.stats, len(chunks))
+
+    try:
+        from Scene_Segmentation import Chatbot, segment_text, segment_texts_batched
+    except ImportError as e:
+        print(f"\nSkipping segmentation ({e})")
+        sys.exit()
+
+    openai.chat.completions.create = fake_completion(segmentation_reply)
+    single = Chatbot(system_prompt="You are a screenplay expert. Return a structured JSON array.")
+    for chunk in chunks:
+        segment_text(single, chunk)
+    batched = Chatbot(system_prompt="You are a screenplay expert. Return a structured JSON array.")
+    segment_texts_batched(batched, chunks, batch_tokens=args.batch_tokens)
+    report("segmentation, one chunk per request", single.stats, len(chunks))
+    report("segmentation, batched", batched.stats, len(chunks))
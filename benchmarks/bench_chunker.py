@@ -0,0 +1,79 @@
+import argparse
+import os
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from rate_limiter import estimate_tokens  # noqa: E402
+from sentence_splitter import split_text  # noqa: E402
+
+
+def legacy_split(text, chunk_size=1000, max_deviation=100):
+    """
+    The previous rfind/find chunker of translate_novel.py, kept here as the baseline.
+    """
+    text = text.replace('\r\n', '\n').replace('\r', '\n')
+    text = re.sub(r'\n+', '\n\n', text)
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = start + chunk_size
+        if end >= len(text):
+            chunks.append(text[start:])
+            break
+        stop_index_forward = text.rfind('.', start, end + max_deviation) + 1
+        stop_index_backward = text.find('.', end - max_deviation, end + max_deviation) + 1
+        if stop_index_forward == 0:
+            stop_index = stop_index_backward if stop_index_backward != 0 else end
+        elif stop_index_backward == 0:
+            stop_index = stop_index_forward
+        else:
+            stop_index = (
+                stop_index_forward
+                if abs(stop_index_forward - end) < abs(stop_index_backward - end)
+                else stop_index_backward
+            )
+        if stop_index <= start:
+            stop_index = end
+        chunk = text[start:stop_index].strip()
+        if chunk:
+            chunks.append(chunk)
+        start = stop_index
+    return chunks
+
+
+def measure(name, split, text, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        chunks = split(text)
+        best = min(best, time.perf_counter() - start)
+    sizes = [estimate_tokens(chunk) for chunk in chunks]
+    print(f"{name:<28} {best:8.3f}s {len(text) / best / 1e6:8.1f} MB/s "
+          f"{len(chunks):7d} chunks  max {max(sizes)} tokens")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the text chunkers on a scaled-up novel.")
+    parser.add_argument("--input", default=os.path.join(ROOT, "Input", "The_Call_of_Cthulhu.txt"))
+    parser.add_argument("--scale", type=int, default=100, help="How many times to repeat the novel")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with open(args.input, "r", encoding="utf-8") as f:
+        text = f.read() * args.scale
+    print(f"input: {len(text) / 1e6:.1f} MB ({args.scale}x {os.path.basename(args.input)})")
+
+    measure("legacy rfind/find (chars)", lambda t: legacy_split(t, 1000, 100), text, args.repeat)
+    measure("sentence_splitter (tokens)", lambda t: split_text(t, 250 + 25, 0), text, args.repeat)
+    measure("sentence_splitter +overlap", lambda t: split_text(t, 500, 50), text, args.repeat)
+    try:
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+    except ImportError:
+        print("langchain not installed, skipping RecursiveCharacterTextSplitter")
+    else:
+        splitter = RecursiveCharacterTextSplitter(chunk_size=2000, chunk_overlap=200)
+        measure("langchain recursive (chars)", splitter.split_text, text, args.repeat)
@@ -0,0 +1,135 @@
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_end_to_end import VISUAL_STYLE  # noqa: E402
+from bench_scene_store import make_scenes  # noqa: E402
+
+# Modules a stage or script imports first; their import time is paid by every process that starts
+MODULES = ["rate_limiter", "Scene_Segmentation", "translate_novel", "Gen_img", "Gen_voice", "Gen_video",
+           "tts_backends", "pipeline"]
+DRY_RUN = ["--stages", "image,voice,video", "--dry-run", "--config", "config.json"]
+
+
+def export_tree(ref, directory):
+    """
+    Extracts the repository at a git ref (e.g. HEAD~1) into `directory`, to measure an earlier version.
+    """
+    archive = subprocess.run(["git", "archive", ref], cwd=ROOT, capture_output=True, check=True).stdout
+    subprocess.run(["tar", "-x", "-C", directory], input=archive, check=True)
+    return directory
+
+
+def make_workdir(directory, source, novels):
+    """
+    Writes `novels` copies of the source novel, each with its scenes_1.json, and a config.json into `directory`.
+    """
+    with open(source, "r", encoding="utf-8") as f:
+        text = f.read()
+    scenes = make_scenes(text)
+    os.makedirs(os.path.join(directory, "Input"))
+    names = [f"novel_{i}" for i in range(1, novels + 1)]
+    for name in names:
+        with open(os.path.join(directory, "Input", f"{name}.txt"), "w", encoding="utf-8") as f:
+            f.write(text)
+        os.makedirs(os.path.join(directory, "scripts", name))
+        with open(os.path.join(directory, "scripts", name, "scenes_1.json"), "w", encoding="utf-8") as f:
+            json.dump(scenes, f, ensure_ascii=False, indent=4)
+    config = {"KEY": {"OPENAI_API_KEY": "unused"}, "Visual_Style": VISUAL_STYLE,
+              "response_cache": {"enabled": False}, "entity_index": {"enabled": False}}
+    with open(os.path.join(directory, "config.json"), "w", encoding="utf-8") as f:
+        json.dump(config, f)
+    return names
+
+
+def timed(command, cwd, repeat):
+    """
+    Runs a command `repeat` times and returns the median wall time in seconds.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=cwd, capture_output=True, check=True)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def import_times(tree, repeat):
+    """
+    Returns {module: median seconds to import it in a fresh interpreter} for the modules present in `tree`.
+    """
+    baseline = timed([sys.executable, "-c", "pass"], tree, repeat)
+    return {
+        module: timed([sys.executable, "-c", f"import {module}"], tree, repeat) - baseline
+        for module in MODULES if os.path.exists(os.path.join(tree, f"{module}.py"))
+    }
+
+
+def batch_times(tree, workdir, names, repeat):
+    """
+    Times a dry run over all novels: one pipeline.py process per novel, and one visual_novel.py
+    process for the whole queue when the tree has it.
+
+    Returns:
+        tuple: (seconds with one process per novel, seconds with one process or None)
+    """
+    per_novel = [[sys.executable, os.path.join(tree, "pipeline.py"), "--novel", name] + DRY_RUN for name in names]
+    for name, command in zip(names, per_novel):
+        # Warm-up: a dry run does not write the scene store, so import scenes_1.json where the tree has one
+        if os.path.exists(os.path.join(tree, "scene_store.py")):
+            subprocess.run([sys.executable, os.path.join(tree, "scene_store.py"), "import", "--novel", name],
+                           cwd=workdir, capture_output=True, check=True)
+        subprocess.run(command, cwd=workdir, capture_output=True, check=True)
+    separate = statistics.median(
+        sum(timed(command, workdir, 1) for command in per_novel) for _ in range(repeat)
+    )
+    single = None
+    if os.path.exists(os.path.join(tree, "visual_novel.py")):
+        command = [sys.executable, os.path.join(tree, "visual_novel.py"), "run"]
+        for name in names:
+            command += ["--novel", name]
+        single = timed(command + DRY_RUN, workdir, repeat)
+    return separate, single
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure module import times and the startup cost of running a queue of novels."
+    )
+    parser.add_argument("--input", default=os.path.join(ROOT, "Input", "The_Call_of_Cthulhu.txt"))
+    parser.add_argument("--novels", type=int, default=5, help="Novels in the queue")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement (the median is reported)")
+    parser.add_argument("--ref", action="append", default=[],
+                        help="Also measure this git ref (e.g. HEAD~1), repeatable; the working tree is always measured")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        trees = [("working tree", ROOT)]
+        for ref in args.ref:
+            trees.append((ref, export_tree(ref, tempfile.mkdtemp(dir=directory))))
+        for label, tree in trees:
+            workdir = tempfile.mkdtemp(dir=directory)
+            names = make_workdir(workdir, args.input, args.novels)
+            results[label] = (import_times(tree, args.repeat), batch_times(tree, workdir, names, args.repeat))
+            shutil.rmtree(workdir)
+
+    labels = list(results)
+    print(f"{'import (ms)':<20}" + "".join(f"{label:>16}" for label in labels))
+    for module in MODULES:
+        row = [results[label][0].get(module) for label in labels]
+        print(f"{module:<20}" + "".join(f"{'-' if t is None else f'{t * 1000:.0f}':>16}" for t in row))
+    print(f"\ndry run of {args.novels} novels (s)")
+    print(f"{'process per novel':<20}" + "".join(f"{results[label][1][0]:>16.2f}" for label in labels))
+    print(f"{'one process':<20}" + "".join(
+        f"{'-' if results[label][1][1] is None else f'{results[label][1][1]:.2f}':>16}" for label in labels
+    ))
@@ -0,0 +1,183 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from stub_server import add_arguments, settings_from_args, start_server  # noqa: E402
+
+NOVEL = "The_Call_of_Cthulhu"
+
+# Each stage runs in its own process so its peak RSS is measured on its own:
+#   split            Text_Splitter.load_and_split_text (the chunker used by the pipeline)
+#   split_translate  translate_novel.load_and_split_text
+#   segment          pipeline segment stage (Scene_Segmentation.segment_novel)
+#   translate        translate_novel.save_translated_chunks_concurrent
+#   media            pipeline index + image + voice + clips + concat, pipelined (entity_index, Gen_img,
+#                    Gen_voice, Gen_video)
+#   video            pipeline video stage as a single-pass assembly of the same media
+STAGES = ["split", "split_translate", "segment", "translate", "media", "video"]
+MEDIA_STAGES = {"media", "video"}
+
+VISUAL_STYLE = {
+    "mood": "dark and eerie", "time_period": "the 1920s", "art_style": "oil painting", "color_palette": "muted",
+    "details": {"environment": "a coastal town", "weather": "fog", "lighting": "dim gas lamps"},
+}
+
+
+def make_workdir(directory, source, scale, workers):
+    """
+    Writes a `scale`× copy of the source novel and a config.json pointing at the stub into `directory`.
+    """
+    with open(source, "r", encoding="utf-8") as f:
+        text = f.read()
+    os.makedirs(os.path.join(directory, "Input"), exist_ok=True)
+    input_path = os.path.join(directory, "Input", f"{NOVEL}.txt")
+    with open(input_path, "w", encoding="utf-8") as f:
+        f.write("\n\n".join([text] * scale))
+
+    config = {
+        "KEY": {"OPENAI_API_KEY": "stub"},
+        "Visual_Style": VISUAL_STYLE,
+        "response_cache": {"enabled": False},  # Measure the real request path
+        "segmentation": {"max_workers": workers},
+        "pipeline": {"image_workers": workers, "voice_workers": workers},
+    }
+    with open(os.path.join(directory, "config.json"), "w", encoding="utf-8") as f:
+        json.dump(config, f)
+    return os.path.getsize(input_path)
+
+
+def run_stage(stage, workers):
+    """
+    Runs one stage in the current directory (a work directory) and returns the number of items it produced.
+    """
+    with open("config.json", "r", encoding="utf-8") as f:
+        config = json.load(f)
+    input_path = os.path.join("Input", f"{NOVEL}.txt")
+
+    if stage == "split":
+        from Text_Splitter import load_and_split_text
+
+        return len(load_and_split_text(input_path))
+    if stage == "split_translate":
+        from translate_novel import load_and_split_text
+
+        return len(load_and_split_text(input_path))
+    if stage == "translate":
+        from translate_novel import load_and_split_text, save_translated_chunks_concurrent
+
+        chunks = load_and_split_text(input_path)
+        save_translated_chunks_concurrent(chunks, "translated.txt", api_key="stub", max_workers=workers,
+                                          base_url=os.environ["OPENAI_BASE_URL"])
+        return len(chunks)
+
+    from pipeline import Pipeline
+
+    pipeline = Pipeline(NOVEL, config, input_path=input_path, voice_engine="openai", single_pass=stage == "video")
+    if stage == "segment":
+        pipeline.run(["segment"])
+    elif stage == "media":
+        pipeline.run(["index", "image", "voice", "video"], pipelined=True)
+    else:
+        pipeline.run(["video"])
+    return len(pipeline.load_scenes())
+
+
+def run_child(args):
+    os.chdir(args.workdir)
+    # Keep the stage's own progress output out of the results line
+    stdout, sys.stdout = sys.stdout, open(os.devnull, "w")
+    start = time.perf_counter()
+    items = run_stage(args.child, args.workers)
+    seconds = time.perf_counter() - start
+    sys.stdout = stdout
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # KiB on Linux
+    print(json.dumps({"seconds": seconds, "items": items, "peak_rss_mib": peak_rss / 1024}))
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run the whole pipeline offline against local stubs of the OpenAI endpoints and report "
+                    "throughput and peak RSS per stage at several novel sizes."
+    )
+    parser.add_argument("--input", default=os.path.join(ROOT, "Input", f"{NOVEL}.txt"))
+    parser.add_argument("--scales", default="1,10,100", help="Comma-separated novel size multipliers")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"Comma-separated subset of {STAGES}")
+    parser.add_argument("--max-media-scale", type=int, default=10,
+                        help="Skip the media/video stages above this scale (they encode one clip per scene)")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent requests per stage")
+    parser.add_argument("--output", help="Also write the results as JSON, e.g. to compare commits")
+    parser.add_argument("--child", choices=STAGES, help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        sys.exit(0)
+
+    settings = settings_from_args(args)
+    server = start_server(settings)
+    env = dict(os.environ, OPENAI_BASE_URL=f"http://127.0.0.1:{server.server_port}/v1/", OPENAI_API_KEY="stub")
+
+    stages = [stage.strip() for stage in args.stages.split(",") if stage.strip()]
+    results = []
+    print(f"{'scale':>5} {'stage':<16} {'items':>7} {'seconds':>8} {'items/s':>8} {'KiB/s':>8} "
+          f"{'peak RSS':>9} {'requests':>9} {'429s':>5}")
+    for scale in [int(scale) for scale in args.scales.split(",")]:
+        with tempfile.TemporaryDirectory() as workdir:
+            input_bytes = make_workdir(workdir, args.input, scale, args.workers)
+            for stage in stages:
+                if stage in MEDIA_STAGES and scale > args.max_media_scale:
+                    continue
+                before = dict(settings.counts)
+                child = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--child", stage, "--workdir", workdir,
+                     "--workers", str(args.workers)],
+                    env=env, capture_output=True, text=True
+                )
+                if child.returncode != 0:
+                    print(f"❌ {stage} at {scale}x failed:\n{child.stderr[-2000:]}")
+                    sys.exit(1)
+                result = json.loads(child.stdout.strip().splitlines()[-1])
+                counts = {key: value - before.get(key, 0) for key, value in settings.counts.items()}
+                result.update(
+                    scale=scale, stage=stage, input_bytes=input_bytes,
+                    items_per_second=result["items"] / result["seconds"],
+                    kib_per_second=input_bytes / 1024 / result["seconds"],
+                    requests=sum(value for key, value in counts.items() if key in ("chat", "image", "tts")),
+                    rate_limited=sum(value for key, value in counts.items() if key.endswith("_429")),
+                )
+                results.append(result)
+                print(f"{scale:>4}x {stage:<16} {result['items']:>7} {result['seconds']:>8.2f} "
+                      f"{result['items_per_second']:>8.1f} {result['kib_per_second']:>8.0f} "
+                      f"{result['peak_rss_mib']:>7.0f}Mi {result['requests']:>9} {result['rate_limited']:>5}",
+                      flush=True)
+    server.shutdown()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "commit": git_commit(),
+                "python": platform.python_version(),
+                "stub": {"latency": settings.latency, "jitter": settings.jitter, "error_rate": settings.error_rate},
+                "workers": args.workers,
+                "results": results,
+            }, f, indent=2)
+        print(f"📄 Results written to {args.output}")
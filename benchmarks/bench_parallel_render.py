@@ -0,0 +1,54 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Gen_video import render_clip, render_clips  # noqa: E402
+from media_utils import available_cores  # noqa: E402
+
+
+def make_scene(directory, i, seconds):
+    """
+    Creates a synthetic 1024x1024 still image and a `seconds`-long tone with FFmpeg.
+    """
+    img_file = os.path.join(directory, f"generated_image_{i}.png")
+    audio_file = os.path.join(directory, f"MP3_{i}.mp3")
+    subprocess.run(["ffmpeg", "-y", "-f", "lavfi", "-i", f"testsrc2=size=1024x1024:rate=1",
+                    "-frames:v", "1", img_file], check=True, capture_output=True)
+    subprocess.run(["ffmpeg", "-y", "-f", "lavfi", "-i", f"sine=frequency={220 + 20 * i}:duration={seconds}",
+                    "-b:a", "64k", audio_file], check=True, capture_output=True)
+    return img_file, audio_file
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare serial and pooled FFmpeg scene rendering.")
+    parser.add_argument("--scenes", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=20.0, help="Audio length of each synthetic scene")
+    parser.add_argument("--workers", type=int, default=None, help="Pool size (default: available cores)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        media = [make_scene(directory, i, args.seconds) for i in range(1, args.scenes + 1)]
+
+        serial_jobs = [(img, audio, os.path.join(directory, f"serial_{i}.mp4")) for i, (img, audio) in enumerate(media)]
+        start = time.perf_counter()
+        for job in serial_jobs:
+            render_clip(*job, capture_output=True)
+        serial_time = time.perf_counter() - start
+
+        pool_jobs = [(img, audio, os.path.join(directory, f"pool_{i}.mp4")) for i, (img, audio) in enumerate(media)]
+        start = time.perf_counter()
+        failures = render_clips(pool_jobs, max_workers=args.workers)
+        pool_time = time.perf_counter() - start
+
+    if failures:
+        sys.exit(f"❌ {len(failures)} clip(s) failed: {failures}")
+    print(f"cores:    {available_cores()}")
+    print(f"scenes:   {args.scenes} x {args.seconds:.0f}s")
+    print(f"serial:   {serial_time:.2f}s")
+    print(f"pool:     {pool_time:.2f}s")
+    print(f"speedup:  {serial_time / pool_time:.2f}x")
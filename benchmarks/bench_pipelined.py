@@ -0,0 +1,69 @@
+import argparse
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pipeline import run_pipelined  # noqa: E402
+
+
+def fake_stage(name, latency, jitter):
+    """
+    Returns a stand-in for an API call or FFmpeg encode that sleeps `latency` ± `jitter` seconds.
+    """
+    def run(i, *inputs):
+        time.sleep(max(0.0, random.uniform(latency - jitter, latency + jitter)))
+        return f"{name}_{i}"
+    return run
+
+
+def run_staged(count, make_image, make_voice, encode_clip, image_workers, voice_workers, encode_workers):
+    """
+    The stage-by-stage schedule: every image and voice (concurrently) first, then every clip.
+    """
+    start = time.perf_counter()
+    with ThreadPoolExecutor(image_workers) as image_pool, ThreadPoolExecutor(voice_workers) as voice_pool:
+        images = image_pool.map(make_image, range(1, count + 1))
+        voices = voice_pool.map(make_voice, range(1, count + 1))
+        images, voices = list(images), list(voices)
+    first = None
+    with ThreadPoolExecutor(encode_workers) as encode_pool:
+        for _ in encode_pool.map(encode_clip, range(1, count + 1), images, voices):
+            if first is None:
+                first = time.perf_counter() - start
+    return {"time_to_first_clip": first, "total": time.perf_counter() - start}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare staged and pipelined scene production with fake generators.")
+    parser.add_argument("--scenes", type=int, default=40)
+    parser.add_argument("--image-latency", type=float, default=0.5, help="Seconds per fake image request")
+    parser.add_argument("--voice-latency", type=float, default=0.3, help="Seconds per fake TTS request")
+    parser.add_argument("--encode-latency", type=float, default=0.4, help="Seconds per fake clip encode")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Relative latency jitter (0.2 = ±20%%)")
+    parser.add_argument("--image-workers", type=int, default=4)
+    parser.add_argument("--voice-workers", type=int, default=4)
+    parser.add_argument("--encode-workers", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    stages = (
+        fake_stage("image", args.image_latency, args.image_latency * args.jitter),
+        fake_stage("voice", args.voice_latency, args.voice_latency * args.jitter),
+        fake_stage("clip", args.encode_latency, args.encode_latency * args.jitter),
+    )
+    workers = (args.image_workers, args.voice_workers, args.encode_workers)
+
+    staged = run_staged(args.scenes, *stages, *workers)
+    _, pipelined = run_pipelined(args.scenes, *stages, *workers)
+
+    print(f"scenes:               {args.scenes}")
+    print(f"staged first clip:    {staged['time_to_first_clip']:.2f}s")
+    print(f"pipelined first clip: {pipelined['time_to_first_clip']:.2f}s")
+    print(f"staged total:         {staged['total']:.2f}s")
+    print(f"pipelined total:      {pipelined['total']:.2f}s")
+    print(f"speedup:              {staged['total'] / pipelined['total']:.2f}x")
@@ -0,0 +1,100 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from scene_store import SceneStore  # noqa: E402
+from sentence_splitter import split_sentences  # noqa: E402
+
+
+def make_scenes(text, scene_chars=1500):
+    """
+    Cuts a text into scenes of about `scene_chars` characters with segmentation-like metadata.
+    """
+    scenes = []
+    current = []
+    for sentence in split_sentences(text):
+        current.append(sentence)
+        if sum(len(part) + 1 for part in current) >= scene_chars:
+            scenes.append(current)
+            current = []
+    if current:
+        scenes.append(current)
+    return [
+        {
+            "scene_id": i, "summary": " ".join(" ".join(sentences).split()[:12]), "characters": ["Narrator"],
+            "location": "Providence", "events": ["event"], "transition_reason": "continuation",
+            "original_text": " ".join(" ".join(sentences).split()),
+        }
+        for i, sentences in enumerate(scenes, start=1)
+    ]
+
+
+def best_of(run, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare scenes_1.json with the SQLite scene store.")
+    parser.add_argument("--input", default=os.path.join(ROOT, "Input", "The_Call_of_Cthulhu.txt"))
+    parser.add_argument("--scale", type=int, default=20, help="Copies of the novel (more scenes)")
+    args = parser.parse_args()
+
+    with open(args.input, "r", encoding="utf-8") as f:
+        text = "\n\n".join([f.read()] * args.scale)
+
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, "novel.txt")
+        with open(source, "w", encoding="utf-8") as f:
+            f.write(text)
+        scenes = make_scenes(text)
+        count = len(scenes)
+        middle = count // 2
+
+        json_path = os.path.join(directory, "scenes_1.json")
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(scenes, f, ensure_ascii=False, indent=4)
+        # Every other scene already has its image
+        images = [os.path.join(directory, f"generated_image_{i}.png") for i in range(1, count + 1)]
+        for path in images[::2]:
+            open(path, "wb").close()
+
+        store = SceneStore(os.path.join(directory, "scenes.db"))
+        put_time = best_of(lambda: store.put_scenes("novel", scenes, source), repeat=1)
+        store.set_artifacts("novel", "image", [(i, images[i - 1], "done", None, None, None)
+                                                for i in range(1, count + 1, 2)])
+        assert store.scenes("novel") == scenes
+
+        def json_load():
+            with open(json_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+
+        def json_missing():
+            return [i for i, _ in enumerate(json_load(), start=1) if not os.path.exists(images[i - 1])]
+
+        results = [
+            ("load all scenes", best_of(json_load), best_of(lambda: store.scenes("novel"))),
+            ("load one scene", best_of(lambda: json_load()[middle]), best_of(lambda: store.scene("novel", middle))),
+            ("scenes missing an image", best_of(json_missing), best_of(lambda: store.missing("novel", "image"))),
+        ]
+        assert json_missing() == store.missing("novel", "image")
+        store.close()
+        json_size = os.path.getsize(json_path)
+        db_size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)
+                      if name.startswith("scenes.db"))
+
+    print(f"scenes:                  {count} ({len(text) / 1024:.0f} KiB of text)")
+    print(f"size:                    scenes_1.json {json_size / 1024:.0f} KiB, scenes.db {db_size / 1024:.0f} KiB")
+    print(f"store write:             {put_time * 1000:.1f} ms")
+    for name, json_time, store_time in results:
+        print(f"{name + ':':<24} scenes_1.json {json_time * 1000:8.2f} ms, store {store_time * 1000:8.2f} ms")
@@ -0,0 +1,77 @@
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from media_utils import available_cores  # noqa: E402
+from tts_backends import BACKENDS, load_backend, synthesize_to_mp3  # noqa: E402
+
+
+def cpu_seconds():
+    """
+    Returns the CPU time (user + system) used so far by this process and its finished children.
+
+    The local engine runs in espeak-ng/FFmpeg child processes, the API engines in this process.
+    """
+    total = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        total += usage.ru_utime + usage.ru_stime
+    return total
+
+
+def run(backend, texts, directory):
+    """
+    Synthesizes every text into its own MP3 and returns (wall seconds, CPU seconds, audio seconds).
+    """
+    cpu_before = cpu_seconds()
+    start = time.perf_counter()
+    audio = 0.0
+    for i, text in enumerate(texts, start=1):
+        audio += synthesize_to_mp3(text, os.path.join(directory, f"MP3_{i}.mp3"), backend)
+    return time.perf_counter() - start, cpu_seconds() - cpu_before, audio
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure the real-time factor of a TTS backend, overall and per core, at several worker counts."
+    )
+    parser.add_argument("--engine", choices=sorted(BACKENDS), default="espeak")
+    parser.add_argument("--scenes", default=os.path.join(ROOT, "scripts", "The_Call_of_Cthulhu", "scenes_1.json"))
+    parser.add_argument("--count", type=int, default=10, help="Number of scenes to synthesize")
+    parser.add_argument("--workers", default=None,
+                        help="Comma-separated worker counts (default: 1, 2, 4, ... up to the available cores)")
+    parser.add_argument("--config", default=None, help="config.json with a tts section for the backend settings")
+    args = parser.parse_args()
+
+    with open(args.scenes, "r", encoding="utf-8") as f:
+        texts = [scene["original_text"] for scene in json.load(f)[:args.count]]
+    config = {}
+    if args.config:
+        with open(args.config, "r", encoding="utf-8") as f:
+            config = json.load(f)
+
+    cores = available_cores()
+    if args.workers:
+        worker_counts = [int(workers) for workers in args.workers.split(",")]
+    else:
+        worker_counts = sorted({min(2 ** power, cores) for power in range(cores.bit_length() + 1)})
+
+    # RTF = synthesis time / audio time (below 1 is faster than real time). RTF per core charges
+    # the CPU time actually burnt, so it stays flat when the engine scales and rises when it does not.
+    print(f"engine: {args.engine}, {len(texts)} scenes, {sum(len(text) for text in texts)} characters, "
+          f"{cores} core(s)")
+    print(f"{'workers':>7} {'wall s':>8} {'CPU s':>8} {'audio s':>8} {'RTF':>7} {'RTF/core':>9} {'x realtime':>10}")
+    for workers in worker_counts:
+        backend = load_backend(args.engine, config)
+        backend.max_workers = workers
+        with tempfile.TemporaryDirectory() as directory:
+            wall, cpu, audio = run(backend, texts, directory)
+        print(f"{workers:>7} {wall:>8.2f} {cpu:>8.2f} {audio:>8.1f} {wall / audio:>7.3f} {cpu / audio:>9.3f} "
+              f"{audio / wall:>10.1f}", flush=True)
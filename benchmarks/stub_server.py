@@ -0,0 +1,203 @@
+import argparse
+import json
+import os
+import random
+import struct
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_batching import segmentation_reply, translation_reply  # noqa: E402
+from rate_limiter import estimate_tokens  # noqa: E402
+
+# One silent MPEG-1 Layer III frame: 32 kbps, 44.1 kHz, mono; 1152 samples (~26 ms) per frame
+MP3_FRAME = bytes([0xFF, 0xFB, 0x10, 0xC0]) + bytes(104 - 4)
+MP3_FRAME_SECONDS = 1152 / 44100
+
+
+def solid_png(width, height, rgb=(40, 60, 90)):
+    """
+    Returns the bytes of a single-colour RGB PNG image.
+    """
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    row = b"\x00" + bytes(rgb) * width  # Filter type 0 followed by the pixels
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(row * height))
+            + chunk(b"IEND", b""))
+
+
+def silent_mp3(seconds):
+    """
+    Returns a silent MP3 of roughly `seconds` seconds.
+    """
+    return MP3_FRAME * max(1, round(seconds / MP3_FRAME_SECONDS))
+
+
+class StubSettings:
+    def __init__(self, chat_latency=0.2, image_latency=0.5, tts_latency=0.2, jitter=0.2, error_rate=0.0,
+                 image_size=1024, chars_per_second=15.0, max_audio_seconds=2.0, seed=None):
+        """
+        Latencies (seconds, ± `jitter` relative), the share of requests answered with 429, and the
+        shape of the generated media of a stub server.
+        """
+        self.latency = {"chat": chat_latency, "image": image_latency, "tts": tts_latency}
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.image = solid_png(image_size, image_size)
+        self.chars_per_second = chars_per_second
+        self.max_audio_seconds = max_audio_seconds
+        self.random = random.Random(seed)
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    def count(self, key):
+        with self._lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def delay(self, endpoint):
+        latency = self.latency[endpoint]
+        with self._lock:
+            return max(0.0, self.random.uniform(latency * (1 - self.jitter), latency * (1 + self.jitter)))
+
+    def should_fail(self):
+        with self._lock:
+            return self.random.random() < self.error_rate
+
+
+def chat_completion(body):
+    """
+    Answers a chat completion like the real endpoint would, using the benchmark reply functions.
+    """
+    prompt = body["messages"][-1]["content"]
+    if "to translate: " in prompt:
+        content = translation_reply(prompt)
+    elif "art director" in prompt:
+        content = description_reply(prompt)
+    else:
+        content = segmentation_reply(prompt)
+    prompt_tokens = sum(estimate_tokens(message["content"]) + 4 for message in body["messages"])
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "gpt-4-turbo"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": estimate_tokens(content),
+                  "total_tokens": prompt_tokens + estimate_tokens(content)},
+    }
+
+
+def description_reply(prompt):
+    # Entity descriptions for entity_index.EntityIndex.describe
+    entities = json.loads(prompt.split("Here are the ", 1)[1].split("\n", 1)[1])
+    return json.dumps({"descriptions": [
+        {"index": entity["index"], "description": f"A distinctive look for {entity['name']}."} for entity in entities
+    ]})
+
+
+def make_handler(settings):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass  # Keep the benchmark output readable
+
+        def reply(self, status, body, content_type="application/json", headers=None):
+            if content_type == "application/json":
+                body = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                with settings._lock:
+                    self.reply(200, dict(settings.counts))
+            elif self.path.startswith("/files/"):
+                settings.count("download")
+                self.reply(200, settings.image, content_type="image/png")
+            else:
+                self.reply(404, {"error": {"message": f"unknown path {self.path}"}})
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            endpoints = {"/v1/chat/completions": "chat", "/v1/images/generations": "image", "/v1/audio/speech": "tts"}
+            endpoint = endpoints.get(self.path)
+            if endpoint is None:
+                self.reply(404, {"error": {"message": f"unknown path {self.path}"}})
+                return
+
+            settings.count(endpoint)
+            time.sleep(settings.delay(endpoint))
+            if settings.should_fail():
+                settings.count(f"{endpoint}_429")
+                self.reply(429, {"error": {"message": "Rate limit reached (stub)", "type": "requests"}},
+                           headers={"Retry-After": "0.1"})
+                return
+
+            if endpoint == "chat":
+                self.reply(200, chat_completion(body))
+            elif endpoint == "image":
+                host = self.headers.get("Host")
+                self.reply(200, {"created": int(time.time()), "data": [{"url": f"http://{host}/files/image.png"}]})
+            else:
+                seconds = min(settings.max_audio_seconds, len(body.get("input", "")) / settings.chars_per_second)
+                self.reply(200, silent_mp3(seconds), content_type="audio/mpeg")
+
+    return Handler
+
+
+def start_server(settings, host="127.0.0.1", port=0):
+    """
+    Starts the stub in a background thread and returns the server; its base URL is
+    f"http://{host}:{server.server_port}/v1/".
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(settings))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def add_arguments(parser):
+    parser.add_argument("--chat-latency", type=float, default=0.2, help="Seconds per chat completion")
+    parser.add_argument("--image-latency", type=float, default=0.5, help="Seconds per image generation")
+    parser.add_argument("--tts-latency", type=float, default=0.2, help="Seconds per speech request")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Relative latency jitter (0.2 = ±20%%)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument("--image-size", type=int, default=1024, help="Edge of the generated PNG in pixels")
+    parser.add_argument("--max-audio-seconds", type=float, default=2.0, help="Cap on the length of generated speech")
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def settings_from_args(args):
+    return StubSettings(args.chat_latency, args.image_latency, args.tts_latency, args.jitter, args.error_rate,
+                        args.image_size, max_audio_seconds=args.max_audio_seconds, seed=args.seed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="A local stand-in for the OpenAI chat, image and speech endpoints. Point the scripts at it with "
+                    "OPENAI_BASE_URL=http://127.0.0.1:<port>/v1/ OPENAI_API_KEY=stub."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server = start_server(settings_from_args(args), args.host, args.port)
+    print(f"Stub listening on http://{args.host}:{server.server_port}/v1/", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,359 @@
+import argparse
+import json
+import math
+import os
+import re
+import zlib
+
+from llm_batching import run_batched
+from scene_store import open_novel
+
+# Words dropped before comparing names: "Professor Angell" and "George Gammell Angell" share "angell"
+TITLES = {
+    "professor", "prof", "dr", "doctor", "mr", "mrs", "ms", "miss", "sir", "lady", "lord", "inspector",
+    "captain", "capt", "lieutenant", "lt", "sergeant", "sgt", "father", "brother", "sister", "old", "young", "the",
+}
+
+_WORD = re.compile(r"[^\W\d_]+(?:['’][^\W\d_]+)*")
+
+describe_prompt = """
+You are an art director preparing a visual novel. For each {kind} below, write one short, concrete visual
+description (appearance, clothing or architecture, era-appropriate details; at most 40 words) that an image model
+can reuse in every scene so the {kind} always looks the same. Base it on the given context snippets.
+
+Return strict JSON only: {{"descriptions": [{{"index": 0, "description": "..."}}, ...]}} with one entry per {kind}.
+
+Here are the {kind}s:
+{entities}
+"""
+
+
+def name_tokens(name):
+    """
+    Returns the lower-cased words of a name without titles and possessives.
+    """
+    words = (word.lower().replace("’", "'") for word in _WORD.findall(name))
+    words = (word[:-2] if word.endswith("'s") else word for word in words)
+    return frozenset(word for word in words if word not in TITLES and len(word) > 1)
+
+
+class NgramEmbedder:
+    """
+    A dependency-free local embedding: hashed character trigrams, L2-normalized, as sparse dicts.
+    Good at spelling variants ("Angel" / "Angell"); it has no notion of meaning.
+    """
+
+    def embed(self, text):
+        text = f" {' '.join(text.lower().split())} "
+        counts = {}
+        for i in range(len(text) - 2):
+            key = zlib.crc32(text[i:i + 3].encode("utf-8"))  # Stable across processes, unlike hash()
+            counts[key] = counts.get(key, 0) + 1
+        norm = math.sqrt(sum(value * value for value in counts.values())) or 1.0
+        return {key: value / norm for key, value in counts.items()}
+
+    @staticmethod
+    def similarity(u, v):
+        if len(u) > len(v):
+            u, v = v, u
+        return sum(weight * v.get(key, 0.0) for key, weight in u.items())
+
+
+class SentenceTransformerEmbedder:
+    def __init__(self, model_name):
+        """
+        Semantic embeddings from a local sentence-transformers model (e.g. "all-MiniLM-L6-v2").
+        """
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name)
+
+    def embed(self, text):
+        return [float(x) for x in self.model.encode(text, normalize_embeddings=True)]
+
+    @staticmethod
+    def similarity(u, v):
+        return sum(a * b for a, b in zip(u, v))
+
+
+def load_embedder(model_name=None):
+    """
+    Returns a SentenceTransformerEmbedder when `model_name` is set and sentence-transformers is installed,
+    otherwise the built-in NgramEmbedder.
+    """
+    if model_name:
+        try:
+            return SentenceTransformerEmbedder(model_name)
+        except ImportError:
+            print("⚠️ sentence-transformers is not installed, falling back to character n-gram embeddings")
+    return NgramEmbedder()
+
+
+class EntityIndex:
+    KINDS = {"characters": "character", "locations": "location"}
+    FIELDS = {"characters": "characters", "locations": "location"}  # The scene field holding the names
+
+    def __init__(self, characters=None, locations=None, duplicates=None):
+        """
+        Canonical characters and locations of a novel's scenes, and the scenes that can reuse another's image.
+
+        Every entity is a dict {"name", "aliases", "description", "scenes", "reference_image"}; descriptions
+        can be edited by hand in the saved JSON and are kept when the index is rebuilt.
+
+        Parameters:
+            characters (list): The character entities.
+            locations (list): The location entities.
+            duplicates (dict): {scene number: earlier scene number whose image it reuses}.
+        """
+        self.characters = characters or []
+        self.locations = locations or []
+        self.duplicates = {int(scene): int(source) for scene, source in (duplicates or {}).items()}
+        self._lookup = {}
+        for kind in self.KINDS:
+            for entity in getattr(self, kind):
+                for name in [entity["name"]] + entity["aliases"]:
+                    self._lookup[(kind, name)] = entity
+
+    @classmethod
+    def build(cls, scenes, embedder=None, similarity=0.8, duplicate_similarity=0.9, previous=None):
+        """
+        Clusters the name variants of all scenes into canonical entities and finds near-duplicate scenes.
+
+        Parameters:
+            scenes (list): The scene list (scene_store.SceneStore.scenes).
+            embedder: NgramEmbedder or SentenceTransformerEmbedder. Default is NgramEmbedder.
+            similarity (float): The embedding similarity above which two names are the same entity.
+            duplicate_similarity (float): The summary similarity above which a scene with the same location
+                and characters as an earlier one reuses its image.
+            previous (EntityIndex): An earlier index whose descriptions and reference images are kept.
+
+        Returns:
+            EntityIndex: The new index.
+        """
+        embedder = embedder or NgramEmbedder()
+        entities = {}
+        for kind in cls.KINDS:
+            mentions = {}  # Name -> scene numbers
+            for number, scene in enumerate(scenes, start=1):
+                names = scene.get(cls.FIELDS[kind]) or []
+                for name in [names] if isinstance(names, str) else names:
+                    if name.strip():
+                        mentions.setdefault(name.strip(), []).append(number)
+            entities[kind] = _cluster(mentions, embedder, similarity, match_tokens=kind == "characters")
+            if previous is not None:
+                for entity in entities[kind]:
+                    known = previous.lookup(kind, entity["name"])
+                    if known is not None:
+                        entity["description"] = known["description"]
+                        entity["reference_image"] = known.get("reference_image")
+
+        index = cls(entities["characters"], entities["locations"])
+        index.duplicates = index._find_duplicates(scenes, embedder, duplicate_similarity)
+        return index
+
+    def _find_duplicates(self, scenes, embedder, threshold):
+        # Only scenes at the same place with the same cast can share a picture; compare their summaries
+        groups = {}
+        duplicates = {}
+        for number, scene in enumerate(scenes, start=1):
+            key = (self.canonical_name("locations", scene.get("location", "")),
+                   frozenset(self.canonical_name("characters", name) for name in scene.get("characters", [])))
+            vector = embedder.embed(f"{scene.get('summary', '')} {' '.join(scene.get('events', []))}")
+            for earlier, earlier_vector in groups.get(key, []):
+                if embedder.similarity(vector, earlier_vector) >= threshold:
+                    duplicates[number] = earlier
+                    break
+            else:
+                groups.setdefault(key, []).append((number, vector))
+        return duplicates
+
+    def lookup(self, kind, name):
+        """
+        Returns the entity of a character or location name as it appears in a scene, or None.
+        """
+        return self._lookup.get((kind, name.strip()))
+
+    def canonical_name(self, kind, name):
+        """
+        Returns the canonical name of a character or location, or the name itself if it is not indexed.
+        """
+        entity = self.lookup(kind, name)
+        return entity["name"] if entity else name.strip()
+
+    def describe(self, chatbot, batch_tokens=3000):
+        """
+        Fills in missing descriptions with as few LLM requests as possible (see llm_batching.run_batched).
+
+        Parameters:
+            chatbot (Chatbot): The chatbot used for the descriptions.
+            batch_tokens (int): The maximum number of input tokens per request.
+        """
+        for kind, singular in self.KINDS.items():
+            pending = [entity for entity in getattr(self, kind) if not entity["description"]]
+            if not pending:
+                continue
+
+            def parse(data, size):
+                try:
+                    by_index = {entry["index"]: entry["description"] for entry in data["descriptions"]}
+                except (TypeError, KeyError) as e:
+                    raise ValueError(f"The description reply is not the expected JSON: {e}")
+                if sorted(by_index) != list(range(size)):
+                    raise ValueError(f"The reply describes {sorted(by_index)}, expected {size} entries")
+                return [by_index[k] for k in range(size)]
+
+            def call_batch(batch, singular=singular):
+                listing = json.dumps([{"index": k, "name": name, "context": context}
+                                      for k, (name, context) in enumerate(batch)], ensure_ascii=False)
+                # Replies that fail validation are not cached, so they are asked again next time
+                content = chatbot.generate_response(describe_prompt.format(kind=singular, entities=listing),
+                                                    validate=lambda data: parse(data, len(batch)), stage="index")
+                if content is None:
+                    raise ValueError("The description reply is not valid JSON")
+                return parse(json.loads(content), len(batch))
+
+            items = [(entity["name"], entity.get("context", "")) for entity in pending]
+            descriptions = run_batched(items, call_batch, batch_tokens, fallback=lambda item: "",
+                                       count_tokens=lambda item: len(item[0]) + len(item[1]) // 4)
+            for entity, description in zip(pending, descriptions):
+                entity["description"] = description
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"characters": self.characters, "locations": self.locations,
+                       "duplicates": {str(scene): source for scene, source in sorted(self.duplicates.items())}},
+                      f, ensure_ascii=False, indent=4)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data.get("characters"), data.get("locations"), data.get("duplicates"))
+
+
+def _cluster(mentions, embedder, similarity, match_tokens, token_similarity=0.7):
+    """
+    Groups name variants greedily, most specific (longest) names first, so full names become canonical.
+
+    A variant joins a canonical name when their embeddings are similar, or (for characters) when every
+    word of the variant closely matches a word of the canonical name ("Prof. Angel" -> "George Gammell Angell").
+    A variant whose words match several canonical names ("Professor Angell" with both "George Gammell Angell"
+    and "Mary Angell") is ambiguous and joins none of them.
+    """
+    token_vectors = {}
+
+    def embed_token(token):
+        if token not in token_vectors:
+            token_vectors[token] = embedder.embed(token)
+        return token_vectors[token]
+
+    def words_match(tokens, head_tokens):
+        return all(
+            token in head_tokens or any(
+                embedder.similarity(embed_token(token), embed_token(head)) >= token_similarity for head in head_tokens
+            )
+            for token in tokens
+        )
+
+    entities = []
+    heads = []  # (tokens, vector) of every canonical name, parallel to entities
+    for name in sorted(mentions, key=lambda name: (-len(name_tokens(name)), -len(name), name)):
+        tokens = name_tokens(name)
+        vector = embedder.embed(" ".join(sorted(tokens)) or name)
+        scores = [embedder.similarity(vector, head_vector) for _, head_vector in heads]
+        word_matches = [
+            k for k, (head_tokens, _) in enumerate(heads)
+            if match_tokens and tokens and scores[k] < 1.0 and words_match(tokens, head_tokens)
+        ]
+        candidates = []  # (score, embedding score, k)
+        for k, score in enumerate(scores):
+            if k in word_matches:
+                if len(word_matches) > 1:
+                    continue
+                candidates.append((1.0 if tokens <= heads[k][0] else max(score, similarity), score, k))
+            elif score >= similarity:
+                candidates.append((score, score, k))
+        # Highest score, ties broken by the embedding score, then by the earlier (more specific) name
+        best = max(candidates, key=lambda candidate: (candidate[0], candidate[1], -candidate[2]))[2] \
+            if candidates else None
+        if best is None:
+            heads.append((tokens, vector))
+            entities.append({"name": name, "aliases": [], "description": "", "scenes": [],
+                             "reference_image": None})
+            best = len(entities) - 1
+        else:
+            entities[best]["aliases"].append(name)
+        entities[best]["scenes"] = sorted(set(entities[best]["scenes"]) | set(mentions[name]))
+    return entities
+
+
+def add_context(index, scenes, max_chars=600):
+    """
+    Attaches snippets of the scenes mentioning each entity ("context"), used when describing it.
+    """
+    for kind in EntityIndex.KINDS:
+        for entity in getattr(index, kind):
+            snippets = [scenes[number - 1].get("summary", "") for number in entity["scenes"]]
+            entity["context"] = " ".join(snippets)[:max_chars]
+
+
+def generate_reference_images(index, visual_style, directory, cache=None):
+    """
+    Generates one portrait per character (once; existing ones are kept) and records it as "reference_image".
+    """
+    from Gen_img import generate_image
+
+    for entity in index.characters:
+        if entity.get("reference_image") and os.path.exists(entity["reference_image"]):
+            continue
+        slug = re.sub(r"\W+", "_", entity["name"]).strip("_").lower()
+        path = os.path.join(directory, f"{slug}.png")
+        prompt = (
+            f"Character portrait in {visual_style['art_style']} style, {visual_style['color_palette']} colors, "
+            f"set in {visual_style['time_period']}: {entity['name']}. {entity['description']}"
+        )
+        generate_image(prompt, path, cache=cache)
+        entity["reference_image"] = path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the character/location index of a novel's scenes.")
+    parser.add_argument("--novel", default="The_Call_of_Cthulhu")
+    parser.add_argument("--config", default="config.json")
+    parser.add_argument("--describe", action="store_true", help="Write missing descriptions with the chat model")
+    parser.add_argument("--portraits", action="store_true", help="Generate a reference portrait per character")
+    args = parser.parse_args()
+
+    with open(args.config, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    settings = config.get("entity_index", {})
+
+    index_path = os.path.join("scripts", args.novel, "entities.json")
+    with open_novel(args.novel) as store:
+        scenes = store.scenes(args.novel)
+
+    previous = EntityIndex.load(index_path) if os.path.exists(index_path) else None
+    index = EntityIndex.build(
+        scenes,
+        embedder=load_embedder(settings.get("embedding_model")),
+        similarity=settings.get("similarity", 0.8),
+        duplicate_similarity=settings.get("duplicate_similarity", 0.9),
+        previous=previous,
+    )
+    add_context(index, scenes)
+
+    if args.describe:
+        import openai
+        from response_cache import load_cache
+        from Scene_Segmentation import Chatbot
+
+        openai.api_key = config["KEY"]["OPENAI_API_KEY"]
+        index.describe(Chatbot(system_prompt="You are an art director. Return a structured JSON object.",
+                               cache=load_cache(config)))
+    if args.portraits:
+        generate_reference_images(index, config["Visual_Style"], os.path.join("images", args.novel, "characters"))
+
+    index.save(index_path)
+    print(f"✅ {len(index.characters)} characters, {len(index.locations)} locations, "
+          f"{len(index.duplicates)} scene(s) reuse an image: {index_path}")
@@ -0,0 +1,348 @@
+import cProfile
+import html
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+# List prices in USD: per 1M prompt/completion tokens, per image, per 1M synthesized characters.
+# A model name matches the longest key it starts with ("gpt-4-turbo-2024-04-09" -> "gpt-4-turbo").
+DEFAULT_PRICES = {
+    "gpt-4-turbo": {"prompt_tokens": 10.0, "completion_tokens": 30.0},
+    "gpt-4o": {"prompt_tokens": 2.5, "completion_tokens": 10.0},
+    "gpt-4o-mini": {"prompt_tokens": 0.15, "completion_tokens": 0.6},
+    "gpt-3.5-turbo": {"prompt_tokens": 0.5, "completion_tokens": 1.5},
+    "dall-e-3": {"images": 0.04},
+    "tts-1": {"characters": 15.0},
+    "tts-1-hd": {"characters": 30.0},
+}
+_PER_MILLION = {"prompt_tokens", "completion_tokens", "characters"}
+
+# Numeric fields summed per stage and per scene in the report
+_TOTALS = ["prompt_tokens", "completion_tokens", "images", "characters", "bytes"]
+
+_recorder = None
+_local = threading.local()
+
+
+class Recorder:
+    def __init__(self, prices=None):
+        """
+        Collects one record per instrumented call (a "span") from every thread of a run.
+
+        Parameters:
+            prices (dict): Overrides of DEFAULT_PRICES, keyed by model name.
+        """
+        self.prices = dict(DEFAULT_PRICES, **(prices or {}))
+        self.spans = []
+        self.started = time.time()
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        with self._lock:
+            self.spans.append(record)
+
+    def merge(self, spans, started):
+        """
+        Adds the spans recorded by a Recorder in another process (e.g. a visual_novel.py --processes worker).
+
+        Parameters:
+            spans (list): That recorder's spans.
+            started (float): That recorder's `started` time, to shift its spans onto this timeline.
+        """
+        offset = started - self.started
+        with self._lock:
+            self.spans.extend(dict(record, start=record["start"] + offset) for record in spans)
+
+    def cost(self, record):
+        """
+        Returns the list-price cost of one span in USD (0 for cache hits and unpriced models).
+        """
+        model = record.get("model")
+        if not model:
+            return 0.0
+        matches = [name for name in self.prices if model.startswith(name)]
+        if not matches:
+            return 0.0
+        prices = self.prices[max(matches, key=len)]
+        return sum(
+            record.get(field, 0) * price / (1e6 if field in _PER_MILLION else 1)
+            for field, price in prices.items()
+        )
+
+    def summary(self):
+        """
+        Aggregates the spans per stage and per scene.
+
+        Returns:
+            dict: {"run": totals, "stages": {stage: latency percentiles and totals},
+                   "scenes": {scene: seconds per stage, cost and retries}}
+        """
+        with self._lock:
+            spans = list(self.spans)
+
+        stages = {}
+        for record in spans:
+            stages.setdefault(record["stage"], []).append(record)
+        stage_summary = {}
+        for stage, records in sorted(stages.items()):
+            durations = sorted(record["duration"] for record in records)
+            entry = {
+                "calls": len(records),
+                "errors": sum(1 for record in records if record.get("error")),
+                "cached": sum(1 for record in records if record.get("cached")),
+                "retries": sum(1 for record in records if record.get("attempt")),
+                "seconds": sum(durations),
+                "p50": percentile(durations, 50),
+                "p90": percentile(durations, 90),
+                "p99": percentile(durations, 99),
+                "max": durations[-1],
+                "cost": sum(self.cost(record) for record in records),
+            }
+            for field in _TOTALS:
+                entry[field] = sum(record.get(field, 0) for record in records)
+            exit_codes = [record["exit_code"] for record in records if record.get("exit_code")]
+            if exit_codes:
+                entry["failed_exit_codes"] = sorted(set(exit_codes))
+            stage_summary[stage] = entry
+
+        # Scenes of a multi-novel run (visual_novel.py) are told apart by their novel
+        several_novels = len({record.get("novel") for record in spans}) > 1
+        scenes = {}
+        for record in spans:
+            if record.get("scene") is None:
+                continue
+            key = (record.get("novel") or "", record["scene"]) if several_novels else ("", record["scene"])
+            scene = scenes.setdefault(key, {"seconds": 0.0, "cost": 0.0, "retries": 0, "stages": {}})
+            if record.get("attempt"):
+                scene["retries"] += 1
+            scene["seconds"] += record["duration"]
+            scene["cost"] += self.cost(record)
+            scene["stages"][record["stage"]] = scene["stages"].get(record["stage"], 0.0) + record["duration"]
+
+        return {
+            "run": {
+                "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+                "wall_seconds": time.perf_counter() - self._origin,
+                "spans": len(spans),
+                "cost": sum(entry["cost"] for entry in stage_summary.values()),
+            },
+            "stages": stage_summary,
+            "scenes": {f"{novel} #{scene}" if novel else str(scene): scenes[(novel, scene)]
+                       for novel, scene in sorted(scenes)},
+        }
+
+    def write_report(self, directory):
+        """
+        Writes report.json (summary and raw spans), report.html and trace.json to a directory.
+
+        trace.json uses the Chrome trace event format; open it in chrome://tracing or ui.perfetto.dev
+        to see how the calls of every worker thread overlap.
+
+        Returns:
+            list: The paths that were written.
+        """
+        os.makedirs(directory, exist_ok=True)
+        summary = self.summary()
+        with self._lock:
+            spans = list(self.spans)
+
+        json_path = os.path.join(directory, "report.json")
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(dict(summary, spans=spans), f, ensure_ascii=False, indent=2, default=str)
+
+        html_path = os.path.join(directory, "report.html")
+        with open(html_path, "w", encoding="utf-8") as f:
+            f.write(render_html(summary))
+
+        trace_path = os.path.join(directory, "trace.json")
+        events = [
+            {
+                "name": record["stage"], "ph": "X", "pid": record.get("process", 0), "tid": record["thread"],
+                "ts": record["start"] * 1e6, "dur": record["duration"] * 1e6,
+                "args": {key: value for key, value in record.items()
+                         if key not in ("stage", "thread", "start", "duration")},
+            }
+            for record in spans
+        ]
+        with open(trace_path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events}, f, default=str)
+
+        return [json_path, html_path, trace_path]
+
+
+def percentile(sorted_values, q):
+    """
+    Returns the q-th percentile of an ascending list, interpolating between the closest ranks.
+    """
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def render_html(summary, slowest=20):
+    """
+    Renders the summary as a self-contained HTML page: a stage table and the slowest scenes.
+    """
+    def table(headers, rows):
+        head = "".join(f"<th>{html.escape(str(header))}</th>" for header in headers)
+        body = "".join("<tr>" + "".join(f"<td>{html.escape(str(cell))}</td>" for cell in row) + "</tr>"
+                       for row in rows)
+        return f"<table><tr>{head}</tr>{body}</table>"
+
+    run = summary["run"]
+    stage_rows = [
+        [stage, entry["calls"], entry["errors"], entry["cached"], entry["retries"], f"{entry['seconds']:.2f}",
+         f"{entry['p50']:.3f}", f"{entry['p90']:.3f}", f"{entry['p99']:.3f}", f"{entry['max']:.3f}",
+         entry["prompt_tokens"] + entry["completion_tokens"], entry["bytes"], f"{entry['cost']:.4f}"]
+        for stage, entry in summary["stages"].items()
+    ]
+    scenes = sorted(summary["scenes"].items(), key=lambda item: item[1]["seconds"], reverse=True)[:slowest]
+    scene_rows = [
+        [scene, f"{entry['seconds']:.2f}", f"{entry['cost']:.4f}", entry["retries"],
+         ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in sorted(entry["stages"].items()))]
+        for scene, entry in scenes
+    ]
+    return (
+        "<!DOCTYPE html><html><head><meta charset='utf-8'><title>Run report</title>"
+        "<style>body{font-family:sans-serif;margin:2em}table{border-collapse:collapse;margin-bottom:2em}"
+        "th,td{border:1px solid #ccc;padding:4px 8px;text-align:right}th{background:#eee}</style></head><body>"
+        f"<h1>Run report</h1><p>Started {html.escape(run['started'])}, {run['wall_seconds']:.1f}s wall time, "
+        f"{run['spans']} calls, estimated cost ${run['cost']:.4f}</p>"
+        "<h2>Stages</h2>"
+        + table(["stage", "calls", "errors", "cached", "retries", "total s", "p50 s", "p90 s", "p99 s", "max s",
+                 "tokens", "bytes", "cost $"], stage_rows)
+        + f"<h2>Slowest scenes (top {slowest})</h2>"
+        + table(["scene", "total s", "cost $", "retries", "seconds per stage"], scene_rows)
+        + "</body></html>"
+    )
+
+
+# ---------- Recording API (no-ops unless enable() was called) ----------
+
+def enable(prices=None):
+    """
+    Starts recording spans process-wide and returns the Recorder.
+    """
+    global _recorder
+    _recorder = Recorder(prices)
+    return _recorder
+
+
+def disable():
+    """
+    Stops recording and returns the Recorder that was active, if any.
+    """
+    global _recorder
+    recorder, _recorder = _recorder, None
+    return recorder
+
+
+def _stack():
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+        _local.context = {}
+    return _local.stack
+
+
+@contextmanager
+def context(**attrs):
+    """
+    Attaches attributes (e.g. scene=3) to every span opened by this thread inside the block.
+    """
+    _stack()
+    previous = _local.context
+    _local.context = dict(previous, **attrs)
+    try:
+        yield
+    finally:
+        _local.context = previous
+
+
+def current_context():
+    """
+    Returns the attributes set by context() in this thread, to carry them over into worker threads.
+    """
+    _stack()
+    return dict(_local.context)
+
+
+@contextmanager
+def span(stage, **attrs):
+    """
+    Times the block as one call of `stage` and records it, including the error it raised.
+    """
+    recorder = _recorder
+    if recorder is None:
+        yield
+        return
+    stack = _stack()
+    record = dict(_local.context, stage=stage, thread=threading.get_ident(), **attrs)
+    stack.append(record)
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        record["error"] = f"{type(e).__name__}: {e}"[:300]
+        raise
+    finally:
+        record["start"] = start - recorder._origin
+        record["duration"] = time.perf_counter() - start
+        stack.pop()
+        recorder.add(record)
+
+
+def instrumented(stage):
+    """
+    Decorator that records every call of the function as a span of `stage`.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _recorder is None:
+                return fn(*args, **kwargs)
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def annotate(**attrs):
+    """
+    Sets attributes (model, exit_code, cached, ...) on the innermost open span of this thread.
+    """
+    if _recorder is not None and _stack():
+        _local.stack[-1].update(attrs)
+
+
+def count(**values):
+    """
+    Adds to numeric attributes (tokens, bytes, ...) of the innermost open span of this thread.
+    """
+    if _recorder is not None and _stack():
+        record = _local.stack[-1]
+        for key, value in values.items():
+            record[key] = record.get(key, 0) + value
+
+
+@contextmanager
+def profile(path):
+    """
+    Runs the block under cProfile and dumps the statistics to `path` (inspect with pstats or snakeviz).
+
+    cProfile only sees the calling thread; the per-call spans above cover the worker threads.
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        profiler.dump_stats(path)
@@ -0,0 +1,133 @@
+import threading
+
+import instrumentation
+from rate_limiter import estimate_tokens
+
+
+class TruncatedResponse(Exception):
+    """
+    Raised when the model stopped because it ran out of output tokens (finish_reason == "length").
+    """
+
+
+class RequestStats:
+    def __init__(self):
+        """
+        Thread-safe counters of chat-completion requests and the tokens they consumed.
+        """
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.truncated = 0
+        self._lock = threading.Lock()
+
+    def record(self, response):
+        """
+        Adds one chat-completion response (its `usage` and `finish_reason`) to the counters.
+        """
+        usage = getattr(response, "usage", None)
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        # Also attribute the tokens to the instrumented call that is waiting for this response
+        instrumentation.count(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        if getattr(response, "model", None):
+            instrumentation.annotate(model=response.model)
+        with self._lock:
+            self.requests += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            if response.choices[0].finish_reason == "length":
+                self.truncated += 1
+
+    def summary(self, items):
+        """
+        Returns the counters normalized per input item (chunk or scene).
+
+        Parameters:
+            items (int): The number of inputs that were processed.
+
+        Returns:
+            dict: Requests, tokens and truncations, in total and per item.
+        """
+        items = max(items, 1)
+        total_tokens = self.prompt_tokens + self.completion_tokens
+        return {
+            "items": items,
+            "requests": self.requests,
+            "truncated": self.truncated,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "requests_per_item": self.requests / items,
+            "tokens_per_item": total_tokens / items,
+        }
+
+
+def iter_batches(items, token_budget, count_tokens=estimate_tokens, max_items=None):
+    """
+    Groups items into batches whose combined size stays within a token budget.
+
+    Works on any iterable (including generators), so batches can be formed while streaming.
+    An item larger than the budget on its own becomes a single-item batch.
+
+    Parameters:
+        items (iterable): The inputs (strings) to group.
+        token_budget (int): The maximum number of input tokens per batch.
+        count_tokens (callable): Measures an item in tokens. Default is rate_limiter.estimate_tokens.
+        max_items (int): Optional maximum number of items per batch.
+
+    Returns:
+        generator: Lists of (index, item) pairs, in input order.
+    """
+    batch = []
+    total = 0
+    for i, item in enumerate(items):
+        tokens = count_tokens(item)
+        if batch and (total + tokens > token_budget or (max_items and len(batch) >= max_items)):
+            yield batch
+            batch, total = [], 0
+        batch.append((i, item))
+        total += tokens
+    if batch:
+        yield batch
+
+
+def run_batched(items, call_batch, token_budget, fallback=None, count_tokens=estimate_tokens):
+    """
+    Processes items in token-budgeted batches, halving a batch whenever its reply is unusable.
+
+    Parameters:
+        items (list): The inputs.
+        call_batch (callable): Takes a list of inputs and returns one output per input. It raises
+            TruncatedResponse when the reply was cut off and ValueError when it cannot be split back
+            into one output per input.
+        token_budget (int): The maximum number of input tokens per batch.
+        fallback (callable): Processes a single input on its own (e.g. with the unbatched prompt) when
+            even a one-item batch fails. Default re-raises the error.
+        count_tokens (callable): Measures an item in tokens. Default is rate_limiter.estimate_tokens.
+
+    Returns:
+        list: One output per input, in input order.
+    """
+    results = [None] * len(items)
+
+    def run(indices):
+        try:
+            outputs = call_batch([items[i] for i in indices])
+        except (TruncatedResponse, ValueError) as e:
+            if len(indices) == 1:
+                if fallback is None:
+                    raise
+                results[indices[0]] = fallback(items[indices[0]])
+                return
+            # Smaller batches need fewer output tokens and are easier to answer completely
+            middle = len(indices) // 2
+            print(f"✂️ Batch of {len(indices)} failed ({e}), retrying as {middle} + {len(indices) - middle}")
+            run(indices[:middle])
+            run(indices[middle:])
+            return
+        for i, output in zip(indices, outputs):
+            results[i] = output
+
+    for batch in iter_batches(items, token_budget, count_tokens):
+        run([i for i, _ in batch])
+    return results
@@ -0,0 +1,51 @@
+import os
+import subprocess
+
+import instrumentation
+
+
+def available_cores():
+    """
+    Returns the number of CPU cores this process may run on.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def run_ffmpeg(stage, cmd, output_file=None, **kwargs):
+    """
+    Runs an FFmpeg/ffprobe command (check=True) as an instrumented call that records its exit code
+    and the size of the file it produced.
+
+    Parameters:
+        stage (str): The instrumentation stage, e.g. "ffmpeg.clip".
+        cmd (list): The command line.
+        output_file (str): The file the command writes, if any.
+        **kwargs: Passed on to subprocess.run, e.g. input= and capture_output= for piped audio.
+
+    Returns:
+        subprocess.CompletedProcess: The finished process.
+    """
+    with instrumentation.span(stage):
+        try:
+            result = subprocess.run(cmd, check=True, **kwargs)
+        except subprocess.CalledProcessError as e:
+            instrumentation.annotate(exit_code=e.returncode)
+            raise
+        instrumentation.annotate(exit_code=result.returncode)
+        if output_file and os.path.exists(output_file):
+            instrumentation.annotate(bytes=os.path.getsize(output_file))
+        return result
+
+
+def probe_duration(media_file):
+    """
+    Returns the duration of a media file in seconds, as reported by ffprobe.
+    """
+    result = run_ffmpeg(
+        "ffmpeg.probe",
+        ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=nw=1:nk=1", media_file],
+        capture_output=True, text=True
+    )
+    return float(result.stdout.strip())
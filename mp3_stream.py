@@ -0,0 +1,155 @@
+import os
+import struct
+
+# Layer III bitrates in kbps by bitrate index, for MPEG-1 and for MPEG-2/2.5
+_BITRATES = {
+    1: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+# Sample rates by version bits (3 = MPEG-1, 2 = MPEG-2, 0 = MPEG-2.5) and sample rate index
+_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+# ID3v2.3 tag holding only a TLEN frame (duration in ms), written as a fixed-size placeholder and patched on close
+_TLEN_DIGITS = 10
+_TLEN_FRAME_SIZE = 1 + _TLEN_DIGITS  # Text encoding byte + digits
+_TAG_SIZE = 10 + _TLEN_FRAME_SIZE  # Frame header + frame
+
+
+def _synchsafe(value):
+    return bytes([(value >> 21) & 0x7F, (value >> 14) & 0x7F, (value >> 7) & 0x7F, value & 0x7F])
+
+
+def _unsynchsafe(data):
+    return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+
+def _frame_info(data, offset):
+    """
+    Returns (frame length, duration in seconds) of the Layer III frame header at `offset`, or None.
+    """
+    if offset + 4 > len(data) or data[offset] != 0xFF or data[offset + 1] & 0xE0 != 0xE0:
+        return None
+    version = (data[offset + 1] >> 3) & 0x03
+    layer = (data[offset + 1] >> 1) & 0x03
+    bitrate_index = data[offset + 2] >> 4
+    rate_index = (data[offset + 2] >> 2) & 0x03
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None  # Reserved values, free format, or not Layer III
+    padding = (data[offset + 2] >> 1) & 0x01
+    bitrate = _BITRATES[1 if version == 3 else 2][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][rate_index]
+    samples = 1152 if version == 3 else 576
+    length = samples // 8 * bitrate // sample_rate + padding
+    return length, samples / sample_rate
+
+
+def audio_frames(data):
+    """
+    Extracts the audio frames of an MP3 file, dropping ID3 tags and the Xing/Info/VBRI header frame.
+
+    The header frame stores the length of its own file; left in a concatenation it would make players
+    and ffprobe report the duration of the first segment only.
+
+    Parameters:
+        data (bytes): The MP3 file.
+
+    Returns:
+        tuple: (frame bytes, duration in seconds).
+    """
+    offset = 0
+    if data[:3] == b"ID3" and len(data) >= 10:
+        offset = 10 + _unsynchsafe(data[6:10]) + (10 if data[5] & 0x10 else 0)  # Header, body, footer
+
+    pieces = []
+    duration = 0.0
+    first = True
+    while offset < len(data):
+        info = _frame_info(data, offset)
+        if info is None:
+            offset = data.find(b"\xff", offset + 1)  # Resynchronize on the next candidate header
+            if offset < 0:
+                break
+            continue
+        length, seconds = info
+        frame = data[offset:offset + length]
+        if len(frame) < length:
+            break  # Truncated last frame
+        if not (first and any(marker in frame[:64] for marker in (b"Xing", b"Info", b"VBRI"))):
+            pieces.append(frame)
+            duration += seconds
+        first = False
+        offset += length
+    return b"".join(pieces), duration
+
+
+def read_duration(path):
+    """
+    Returns the duration in seconds recorded in an MP3's ID3 TLEN frame, or None if it has none.
+    """
+    try:
+        with open(path, "rb") as f:
+            header = f.read(10)
+            if len(header) < 10 or header[:3] != b"ID3":
+                return None
+            body = f.read(_unsynchsafe(header[6:10]))
+    except OSError:
+        return None
+    version = header[3]
+    offset = 0
+    while offset + 10 <= len(body) and body[offset] != 0:
+        frame_id = body[offset:offset + 4]
+        size_bytes = body[offset + 4:offset + 8]
+        size = _unsynchsafe(size_bytes) if version == 4 else struct.unpack(">I", size_bytes)[0]
+        if frame_id == b"TLEN":
+            text = body[offset + 11:offset + 10 + size].decode("latin-1").strip("\x00 ")
+            return int(text) / 1000 if text.isdigit() else None
+        offset += 10 + size
+    return None
+
+
+class Mp3Writer:
+    def __init__(self, path):
+        """
+        Writes MP3 segments to a file as they arrive, so playback can start before the last one is done.
+
+        The file starts with an ID3 tag whose TLEN frame is filled in with the total duration on close,
+        which lets readers (see read_duration) skip probing the file.
+
+        Parameters:
+            path (str): The MP3 file to write.
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.duration = 0.0
+        self.bytes = 0
+        self._file = open(path, "wb")
+        self._file.write(self._tag())
+
+    def _tag(self):
+        milliseconds = str(round(self.duration * 1000)).zfill(_TLEN_DIGITS)[-_TLEN_DIGITS:]
+        frame = b"TLEN" + struct.pack(">I", _TLEN_FRAME_SIZE) + b"\x00\x00" + b"\x00" + milliseconds.encode("ascii")
+        return b"ID3\x03\x00\x00" + _synchsafe(_TAG_SIZE) + frame
+
+    def append(self, data):
+        """
+        Appends the audio frames of one MP3 segment and returns its duration in seconds.
+        """
+        frames, seconds = audio_frames(data)
+        self._file.write(frames)
+        self._file.flush()
+        self.duration += seconds
+        self.bytes += len(frames)
+        return seconds
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._file.seek(0)
+        self._file.write(self._tag())
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,744 @@
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import instrumentation
+
+STAGES = ["segment", "index", "image", "voice", "video"]
+
+
+def file_digest(path):
+    """
+    Returns the SHA-256 hex digest of a file's content, or None if it does not exist.
+    """
+    if not os.path.exists(path):
+        return None
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def fingerprint(*parts):
+    """
+    Hashes the inputs of an artifact (parameters, text, upstream digests) into one fingerprint.
+    """
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def write_json_atomic(path, data):
+    # Write to a temporary file first so a crash never leaves a truncated JSON file behind
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".tmp-")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=4)
+    os.replace(tmp_path, path)
+
+
+def run_pipelined(count, make_image, make_voice, encode_clip, image_workers=4, voice_workers=4, encode_workers=2):
+    """
+    Generates scene media and encodes clips as a producer/consumer pipeline.
+
+    Images and voices are produced by two worker pools; as soon as both artifacts of scene N are
+    ready, its clip is queued on the encoder pool while generation of the following scenes goes on.
+    A scene whose image or voice fails is skipped; the other scenes still finish.
+
+    Parameters:
+        count (int): The number of scenes (numbered from 1).
+        make_image (callable): make_image(i) builds the image of scene i and returns its digest.
+        make_voice (callable): make_voice(i) builds the voice of scene i and returns its digest.
+        encode_clip (callable): encode_clip(i, image_digest, voice_digest) encodes scene i and returns its digest.
+        image_workers (int): Concurrent image requests. Default is 4.
+        voice_workers (int): Concurrent TTS requests. Default is 4.
+        encode_workers (int): Concurrent FFmpeg encodes. Default is 2.
+
+    Returns:
+        tuple: (clip digests in scene order, {"time_to_first_clip": s, "total": s} timings).
+
+    Raises:
+        RuntimeError: If any scene failed, after all other scenes have been processed.
+    """
+    start = time.perf_counter()
+    timings = {"time_to_first_clip": None, "total": None}
+    lock = threading.Lock()
+    media = {i: {} for i in range(1, count + 1)}  # Scene -> {"image": digest, "voice": digest}
+    clip_futures = {}
+    errors = {}
+
+    def encoded(future):
+        if future.exception() is None:
+            with lock:
+                if timings["time_to_first_clip"] is None:
+                    timings["time_to_first_clip"] = time.perf_counter() - start
+
+    def produced(i, kind, future):
+        with lock:
+            if future.exception() is not None:
+                errors.setdefault(i, future.exception())
+                return
+            media[i][kind] = future.result()
+            if len(media[i]) < 2 or i in errors:
+                return
+            # Both inputs are ready: scene i is encoded while later scenes are still generating
+            clip_futures[i] = encode_pool.submit(encode_clip, i, media[i]["image"], media[i]["voice"])
+        clip_futures[i].add_done_callback(encoded)
+
+    encode_pool = ThreadPoolExecutor(encode_workers)
+    try:
+        with ThreadPoolExecutor(image_workers) as image_pool, ThreadPoolExecutor(voice_workers) as voice_pool:
+            for i in range(1, count + 1):
+                for kind, pool, make in (("image", image_pool, make_image), ("voice", voice_pool, make_voice)):
+                    pool.submit(make, i).add_done_callback(lambda f, i=i, kind=kind: produced(i, kind, f))
+        # Leaving the block joined the producer threads, so every finished scene has queued its clip
+        wait(list(clip_futures.values()))
+    finally:
+        encode_pool.shutdown(wait=True)
+
+    clip_digests = []
+    for i in range(1, count + 1):
+        future = clip_futures.get(i)
+        if future is not None and future.exception() is not None:
+            errors.setdefault(i, future.exception())
+        clip_digests.append(future.result() if i not in errors else None)
+    timings["total"] = time.perf_counter() - start
+
+    if errors:
+        raise RuntimeError(f"{len(errors)} scene(s) failed: "
+                           + ", ".join(f"{i} ({errors[i]})" for i in sorted(errors)))
+    return clip_digests, timings
+
+
+class NovelPaths:
+    def __init__(self, novel, input_path=None):
+        """
+        The artifact locations of one novel, following the repository's directory layout.
+
+        Parameters:
+            novel (str): The novel name, e.g. "The_Call_of_Cthulhu".
+            input_path (str): The novel text file. Default is Input/<novel>.txt.
+        """
+        self.novel = novel
+        self.input = input_path or os.path.join("Input", f"{novel}.txt")
+        self.scenes = os.path.join("scripts", novel, "scenes_1.json")  # Imported into the scene store once
+        self.entities = os.path.join("scripts", novel, "entities.json")
+        self.characters = os.path.join("images", novel, "characters")
+        self.manifest = os.path.join("scripts", novel, "manifest.json")
+        self.concat_list = os.path.join("videos", novel, "video_list.txt")
+        self.final = os.path.join("Output", novel, "final_output.mp4")
+
+    def image(self, i):
+        return os.path.join("images", self.novel, f"generated_image_{i}.png")
+
+    def voice(self, i):
+        return os.path.join("voices", self.novel, f"MP3_{i}.mp3")
+
+    def clip(self, i):
+        return os.path.join("videos", self.novel, f"temp_video_{i}.mp4")
+
+
+class Manifest:
+    def __init__(self, path):
+        """
+        Records, for every built artifact, the fingerprint of the inputs it was built from and
+        the digest of the file that was produced. Saved after every build so a crash loses at most
+        the artifact that was in progress.
+
+        Parameters:
+            path (str): The manifest JSON file.
+        """
+        self.path = path
+        self.entries = {}
+        self._lock = threading.Lock()  # Artifacts may be recorded from several worker threads
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    def _stamp(self, path):
+        stat = os.stat(path)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def digest(self, path):
+        """
+        Returns the content digest of an artifact, reusing the recorded one while the file is untouched.
+        """
+        entry = self.entries.get(path)
+        if not os.path.exists(path):
+            return None
+        if entry and entry.get("stamp") == self._stamp(path):
+            return entry["digest"]
+        return file_digest(path)
+
+    def is_fresh(self, path, inputs, allow_edits=False):
+        """
+        Returns True if `path` exists, is unmodified and was built from the same inputs.
+        With `allow_edits`, a file that was edited by hand since it was built also counts as fresh.
+        """
+        entry = self.entries.get(path)
+        if entry is None or entry.get("inputs") != inputs or not os.path.exists(path):
+            return False
+        return allow_edits or self.digest(path) == entry["digest"]
+
+    def record(self, path, inputs):
+        entry = {"inputs": inputs, "digest": file_digest(path), "stamp": self._stamp(path)}
+        with self._lock:
+            self.entries[path] = entry
+            write_json_atomic(self.path, self.entries)
+
+
+class Pipeline:
+    def __init__(self, novel, config, input_path=None, voice_engine="gtts", force=False, dry_run=False,
+                 max_workers=None, single_pass=False, store_path=None):
+        """
+        An incremental runner for the split → segment → index → image/voice → video pipeline of one novel.
+
+        Scenes live in the scene store (scene_store.py), which also tracks the status of every scene's
+        image, MP3 and clip. Each scene's artifacts form a small dependency graph.
+        An artifact is rebuilt only when the fingerprint of its inputs changed or the file is missing,
+        so re-running after a crash resumes where it stopped and editing one scene's `original_text`
+        only rebuilds that scene's MP3, its clip and the final video.
+
+        Parameters:
+            novel (str): The novel name, used to derive all paths.
+            config (dict): The parsed config.json.
+            input_path (str): The novel text file. Default is Input/<novel>.txt.
+            voice_engine (str): A tts_backends.BACKENDS name: "gtts", "openai" or "espeak" (local, offline).
+                Default is "gtts".
+            force (bool): Rebuild every artifact regardless of the manifest.
+            dry_run (bool): Only report what would be rebuilt.
+            max_workers (int): The number of parallel FFmpeg encoders. Default is the number of available cores.
+            single_pass (bool): Encode the final video directly from the images and audio in one FFmpeg run
+                instead of encoding per-scene clips and concatenating them.
+            store_path (str): The scene store database. Default is scripts/scenes.db.
+        """
+        self.paths = NovelPaths(novel, input_path)
+        self.config = config
+        self.voice_engine = voice_engine
+        self.force = force
+        self.dry_run = dry_run
+        self.max_workers = max_workers
+        self.single_pass = single_pass
+        self.store_path = store_path
+        self.manifest = Manifest(self.paths.manifest)
+        self.built = []  # Artifacts rebuilt during this run
+        self.scenes = []
+        self.entity_index = None
+        self._cache = None
+        self._store = None
+        self._tts = None
+        self._image_locks = {}
+        self._locks_guard = threading.Lock()
+        self._artifacts = {}  # Store rows per kind, loaded when an up-to-date artifact is checked
+
+    @property
+    def cache(self):
+        if self._cache is None:
+            from response_cache import load_cache
+
+            self._cache = load_cache(self.config) or False
+        return self._cache or None
+
+    @property
+    def store(self):
+        if self._store is None:
+            from scene_store import DEFAULT_PATH, SceneStore
+
+            # A dry run works on an in-memory copy, so importing scenes_1.json writes nothing
+            self._store = SceneStore(self.store_path or DEFAULT_PATH, read_only=self.dry_run)
+        return self._store
+
+    def _step(self, path, inputs, build, scene=None, allow_edits=False, kind=None):
+        """
+        Builds `path` with `build()` unless it is up to date, and returns its content digest.
+
+        `scene` is attached to the instrumentation records of the build. With `allow_edits`, hand edits
+        of the artifact are kept (and flow downstream through its digest) until its inputs change.
+        With `kind` ("image", "voice", "clip"), the outcome is recorded in the scene store; a voice
+        build returns the audio duration, which is stored with it.
+        """
+        if not self.force and self.manifest.is_fresh(path, inputs, allow_edits):
+            if kind is not None:
+                self._confirm(kind, scene, path)
+            return self.manifest.digest(path)
+        if self.dry_run:
+            print(f"🔁 Would rebuild {path}")
+            self.built.append(path)
+            return inputs  # Stand-in digest so downstream artifacts are reported as stale too
+        print(f"🔨 Building {path}")
+        try:
+            # Builds may run in pool threads, which do not inherit the caller's novel=... context
+            with instrumentation.context(novel=self.paths.novel, scene=scene):
+                result = build()
+        except Exception as e:
+            if kind is not None:
+                self.store.set_artifact(self.paths.novel, scene, kind, path, status="failed", error=str(e)[:300])
+            raise
+        self.manifest.record(path, inputs)
+        self.built.append(path)
+        digest = self.manifest.digest(path)
+        if kind is not None:
+            duration = result if kind == "voice" else None
+            self.store.set_artifact(self.paths.novel, scene, kind, path, digest=digest, duration=duration)
+        return digest
+
+    def _confirm(self, kind, scene, path):
+        """
+        Marks the store row of an up-to-date artifact done again when editing its scene marked it stale,
+        but the edit did not touch this artifact's inputs (e.g. only the transition_reason changed).
+        """
+        if self.dry_run:
+            return
+        with self._locks_guard:
+            if kind not in self._artifacts:
+                self._artifacts[kind] = self.store.artifacts(self.paths.novel, kind)
+            row = self._artifacts[kind].get(scene)
+            if row is None or row["status"] != "stale":
+                return
+            row["status"] = "done"
+        self.store.set_artifact(self.paths.novel, scene, kind, path, digest=row["digest"], duration=row["duration"])
+
+    def _existing_digest(self, path):
+        # Used for artifacts of stages that were not requested in this run
+        return self.manifest.digest(path)
+
+    # ---------- Stages ----------
+
+    def segment(self):
+        """
+        Splits the novel and segments every chunk into scenes, unless the stored scenes are up to date.
+        Scenes edited by hand (scene_store.py export/import) are kept as long as the novel text and
+        settings do not change.
+
+        Returns:
+            str: The digest of the scene list.
+        """
+        chunk_size, chunk_overlap = self._splitter_settings()
+        inputs = self._segment_inputs()
+
+        def build():
+            import openai
+            from Text_Splitter import load_and_split_text
+            from Scene_Segmentation import Chatbot, segment_novel
+
+            openai.api_key = self.config["KEY"]["OPENAI_API_KEY"]
+            chatbot = Chatbot(
+                system_prompt="You are a screenplay expert. Return a structured JSON array.",
+                cache=self.cache,
+            )
+            chunks = load_and_split_text(self.paths.input, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+            settings = self.config.get("segmentation", {})
+            # All chunks are segmented concurrently and boundary-spanning scenes are stitched together
+            scenes = segment_novel(
+                chatbot,
+                chunks,
+                max_workers=settings.get("max_workers", 8),
+                requests_per_minute=settings.get("requests_per_minute"),
+                tokens_per_minute=settings.get("tokens_per_minute"),
+                batch_tokens=settings.get("batch_tokens"),
+            )
+            return self.store.put_scenes(self.paths.novel, scenes, self.paths.input, inputs=inputs)
+
+        stored = self.store.novel(self.paths.novel)
+        if not self.force and stored is not None and stored["inputs"] == inputs:
+            return stored["digest"]
+        label = f"scenes of {self.paths.novel} in {self.store.path}"
+        if self.dry_run:
+            print(f"🔁 Would rebuild {label}")
+            self.built.append(label)
+            return inputs
+        print(f"🔨 Building {label}")
+        digest = build()
+        self.built.append(label)
+        return digest
+
+    def _splitter_settings(self):
+        from sentence_splitter import token_settings
+
+        return token_settings(self.config.get("text_splitter", {}), "chunk", "chunk_overlap", 500, 50)
+
+    def _segment_inputs(self):
+        return fingerprint("segment", file_digest(self.paths.input), *self._splitter_settings())
+
+    def import_legacy_scenes(self):
+        """
+        Moves the scenes of a novel segmented before the scene store existed (scenes_1.json) into the
+        store, keeping its manifest fingerprint so the novel is not segmented again.
+
+        Without a manifest entry (scenes_1.json from the standalone scripts) the scenes are taken as
+        segmented with the current settings; --force segments the novel again.
+        """
+        if self.store.novel(self.paths.novel) is not None or not os.path.exists(self.paths.scenes):
+            return
+        from scene_store import import_json
+
+        inputs = self.manifest.entries.get(self.paths.scenes, {}).get("inputs") or self._segment_inputs()
+        count = import_json(self.store, self.paths.novel, self.paths.scenes, self.paths.input, inputs=inputs)
+        if self.dry_run:
+            print(f"📦 Would import {count} scenes from {self.paths.scenes} into {self.store.path}")
+        else:
+            print(f"📦 Imported {count} scenes from {self.paths.scenes} into {self.store.path}")
+
+    def sync_artifacts(self, count):
+        """
+        Records in the scene store the images, MP3s and clips that were built before it tracked them.
+        """
+        for kind, path_of in (("image", self.paths.image), ("voice", self.paths.voice), ("clip", self.paths.clip)):
+            known = self.store.artifacts(self.paths.novel, kind)
+            rows = []
+            for i in range(1, count + 1):
+                path = path_of(i)
+                if i not in known and path in self.manifest.entries and os.path.exists(path):
+                    rows.append((i, path, "done", self.manifest.digest(path), None, None))
+            if rows:
+                self.store.set_artifacts(self.paths.novel, kind, rows)
+
+    def load_scenes(self):
+        return self.store.scenes(self.paths.novel)
+
+    def index(self):
+        """
+        Builds the character/location index (entities.json) of the scenes, unless it is up to date.
+        Descriptions edited by hand are kept, also when the scenes change and the index is rebuilt.
+        """
+        settings = self.config.get("entity_index", {})
+        stored = self.store.novel(self.paths.novel)
+        inputs = fingerprint("index", stored and stored["digest"], settings)
+
+        def build():
+            from entity_index import EntityIndex, add_context, generate_reference_images, load_embedder
+
+            scenes = self.load_scenes()
+            previous = EntityIndex.load(self.paths.entities) if os.path.exists(self.paths.entities) else None
+            index = EntityIndex.build(
+                scenes,
+                embedder=load_embedder(settings.get("embedding_model")),
+                similarity=settings.get("similarity", 0.8),
+                duplicate_similarity=settings.get("duplicate_similarity", 0.9),
+                previous=previous,
+            )
+            add_context(index, scenes)
+            if settings.get("describe", True):
+                import openai
+                from Scene_Segmentation import Chatbot
+
+                openai.api_key = self.config["KEY"]["OPENAI_API_KEY"]
+                # One request describes many entities; the descriptions are reused by every scene prompt
+                index.describe(Chatbot(system_prompt="You are an art director. Return a structured JSON object.",
+                                       cache=self.cache))
+            if settings.get("reference_images"):
+                generate_reference_images(index, self.config["Visual_Style"], self.paths.characters, cache=self.cache)
+            index.save(self.paths.entities)
+
+        return self._step(self.paths.entities, inputs, build, allow_edits=True)
+
+    def load_index(self):
+        if not self.config.get("entity_index", {}).get("enabled", True) or not os.path.exists(self.paths.entities):
+            return None
+        from entity_index import EntityIndex
+
+        return EntityIndex.load(self.paths.entities)
+
+    def image(self, i, scene):
+        from Gen_img import build_prompt, generate_image, image_params
+
+        path = self.paths.image(i)
+        source = self.entity_index.duplicates.get(i) if self.entity_index is not None else None
+        with self._image_lock(i):
+            if source is not None:
+                # A near-duplicate scene copies the image of an earlier scene instead of calling DALL·E
+                source_digest = self.image(source, self.scenes[source - 1])
+                inputs = fingerprint("image-copy", source_digest)
+                return self._step(path, inputs, lambda: shutil.copyfile(self.paths.image(source), path),
+                                  scene=i, kind="image")
+
+            prompt = build_prompt(scene, self.config["Visual_Style"], self.entity_index)
+            inputs = fingerprint("image", image_params, prompt)
+            return self._step(path, inputs, lambda: generate_image(prompt, path, cache=self.cache), scene=i,
+                              kind="image")
+
+    def _image_lock(self, i):
+        # Pipelined workers may need the same source image at once; it must be generated only once
+        with self._locks_guard:
+            return self._image_locks.setdefault(i, threading.Lock())
+
+    @property
+    def tts(self):
+        if self._tts is None:
+            from tts_backends import load_backend
+
+            self._tts = load_backend(self.voice_engine, self.config)
+        return self._tts
+
+    def voice(self, i, scene):
+        from tts_backends import synthesize_to_mp3
+
+        text = scene["original_text"]
+        path = self.paths.voice(i)
+        inputs = fingerprint("voice", self.tts.cache_params(), text)
+        return self._step(path, inputs, lambda: synthesize_to_mp3(text, path, self.tts, cache=self.cache), scene=i,
+                          kind="voice")
+
+    def clips(self, media_digests):
+        """
+        Encodes every stale scene clip with a pool of FFmpeg workers.
+
+        Parameters:
+            media_digests (list): (image digest, voice digest) pairs, one per scene in order.
+
+        Returns:
+            list: The clip digests, one per scene.
+
+        Raises:
+            RuntimeError: If any clip failed to encode (the successful ones are still recorded).
+        """
+        from Gen_video import render_clips
+
+        inputs = [fingerprint("clip", image_digest, voice_digest) for image_digest, voice_digest in media_digests]
+        stale = [
+            i for i in range(1, len(inputs) + 1)
+            if self.force or not self.manifest.is_fresh(self.paths.clip(i), inputs[i - 1])
+        ]
+        if self.dry_run:
+            for i in stale:
+                print(f"🔁 Would rebuild {self.paths.clip(i)}")
+            self.built.extend(self.paths.clip(i) for i in stale)
+            return [inputs[i - 1] if i in stale else self.manifest.digest(self.paths.clip(i))
+                    for i in range(1, len(inputs) + 1)]
+
+        for i in sorted(set(range(1, len(inputs) + 1)) - set(stale)):
+            self._confirm("clip", i, self.paths.clip(i))
+        if stale:
+            print(f"🔨 Encoding {len(stale)} clip(s) in parallel")
+            jobs = [(self.paths.image(i), self.paths.voice(i), self.paths.clip(i)) for i in stale]
+            failures = render_clips(jobs, max_workers=self.max_workers, scenes=stale)
+            rows = []
+            for job_index, i in enumerate(stale):
+                if job_index not in failures:
+                    self.manifest.record(self.paths.clip(i), inputs[i - 1])
+                    self.built.append(self.paths.clip(i))
+                    rows.append((i, self.paths.clip(i), "done", self.manifest.digest(self.paths.clip(i)), None, None))
+                else:
+                    rows.append((i, self.paths.clip(i), "failed", None, None, str(failures[job_index])[:300]))
+            self.store.set_artifacts(self.paths.novel, "clip", rows)
+            if failures:
+                for job_index, error in sorted(failures.items()):
+                    print(f"❌ Scene {stale[job_index]}: {error}")
+                raise RuntimeError(f"{len(failures)} clip(s) failed to encode, the final video was not assembled")
+
+        return [self.manifest.digest(self.paths.clip(i)) for i in range(1, len(inputs) + 1)]
+
+    def clip(self, i, image_digest, voice_digest, threads=None):
+        """
+        Encodes the clip of one scene unless it is up to date, and returns its digest.
+        """
+        from Gen_video import render_clip
+
+        path = self.paths.clip(i)
+        inputs = fingerprint("clip", image_digest, voice_digest)
+        return self._step(path, inputs, lambda: render_clip(
+            self.paths.image(i), self.paths.voice(i), path, threads=threads, capture_output=True
+        ), scene=i, kind="clip")
+
+    def run_pipelined(self, scenes):
+        """
+        Builds images, voices and clips of all scenes as an overlapping pipeline (see run_pipelined),
+        then assembles the final video.
+
+        Parameters:
+            scenes (list): The scene list.
+
+        Returns:
+            dict: The time to the first finished clip and the total time, in seconds.
+        """
+        from media_utils import available_cores
+
+        settings = self.config.get("pipeline", {})
+        encode_workers = self.max_workers or max(1, available_cores() // 2)
+        threads = max(1, available_cores() // encode_workers)
+        clip_digests, timings = run_pipelined(
+            len(scenes),
+            make_image=lambda i: self.image(i, scenes[i - 1]),
+            make_voice=lambda i: self.voice(i, scenes[i - 1]),
+            encode_clip=lambda i, image_digest, voice_digest: self.clip(i, image_digest, voice_digest, threads),
+            image_workers=settings.get("image_workers", 4),
+            voice_workers=settings.get("voice_workers", 4),
+            encode_workers=encode_workers,
+        )
+        print(f"⏱️ First clip after {timings['time_to_first_clip']:.1f}s, all clips after {timings['total']:.1f}s")
+        self.final(clip_digests)
+        return timings
+
+    def final(self, clip_digests):
+        from Gen_video import concat_clips
+
+        clips = [self.paths.clip(i) for i in range(1, len(clip_digests) + 1)]
+        inputs = fingerprint("final", clip_digests)
+        return self._step(
+            self.paths.final, inputs, lambda: concat_clips(clips, self.paths.concat_list, self.paths.final)
+        )
+
+    def assemble(self, media_digests):
+        """
+        Encodes the final video from every scene's image and audio in one FFmpeg run.
+
+        There are no per-scene clips in this mode, so any changed image or MP3 re-encodes the whole video.
+        """
+        from Gen_video import assemble_video
+
+        count = len(media_digests)
+        inputs = fingerprint("assemble", media_digests)
+        return self._step(self.paths.final, inputs, lambda: assemble_video(
+            [self.paths.image(i) for i in range(1, count + 1)],
+            [self.paths.voice(i) for i in range(1, count + 1)],
+            self.paths.final,
+            list_dir=os.path.dirname(self.paths.concat_list),
+            durations=self.store.durations(self.paths.novel),
+        ))
+
+    def run(self, stages=STAGES, pipelined=False):
+        """
+        Runs the requested stages, rebuilding only stale artifacts.
+
+        Parameters:
+            stages (list): A subset of STAGES. Default is all stages.
+            pipelined (bool): When the image, voice and video stages all run, start encoding each scene
+                as soon as its image and voice exist instead of after all media is generated.
+
+        Returns:
+            list: The artifact paths that were (or, in a dry run, would be) rebuilt.
+        """
+        self.import_legacy_scenes()
+        if "segment" in stages:
+            self.segment()
+        if not self.store.count(self.paths.novel):
+            print(f"⚠️ No scenes of {self.paths.novel} in {self.store.path} yet, run the segment stage first")
+            return self.built
+
+        if "index" in stages and self.config.get("entity_index", {}).get("enabled", True):
+            self.index()
+        scenes = self.scenes = self.load_scenes()
+        self.entity_index = self.load_index()
+        if not self.dry_run:
+            self.sync_artifacts(len(scenes))
+        if pipelined and not self.single_pass and not self.dry_run and {"image", "voice", "video"} <= set(stages):
+            self.run_pipelined(scenes)
+            print(f"✅ {self.paths.novel}: {len(self.built)} artifact(s) rebuilt")
+            return self.built
+
+        media_digests = []
+        for i, scene in enumerate(scenes, start=1):
+            image_digest = self.image(i, scene) if "image" in stages else self._existing_digest(self.paths.image(i))
+            voice_digest = self.voice(i, scene) if "voice" in stages else self._existing_digest(self.paths.voice(i))
+            if "video" in stages and (image_digest is None or voice_digest is None):
+                raise FileNotFoundError(f"Scene {i} is missing its image or audio, run the image/voice stages")
+            media_digests.append((image_digest, voice_digest))
+
+        if "video" in stages and media_digests and self.single_pass:
+            self.assemble(media_digests)
+        elif "video" in stages and media_digests:
+            # The final concat only starts once every clip has been encoded successfully
+            self.final(self.clips(media_digests))
+
+        print(f"✅ {self.paths.novel}: {len(self.built)} artifact(s) rebuilt")
+        return self.built
+
+
+def add_arguments(parser):
+    """
+    Adds the options shared by pipeline.py and visual_novel.py: everything except which novel(s) to build.
+    """
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"Comma-separated subset of {STAGES}")
+    parser.add_argument("--voice-engine", choices=["gtts", "openai", "espeak"], default="gtts",
+                        help="TTS backend; espeak runs locally on the CPU (settings under tts.<engine> in config.json)")
+    parser.add_argument("--config", default="config.json")
+    parser.add_argument("--force", action="store_true", help="Rebuild everything")
+    parser.add_argument("--dry-run", action="store_true", help="Only list stale artifacts")
+    parser.add_argument("--workers", type=int, help="Parallel FFmpeg encoders (default: available cores)")
+    parser.add_argument("--pipelined", action="store_true",
+                        help="Encode each scene as soon as its image and voice are ready")
+    parser.add_argument("--single-pass", action="store_true",
+                        help="Encode the final video in one FFmpeg run without per-scene clips")
+    parser.add_argument("--report", nargs="?", const="", metavar="DIR",
+                        help="Record per-stage timings, tokens and cost and write report.json/report.html/trace.json "
+                             "(default DIR: Output/<novel>/report)")
+    parser.add_argument("--profile", action="store_true",
+                        help="Also dump cProfile statistics of the main thread to <report DIR>/profile.prof")
+
+
+def parse_stages(parser, value):
+    """
+    Splits the --stages option and exits with a usage error on unknown stage names.
+    """
+    stages = [stage.strip() for stage in value.split(",") if stage.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stage(s): {', '.join(sorted(unknown))}")
+    return stages
+
+
+@contextlib.contextmanager
+def reporting(args, config, report_dir):
+    """
+    Records spans (--report) and profiles the main thread (--profile) while the block runs.
+
+    The report is also written when the block fails; the failing calls are in it with their errors.
+
+    Yields:
+        Recorder: The active recorder, or None without --report.
+    """
+    recorder = None
+    if args.report is not None:
+        recorder = instrumentation.enable(config.get("instrumentation", {}).get("prices"))
+    profiling = instrumentation.profile(os.path.join(report_dir, "profile.prof")) if args.profile \
+        else contextlib.nullcontext()
+    try:
+        with profiling:
+            yield recorder
+    finally:
+        if recorder is not None:
+            for path in recorder.write_report(report_dir):
+                print(f"📊 Report written: {path}")
+
+
+def run_novel(novel, config, args, stages, input_path=None):
+    """
+    Builds one novel with the options added by add_arguments().
+
+    Parameters:
+        novel (str): The novel name.
+        config (dict): The parsed config.json.
+        args (argparse.Namespace): The parsed options.
+        stages (list): The stages to run, see parse_stages().
+        input_path (str): The novel text file. Default is Input/<novel>.txt.
+
+    Returns:
+        list: The artifact paths that were (or, in a dry run, would be) rebuilt.
+    """
+    pipeline = Pipeline(novel, config, input_path=input_path, voice_engine=args.voice_engine,
+                        force=args.force, dry_run=args.dry_run, max_workers=args.workers,
+                        single_pass=args.single_pass)
+    with instrumentation.context(novel=novel):
+        return pipeline.run(stages, pipelined=args.pipelined)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incrementally build the visual novel video of one novel.")
+    parser.add_argument("--novel", default="The_Call_of_Cthulhu", help="Novel name (derives all paths)")
+    parser.add_argument("--input", help="Novel text file (default: Input/<novel>.txt)")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    with open(args.config, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    stages = parse_stages(parser, args.stages)
+
+    with reporting(args, config, args.report or os.path.join("Output", args.novel, "report")):
+        run_novel(args.novel, config, args, stages, input_path=args.input)
@@ -0,0 +1,226 @@
+import random
+import re
+import threading
+import time
+
+import instrumentation
+
+# CJK characters are roughly one token each; everything else averages ~4 characters per token
+_CJK_PATTERN = re.compile(r"[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+# Also converts the character-based chunk settings of older config files (see sentence_splitter.token_settings)
+CHARS_PER_TOKEN = 4
+
+_ENCODING = None
+_ENCODING_LOADED = False
+
+
+def _encoding():
+    """
+    Loads the tiktoken encoding on first use, so importing this module stays cheap.
+
+    Returns:
+        The cl100k_base encoding, or None when tiktoken is not installed.
+    """
+    global _ENCODING, _ENCODING_LOADED
+    if not _ENCODING_LOADED:
+        try:
+            import tiktoken  # Optional: exact token counts when available
+
+            _ENCODING = tiktoken.get_encoding("cl100k_base")
+        except ImportError:
+            _ENCODING = None
+        _ENCODING_LOADED = True
+    return _ENCODING
+
+
+def estimate_tokens(text):
+    """
+    Estimates the number of tokens a piece of text will consume.
+
+    Uses tiktoken when it is installed, otherwise a fast character-based heuristic
+    that counts CJK characters individually.
+
+    Parameters:
+        text (str): The text to measure.
+
+    Returns:
+        int: The (estimated) token count, at least 1 for non-empty text.
+    """
+    if not text:
+        return 0
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    cjk = len(_CJK_PATTERN.findall(text))
+    return max(1, cjk + (len(text) - cjk + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN)
+
+
+def counts_by_length(text):
+    """
+    Returns True when estimate_tokens() of every slice of `text` depends on the slice length alone,
+    i.e. tiktoken is not installed and the text has no CJK characters.
+
+    ASCII and Latin-1 texts (most Western novels) are recognized without scanning them with the
+    CJK regex, which on a whole book costs more than chunking it.
+    """
+    if _encoding() is not None:
+        return False
+    if text.isascii():
+        return True
+    try:
+        text.encode("latin-1")
+        return True
+    except UnicodeEncodeError:
+        return not _CJK_PATTERN.search(text)
+
+
+def span_estimator(text):
+    """
+    Returns estimate(start, end), equal to estimate_tokens(text[start:end]) but cheaper when a long
+    text is measured piece by piece (e.g. every sentence of a book).
+
+    Without tiktoken, a text that contains no CJK characters at all (checked once) is measured from
+    the offsets alone, without slicing it or running the CJK regex on every piece.
+
+    Parameters:
+        text (str): The whole text.
+
+    Returns:
+        callable: estimate(start, end) -> int.
+    """
+    if not counts_by_length(text):
+        return lambda start, end: estimate_tokens(text[start:end])
+    return lambda start, end: (
+        max(1, (end - start + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN) if end > start else 0
+    )
+
+
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    """
+    Computes an exponential backoff delay with full jitter.
+
+    Parameters:
+        attempt (int): The retry attempt number, starting at 0.
+        base (float): The delay of the first retry in seconds. Default is 1.0.
+        cap (float): The maximum delay in seconds. Default is 60.0.
+
+    Returns:
+        float: A random delay between 0 and min(cap, base * 2 ** attempt).
+    """
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class RateLimiter:
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        """
+        A thread-safe token-bucket limiter for requests-per-minute and tokens-per-minute budgets.
+
+        Parameters:
+            requests_per_minute (int): The maximum number of requests per minute. None disables the limit.
+            tokens_per_minute (int): The maximum number of tokens per minute. None disables the limit.
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._request_allowance = float(requests_per_minute or 0)
+        self._token_allowance = float(tokens_per_minute or 0)
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        if self.requests_per_minute:
+            self._request_allowance = min(
+                self.requests_per_minute, self._request_allowance + elapsed * self.requests_per_minute / 60.0
+            )
+        if self.tokens_per_minute:
+            self._token_allowance = min(
+                self.tokens_per_minute, self._token_allowance + elapsed * self.tokens_per_minute / 60.0
+            )
+
+    def acquire(self, tokens=0):
+        """
+        Blocks until one request costing `tokens` tokens fits in both budgets, then consumes it.
+
+        Parameters:
+            tokens (int): The number of tokens the request is expected to consume.
+        """
+        if self.tokens_per_minute:
+            # A single request larger than the whole budget would otherwise wait forever
+            tokens = min(tokens, self.tokens_per_minute)
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self._paused_until - now
+                if wait <= 0:
+                    if self.requests_per_minute and self._request_allowance < 1:
+                        wait = (1 - self._request_allowance) * 60.0 / self.requests_per_minute
+                    if self.tokens_per_minute and self._token_allowance < tokens:
+                        wait = max(wait, (tokens - self._token_allowance) * 60.0 / self.tokens_per_minute)
+                if wait <= 0:
+                    if self.requests_per_minute:
+                        self._request_allowance -= 1
+                    if self.tokens_per_minute:
+                        self._token_allowance -= tokens
+                    return
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """
+        Stops all callers from acquiring for `seconds`, e.g. after the server answered 429.
+
+        Parameters:
+            seconds (float): How long to hold back new requests.
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+def is_rate_limit_error(error):
+    """
+    Returns True if an API error means "429 Too Many Requests" (e.g. openai.RateLimitError).
+    """
+    return getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError"
+
+
+def retry_after(error):
+    """
+    Returns the server's Retry-After delay in seconds for a rate limit error, if it sent one.
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def call_with_rate_limit(fn, limiter, tokens=0, max_retries=5):
+    """
+    Calls `fn()` within the limiter's budget, retrying 429 responses with jittered exponential backoff.
+
+    Parameters:
+        fn (callable): The API call to make.
+        limiter (RateLimiter): The limiter shared by all workers.
+        tokens (int): The estimated token cost of one call.
+        max_retries (int): The maximum number of retries after a 429. Default is 5.
+
+    Returns:
+        The return value of `fn()`.
+    """
+    for attempt in range(max_retries + 1):
+        # Time spent blocked on the budget; attempts after the first are retries
+        with instrumentation.span("rate_limit.wait", attempt=attempt):
+            limiter.acquire(tokens)
+        try:
+            return fn()
+        except Exception as e:
+            if not is_rate_limit_error(e) or attempt == max_retries:
+                raise
+            delay = retry_after(e) or backoff_delay(attempt)
+            print(f"⏳ Rate limited, retrying in {delay:.1f}s ({attempt + 1}/{max_retries})")
+            # Hold back every worker, not just this one, so the others do not hit the limit too
+            limiter.pause(delay)
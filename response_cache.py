@@ -0,0 +1,191 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+
+class ResponseCache:
+    def __init__(self, cache_dir=".cache/responses", max_bytes=2 * 1024 ** 3):
+        """
+        A content-addressed on-disk cache for LLM, image and TTS responses.
+
+        Entries are grouped by stage (e.g. "segmentation", "image", "voice") and keyed by a hash
+        of everything that determines the response, so a changed prompt or parameter is a miss.
+        The least recently used entries are evicted once the cache grows beyond `max_bytes`.
+
+        Parameters:
+            cache_dir (str): The directory holding the cache. Default is ".cache/responses".
+            max_bytes (int): The size bound across all stages. Default is 2 GiB.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._total_bytes = None  # Computed lazily on the first write
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(**parts):
+        """
+        Hashes the model, parameters and input of a call into a cache key.
+
+        Parameters:
+            **parts: JSON-serializable values that fully determine the response.
+
+        Returns:
+            str: The hex SHA-256 digest of the canonical JSON encoding of `parts`.
+        """
+        payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, stage, key):
+        return os.path.join(self.cache_dir, stage, key[:2], key)
+
+    def get(self, stage, key):
+        """
+        Returns the cached bytes for `key`, or None on a miss. A hit refreshes the entry's LRU position.
+        """
+        path = self._path(stage, key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)  # The modification time doubles as the LRU timestamp
+        except OSError:
+            pass
+        return data
+
+    def put(self, stage, key, data):
+        """
+        Stores `data` (bytes) under `key`, evicting old entries if the size bound is exceeded.
+        """
+        path = self._path(stage, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write atomically so concurrent readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+
+        with self._lock:
+            # An overwritten entry no longer counts towards the total
+            try:
+                replaced = os.path.getsize(path)
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(tmp_path, path)
+            if self._total_bytes is None:
+                self._total_bytes = sum(size for _, size, _ in self._entries())
+            else:
+                self._total_bytes += len(data) - replaced
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def get_text(self, stage, key):
+        data = self.get(stage, key)
+        return None if data is None else data.decode("utf-8")
+
+    def put_text(self, stage, key, text):
+        self.put(stage, key, text.encode("utf-8"))
+
+    def _entries(self, stage=None):
+        root = os.path.join(self.cache_dir, stage) if stage else self.cache_dir
+        for dirpath, _, filenames in os.walk(root):
+            for name in filenames:
+                if name.startswith(".tmp-"):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def _evict(self):
+        # Drop the least recently used entries until the cache is back under 90% of its bound
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+        self._total_bytes = total
+
+    def invalidate(self, stage=None):
+        """
+        Deletes every entry of one stage, or the whole cache when `stage` is None.
+        """
+        with self._lock:
+            target = os.path.join(self.cache_dir, stage) if stage else self.cache_dir
+            shutil.rmtree(target, ignore_errors=True)
+            self._total_bytes = None
+
+    def stats(self):
+        """
+        Returns a {stage: (entry_count, total_bytes)} summary of the cache contents.
+        """
+        summary = {}
+        if not os.path.isdir(self.cache_dir):
+            return summary
+        for stage in sorted(os.listdir(self.cache_dir)):
+            entries = list(self._entries(stage))
+            summary[stage] = (len(entries), sum(size for _, size, _ in entries))
+        return summary
+
+
+def cached_call(cache, stage, key, produce):
+    """
+    Returns the cached bytes for `key`, calling `produce()` and storing its result on a miss.
+
+    Parameters:
+        cache (ResponseCache): The cache to use. None disables caching.
+        stage (str): The pipeline stage the entry belongs to.
+        key (str): A key built with ResponseCache.make_key.
+        produce (callable): Returns the response bytes when the cache misses.
+
+    Returns:
+        bytes: The cached or freshly produced response.
+    """
+    if cache is None:
+        return produce()
+    data = cache.get(stage, key)
+    if data is None:
+        data = produce()
+        cache.put(stage, key, data)
+    return data
+
+
+def load_cache(config):
+    """
+    Builds the ResponseCache described by the optional "response_cache" section of config.json.
+    Setting "enabled" to false there disables caching.
+    """
+    settings = dict(config.get("response_cache", {}))
+    if not settings.pop("enabled", True):
+        return None
+    return ResponseCache(**settings)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or invalidate the API response cache.")
+    parser.add_argument("--cache-dir", default=".cache/responses")
+    parser.add_argument("--invalidate", metavar="STAGE", help="Delete all entries of one stage (e.g. image, voice)")
+    parser.add_argument("--clear", action="store_true", help="Delete the whole cache")
+    args = parser.parse_args()
+
+    cache = ResponseCache(args.cache_dir)
+    if args.clear:
+        cache.invalidate()
+        print(f"🗑️ Cleared {args.cache_dir}")
+    elif args.invalidate:
+        cache.invalidate(args.invalidate)
+        print(f"🗑️ Invalidated stage '{args.invalidate}'")
+    for stage, (count, size) in cache.stats().items():
+        print(f"📦 {stage}: {count} entries, {size / 1024 ** 2:.1f} MiB")
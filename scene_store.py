@@ -0,0 +1,542 @@
+import argparse
+import bisect
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import subprocess
+import threading
+import time
+import urllib.parse
+from contextlib import contextmanager
+
+DEFAULT_PATH = os.path.join("scripts", "scenes.db")
+
+# How the text of a scene is kept: as a byte range of the source novel, as a byte range whose
+# whitespace is collapsed to single spaces (segmentation normalizes scenes stitched across chunks),
+# or inline when it cannot be found in the source (e.g. rewritten by hand)
+EXACT, SPACES, INLINE = 0, 1, 2
+
+# Bytes after the previous scene searched before falling back to the whole book
+_WINDOW = 64 * 1024
+
+# Artifact statuses; a scene without a "done" row (or whose file is gone) is missing that artifact.
+# "stale" marks artifacts built from an earlier version of their scene.
+DONE, FAILED, STALE = "done", "failed", "stale"
+
+# Where Gen_img.py, Gen_voice.py, Gen_video.py and the pipeline write the artifacts of scene i
+ARTIFACT_PATHS = {
+    "image": os.path.join("images", "{novel}", "generated_image_{i}.png"),
+    "voice": os.path.join("voices", "{novel}", "MP3_{i}.mp3"),
+    "clip": os.path.join("videos", "{novel}", "temp_video_{i}.mp4"),
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS novels (
+    novel TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    source_digest TEXT NOT NULL,
+    source_stamp TEXT NOT NULL,
+    inputs TEXT,
+    digest TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS scenes (
+    novel TEXT NOT NULL,
+    scene INTEGER NOT NULL,
+    start_byte INTEGER,
+    end_byte INTEGER,
+    mode INTEGER NOT NULL,
+    text TEXT,
+    meta TEXT NOT NULL,
+    digest TEXT,
+    PRIMARY KEY (novel, scene)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS artifacts (
+    novel TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    scene INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    status TEXT NOT NULL,
+    digest TEXT,
+    duration REAL,
+    error TEXT,
+    updated REAL NOT NULL,
+    PRIMARY KEY (novel, kind, scene)
+) WITHOUT ROWID;
+"""
+
+
+def _stamp(path):
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def _digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def scenes_digest(scenes):
+    """
+    Returns the digest of a scene list, independent of how the store keeps it.
+    """
+    return _digest(json.dumps(scenes, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+
+
+def scene_digest(scene):
+    """
+    Returns the digest of one scene's text and metadata; artifacts built from a scene with another
+    digest are out of date.
+    """
+    return _digest(json.dumps(scene, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+
+
+class SourceText:
+    def __init__(self, data):
+        """
+        The UTF-8 bytes of a novel, searchable for the text of its scenes.
+
+        Parameters:
+            data (bytes): The source novel.
+        """
+        self.data = data
+        self._words = None
+
+    def _collapsed(self):
+        # The words of the novel joined by single spaces, with where each word starts in that string
+        # and where it is in the original bytes; built once, on the first scene that is not verbatim
+        if self._words is None:
+            spans = [match.span() for match in re.finditer(rb"\S+", self.data)]
+            starts = []
+            position = 0
+            for word_start, word_end in spans:
+                starts.append(position)
+                position += word_end - word_start + 1
+            joined = b" ".join(self.data[word_start:word_end] for word_start, word_end in spans)
+            self._words = (joined, starts, spans, [word_start for word_start, _ in spans])
+        return self._words
+
+    def locate(self, text, start=0):
+        """
+        Finds the text of a scene in the novel.
+
+        Parameters:
+            text (str): The scene's original_text.
+            start (int): Where to start looking; scenes come in reading order, so the previous scene's offset.
+
+        Returns:
+            tuple: (start byte, end byte, EXACT or SPACES), or None if the text is not in the source.
+        """
+        needle = text.encode("utf-8")
+        collapsible = bool(needle) and b" ".join(needle.split()) == needle
+        # Look just after the previous scene first, in the whole book only for scenes out of order
+        window = 2 * len(needle) + _WINDOW
+        for position, end in ((start, start + window), (0, len(self.data))):
+            offset = self.data.find(needle, position, end)
+            if offset >= 0:
+                return offset, offset + len(needle), EXACT
+            if collapsible:
+                found = self._locate_collapsed(needle, position, end)
+                if found is not None:
+                    return found
+        return None
+
+    def _locate_collapsed(self, needle, position, end):
+        joined, starts, spans, word_starts = self._collapsed()
+        first_word = bisect.bisect_left(word_starts, position)
+        end_word = bisect.bisect_left(word_starts, end)
+        begin = starts[first_word] if first_word < len(starts) else len(joined)
+        stop = starts[end_word] if end_word < len(starts) else len(joined)
+        offset = joined.find(needle, begin, stop + len(needle))
+        while offset >= 0:
+            # The match must cover whole words, not start or end inside one
+            first = bisect.bisect_left(starts, offset)
+            last = bisect.bisect_right(starts, offset + len(needle) - 1) - 1
+            if (first < len(starts) and starts[first] == offset
+                    and starts[last] + spans[last][1] - spans[last][0] == offset + len(needle)):
+                return spans[first][0], spans[last][1], SPACES
+            offset = joined.find(needle, offset + 1, stop + len(needle))
+        return None
+
+
+class SceneStore:
+    def __init__(self, path=DEFAULT_PATH, read_only=False):
+        """
+        The scenes of every novel and the status of their per-scene artifacts, in one SQLite file.
+
+        A scene keeps byte offsets into its source novel instead of a copy of its text, so the store
+        stays small and one scene can be read without loading the rest of the book. Artifact rows
+        (image, voice, clip) make "which scenes still miss X" a single indexed query.
+
+        Parameters:
+            path (str): The database file. Default is scripts/scenes.db.
+            read_only (bool): Work on an in-memory copy of the file (empty if there is none yet);
+                changes are never written back, e.g. for a dry run.
+        """
+        self.path = path
+        if read_only:
+            self._db = sqlite3.connect(":memory:", check_same_thread=False, isolation_level=None)
+            if os.path.exists(path):
+                source = sqlite3.connect(f"file:{urllib.parse.quote(os.path.abspath(path))}?mode=ro", uri=True)
+                source.backup(self._db)
+                source.close()
+        else:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")  # Readers in other processes do not block the writer
+            self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        if "digest" not in [row[1] for row in self._db.execute("PRAGMA table_info(scenes)")]:
+            self._db.execute("ALTER TABLE scenes ADD COLUMN digest TEXT")  # Stores written before per-scene digests
+        self._lock = threading.Lock()  # Artifacts are recorded from several worker threads
+        self._verified = set()
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    # ---------- Scenes ----------
+
+    def put_scenes(self, novel, scenes, source, inputs=None):
+        """
+        Replaces the scenes of a novel.
+
+        The artifacts of every scene whose text or metadata changed are marked stale (and those of scenes
+        that no longer exist dropped), so missing() reports those scenes and durations() forgets their audio.
+
+        Parameters:
+            novel (str): The novel name.
+            scenes (list): Scene dicts as produced by Scene_Segmentation.segment_novel.
+            source (str): The novel text file the scenes were segmented from.
+            inputs (str): The fingerprint the scenes were built from. None keeps the previous one,
+                so scenes edited by hand and imported again are not overwritten by the next run.
+
+        Returns:
+            str: The digest of the scene list.
+        """
+        with open(source, "rb") as f:
+            data = f.read()
+        source_text = SourceText(data)
+        rows = []
+        start = 0
+        for i, scene in enumerate(scenes, start=1):
+            text = scene.get("original_text", "")
+            meta = json.dumps({key: value for key, value in scene.items() if key != "original_text"},
+                              ensure_ascii=False)
+            found = source_text.locate(text, start)
+            if found is None:
+                rows.append((novel, i, None, None, INLINE, text, meta, scene_digest(scene)))
+            else:
+                rows.append((novel, i, found[0], found[1], found[2], None, meta, scene_digest(scene)))
+                start = found[0]  # Boundary scenes may overlap the next one
+
+        previous = self._scene_digests(novel)
+        changed = [(STALE, time.time(), novel, row[1]) for row in rows if previous.get(row[1]) != row[-1]]
+        digest = scenes_digest(scenes)
+        with self._transaction() as db:
+            db.execute("DELETE FROM scenes WHERE novel = ?", (novel,))
+            db.executemany("INSERT INTO scenes (novel, scene, start_byte, end_byte, mode, text, meta, digest) "
+                           "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            db.executemany("UPDATE artifacts SET status = ?, updated = ? WHERE novel = ? AND scene = ?", changed)
+            db.execute("DELETE FROM artifacts WHERE novel = ? AND scene > ?", (novel, len(scenes)))
+            db.execute(
+                "INSERT INTO novels VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (novel) DO UPDATE SET "
+                "source = excluded.source, source_digest = excluded.source_digest, "
+                "source_stamp = excluded.source_stamp, inputs = COALESCE(excluded.inputs, novels.inputs), "
+                "digest = excluded.digest, updated = excluded.updated",
+                (novel, source, _digest(data), _stamp(source), inputs, digest, time.time())
+            )
+        self._verified.add(novel)
+        return digest
+
+    def _scene_digests(self, novel):
+        """
+        Returns {scene: digest} of the stored scenes of a novel.
+
+        Scenes stored before per-scene digests existed get theirs computed from their text; when the
+        source changed since then, they count as changed.
+        """
+        digests = dict(self._query("SELECT scene, digest FROM scenes WHERE novel = ?", (novel,)))
+        if None in digests.values():
+            try:
+                digests = {i: scene_digest(scene) for i, scene in enumerate(self.scenes(novel), start=1)}
+            except (OSError, ValueError):
+                digests = {}
+        return digests
+
+    def novel(self, novel):
+        """
+        Returns {"source", "inputs", "digest", "count"} of a stored novel, or None.
+        """
+        rows = self._query(
+            "SELECT source, inputs, digest, (SELECT COUNT(*) FROM scenes WHERE novel = ?) FROM novels WHERE novel = ?",
+            (novel, novel)
+        )
+        if not rows:
+            return None
+        source, inputs, digest, count = rows[0]
+        return {"source": source, "inputs": inputs, "digest": digest, "count": count}
+
+    def novels(self):
+        return [row[0] for row in self._query("SELECT novel FROM novels ORDER BY novel")]
+
+    def count(self, novel):
+        return self._query("SELECT COUNT(*) FROM scenes WHERE novel = ?", (novel,))[0][0]
+
+    def _source(self, novel):
+        # The offsets are only valid for the exact text they were computed on
+        rows = self._query("SELECT source, source_digest, source_stamp FROM novels WHERE novel = ?", (novel,))
+        if not rows:
+            raise KeyError(f"No scenes stored for {novel}")
+        source, source_digest, source_stamp = rows[0]
+        if novel not in self._verified:
+            stamp = _stamp(source)
+            if stamp != source_stamp:
+                with open(source, "rb") as f:
+                    if _digest(f.read()) != source_digest:
+                        raise ValueError(f"{source} changed since the scenes of {novel} were stored, "
+                                         f"re-run the segment stage")
+                with self._lock:
+                    self._db.execute("UPDATE novels SET source_stamp = ? WHERE novel = ?", (stamp, novel))
+            self._verified.add(novel)
+        return source
+
+    @staticmethod
+    def _text(row, read):
+        start_byte, end_byte, mode, text = row
+        if mode == INLINE:
+            return text
+        data = read(start_byte, end_byte)
+        return (b" ".join(data.split()) if mode == SPACES else data).decode("utf-8")
+
+    def _scenes(self, rows, read):
+        # One json.loads for all metadata is much cheaper than one per scene
+        metas = json.loads("[" + ",".join(row[-1] for row in rows) + "]")
+        for meta, row in zip(metas, rows):
+            meta["original_text"] = self._text(row[1:5], read)
+        return metas
+
+    def scene(self, novel, i):
+        """
+        Returns scene `i` (1-based) of a novel as a scenes_1.json-style dict, or None.
+        Only this scene's bytes of the source are read.
+        """
+        scenes = self.scenes(novel, [i])
+        return scenes[0] if scenes else None
+
+    def scenes(self, novel, numbers=None):
+        """
+        Returns the scenes of a novel in order, or only the given scene numbers (reading only their text).
+        """
+        sql = "SELECT scene, start_byte, end_byte, mode, text, meta FROM scenes WHERE novel = ?"
+        if numbers is None:
+            rows = self._query(sql + " ORDER BY scene", (novel,))
+        else:
+            numbers = sorted(set(numbers))
+            rows = []
+            for first in range(0, len(numbers), 500):  # Stay below SQLite's limit on bound parameters
+                batch = numbers[first:first + 500]
+                rows += self._query(sql + f" AND scene IN ({','.join('?' * len(batch))}) ORDER BY scene",
+                                    (novel, *batch))
+        if not rows:
+            return []
+        with open(self._source(novel), "rb") as f:
+            if numbers is None:
+                data = f.read()  # All scenes together cover the book, one read beats a seek per scene
+                return self._scenes(rows, lambda start_byte, end_byte: data[start_byte:end_byte])
+
+            def read(start_byte, end_byte):
+                f.seek(start_byte)
+                return f.read(end_byte - start_byte)
+
+            return self._scenes(rows, read)
+
+    # ---------- Artifacts ----------
+
+    def set_artifact(self, novel, i, kind, path, status=DONE, digest=None, duration=None, error=None):
+        """
+        Records the state of one artifact ("image", "voice", "clip") of scene `i`.
+        """
+        self.set_artifacts(novel, kind, [(i, path, status, digest, duration, error)])
+
+    def set_artifacts(self, novel, kind, rows):
+        """
+        Records many artifacts of one kind in a single transaction.
+
+        Parameters:
+            rows (list): (scene, path, status, digest, duration, error) tuples.
+        """
+        now = time.time()
+        with self._transaction() as db:
+            db.executemany(
+                "INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(novel, kind, i, path, status, digest, duration, error, now)
+                 for i, path, status, digest, duration, error in rows]
+            )
+
+    def artifacts(self, novel, kind):
+        """
+        Returns {scene: {"path", "status", "digest", "duration", "error"}} for one kind of artifact.
+        """
+        rows = self._query(
+            "SELECT scene, path, status, digest, duration, error FROM artifacts WHERE novel = ? AND kind = ?",
+            (novel, kind)
+        )
+        return {
+            i: {"path": path, "status": status, "digest": digest, "duration": duration, "error": error}
+            for i, path, status, digest, duration, error in rows
+        }
+
+    def missing(self, novel, kind):
+        """
+        Returns the numbers of the scenes that have no finished artifact of `kind` (or whose file was deleted).
+        """
+        rows = self._query(
+            "SELECT s.scene, a.status, a.path FROM scenes s LEFT JOIN artifacts a "
+            "ON a.novel = s.novel AND a.kind = ? AND a.scene = s.scene WHERE s.novel = ? ORDER BY s.scene",
+            (kind, novel)
+        )
+        return [i for i, status, path in rows if status != DONE or not os.path.exists(path)]
+
+    def durations(self, novel):
+        """
+        Returns the recorded audio duration of every scene in order, None where it is unknown.
+        """
+        rows = self._query(
+            "SELECT s.scene, a.duration FROM scenes s LEFT JOIN artifacts a "
+            "ON a.novel = s.novel AND a.kind = 'voice' AND a.scene = s.scene AND a.status = ? "
+            "WHERE s.novel = ? ORDER BY s.scene",
+            (DONE, novel)
+        )
+        return [duration for _, duration in rows]
+
+    def stats(self, novel):
+        """
+        Returns the scene count, how the texts are kept, and the artifact counts per kind and status.
+        """
+        modes = dict(self._query("SELECT mode, COUNT(*) FROM scenes WHERE novel = ? GROUP BY mode", (novel,)))
+        artifacts = {}
+        for kind, status, count in self._query(
+            "SELECT kind, status, COUNT(*) FROM artifacts WHERE novel = ? GROUP BY kind, status", (novel,)
+        ):
+            artifacts.setdefault(kind, {})[status] = count
+        return {
+            "scenes": sum(modes.values()),
+            "offsets": modes.get(EXACT, 0) + modes.get(SPACES, 0),
+            "inline": modes.get(INLINE, 0),
+            "artifacts": artifacts,
+        }
+
+
+def import_json(store, novel, scenes_path, source, inputs=None):
+    """
+    Loads a scenes_1.json file (e.g. one edited by hand) into the store and returns the scene count.
+    """
+    with open(scenes_path, "r", encoding="utf-8") as f:
+        scenes = json.load(f)
+    store.put_scenes(novel, scenes, source, inputs=inputs)
+    return len(scenes)
+
+
+def _voice_duration(path):
+    from media_utils import probe_duration
+    from mp3_stream import read_duration
+
+    duration = read_duration(path)
+    if duration is None:
+        # MP3s written before Gen_voice recorded TLEN frames
+        try:
+            duration = probe_duration(path)
+        except (OSError, ValueError, subprocess.CalledProcessError):
+            duration = None  # Gen_video probes it again when it needs it
+    return duration
+
+
+def adopt_files(store, novel):
+    """
+    Records as done the images, MP3s and clips that already exist at their usual paths for scenes
+    that have no artifact of that kind yet, e.g. files made before the scene store tracked them,
+    so the scripts neither regenerate them nor refuse to run. Voices get their duration.
+
+    Returns:
+        int: The number of files adopted.
+    """
+    adopted = 0
+    for kind, pattern in ARTIFACT_PATHS.items():
+        known = store.artifacts(novel, kind)
+        rows = []
+        for i in range(1, store.count(novel) + 1):
+            path = pattern.format(novel=novel, i=i)
+            if i not in known and os.path.exists(path):
+                duration = _voice_duration(path) if kind == "voice" else None
+                rows.append((i, path, DONE, None, duration, None))
+        if rows:
+            store.set_artifacts(novel, kind, rows)
+            adopted += len(rows)
+    return adopted
+
+
+def open_novel(novel, path=DEFAULT_PATH):
+    """
+    Opens the store for a script working on one novel. A novel that is not in the store yet is
+    imported from scripts/<novel>/scenes_1.json and Input/<novel>.txt, together with the images,
+    MP3s and clips that already exist for its scenes (see adopt_files).
+    """
+    store = SceneStore(path)
+    if store.novel(novel) is None:
+        scenes_path = os.path.join("scripts", novel, "scenes_1.json")
+        if not os.path.exists(scenes_path):
+            store.close()
+            raise FileNotFoundError(f"No scenes stored for {novel} and no {scenes_path} to import")
+        count = import_json(store, novel, scenes_path, os.path.join("Input", f"{novel}.txt"))
+        adopted = adopt_files(store, novel)
+        print(f"📦 Imported {count} scenes of {novel}" + (f", adopted {adopted} existing file(s)" if adopted else ""))
+    return store
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect, import or export the scene store.")
+    parser.add_argument("command", choices=["stats", "import", "export", "missing"])
+    parser.add_argument("--novel", default="The_Call_of_Cthulhu")
+    parser.add_argument("--db", default=DEFAULT_PATH)
+    parser.add_argument("--json", help="scenes JSON to import or export (default: scripts/<novel>/scenes_1.json)")
+    parser.add_argument("--source", help="Novel text file for import (default: Input/<novel>.txt)")
+    parser.add_argument("--kind", default="image", help="Artifact kind for missing: image, voice or clip")
+    args = parser.parse_args()
+
+    json_path = args.json or os.path.join("scripts", args.novel, "scenes_1.json")
+    with SceneStore(args.db) as store:
+        if args.command == "import":
+            count = import_json(store, args.novel, json_path, args.source or os.path.join("Input", f"{args.novel}.txt"))
+            print(f"✅ Imported {count} scenes of {args.novel} from {json_path}")
+        elif args.command == "export":
+            # Edit the exported file and import it again; edits are kept until the novel is segmented anew
+            with open(json_path, "w", encoding="utf-8") as f:
+                json.dump(store.scenes(args.novel), f, ensure_ascii=False, indent=4)
+            print(f"✅ Exported {store.count(args.novel)} scenes of {args.novel} to {json_path}")
+        elif args.command == "missing":
+            print(" ".join(str(i) for i in store.missing(args.novel, args.kind)))
+        else:
+            for novel in store.novels():
+                print(f"📊 {novel}: {json.dumps(store.stats(novel), ensure_ascii=False)}")
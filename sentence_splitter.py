@@ -0,0 +1,309 @@
+import re
+
+from instrumentation import instrumented
+from rate_limiter import CHARS_PER_TOKEN, counts_by_length, estimate_tokens, span_estimator
+
+# Candidate sentence ends: Latin terminators followed by whitespace, CJK terminators anywhere
+# (CJK text has no spaces), both with optional closing quotes/brackets, and blank lines.
+# Every branch starts with the same leading character class, which lets the regex engine skip
+# ordinary text quickly instead of trying each alternative at every position.
+_BOUNDARY = re.compile(
+    r"[.!?…。！？\n]"
+    r"(?:(?<=\n)[ \t]*\n\s*"
+    r"|(?<=[。！？])[。！？]*[\"'”’」』）)\]]*"
+    r"|(?<=[.!?…])[.!?…]*[\"'”’»)\]]*(?=\s|$))"
+)
+
+# Lower-cased words that end with a period without ending the sentence
+ABBREVIATIONS = {
+    "mr", "mrs", "ms", "dr", "prof", "jr", "sr", "rev", "gen", "col", "capt", "lt", "sgt", "hon",
+    "mt", "ft", "vs", "etc", "e.g", "i.e", "cf", "vol", "fig", "pp", "inc", "ltd",
+}
+
+# Words that are also ordinary words ("He said no.") and only count as abbreviations before a
+# number ("No. 7", "p. 12", "ch. 3") or, when capitalised, before a name ("St. Louis", "Co. Ltd")
+AMBIGUOUS_ABBREVIATIONS = {"no", "p", "ch", "st", "co"}
+
+_NEXT_CHAR = re.compile(r"\s*([\"'“‘(\[]*)(\S)")
+_WORD = re.compile(r"\S+\s*")
+
+
+def _next_char(text, end):
+    # The first character of the next word, skipping opening quotes/brackets; "" at the end of the text.
+    # Plain "word. Next" is answered by slicing, the regex only runs for quotes and odd spacing.
+    if text[end:end + 1] == " ":
+        char = text[end + 1:end + 2]
+        if char.isalnum():
+            return char
+    following = _NEXT_CHAR.match(text, end)
+    return following.group(2) if following else ""
+
+
+def _word_before(text, end, limit=20):
+    # The run of word characters and periods ending at `end` ("Mr", "e.g", "H.P"), at most `limit` long
+    start = end
+    while start > end - limit and start > 0 and (text[start - 1].isalnum() or text[start - 1] in "._"):
+        start -= 1
+    return text[start:end]
+
+
+def _is_sentence_end(text, first, end):
+    char = text[first]
+    if char in "\n。！？":
+        return True  # Paragraph breaks and CJK terminators always end a sentence
+    next_char = _next_char(text, end)
+    # Every abbreviation is at most four letters, so after five letters in a row there is nothing to check
+    if char == "." and not (first >= 5 and text[first - 5:first].isalpha()):
+        # A period closing an abbreviation ("Mr.", "e.g.") or an initial ("H.P.", "H. P. Lovecraft") does not
+        word = _word_before(text, first)
+        if word:
+            lower = word.lower()
+            last = word.rsplit(".", 1)[-1]
+            if lower in ABBREVIATIONS or last.lower() in ABBREVIATIONS or (len(last) == 1 and "." in word):
+                return False
+            if last.lower() in AMBIGUOUS_ABBREVIATIONS and (
+                    next_char.isdigit() or (last[0].isupper() and next_char.isupper())):
+                return False
+            # A single capital other than "I" before a capitalised word is an initial
+            if len(last) == 1 and last.isupper() and last != "I" and next_char.isupper():
+                return False
+    # A following lower-case word means the sentence goes on: '"Stop!" he cried.', '... etc. and'
+    return not next_char.islower()
+
+
+def _is_boundary(text, first, end):
+    # Fast path for the common case, a period after a word longer than any abbreviation followed
+    # by " Capital", which needs none of the checks in _is_sentence_end
+    return (text[first] == "." and first >= 5 and text[first - 5:first].isalpha()
+            and text[end:end + 1] == " " and text[end + 1:end + 2].isupper()) or _is_sentence_end(text, first, end)
+
+
+def _last_boundary(text, lo, hi):
+    # The end of the last sentence in text[lo:hi] (after lo), or None. Only the tail is scanned,
+    # in windows that grow until a sentence end turns up, so the cost does not depend on hi - lo.
+    # The regex may look one character past hi, where a boundary's lookahead needs it.
+    window = 256
+    while True:
+        scan = max(lo, hi - window)
+        # Candidates are checked from the last one back, usually the first check decides
+        for match in reversed(list(_BOUNDARY.finditer(text, scan, hi + 1))):
+            first, end = match.span()
+            if end <= lo:
+                break
+            if end <= hi and _is_boundary(text, first, end):
+                return end
+        if scan == lo:
+            return None
+        window *= 4
+
+
+def _first_boundary(text, lo, hi):
+    # The end of the first sentence in text[lo:hi] (after lo), or None
+    for match in _BOUNDARY.finditer(text, lo, hi + 1):
+        first, end = match.span()
+        if end > hi:
+            break
+        if end > lo and _is_boundary(text, first, end):
+            return end
+    return None
+
+
+def token_settings(section, size_key, extra_key, default_size, default_extra):
+    """
+    Reads a chunk size and its overlap (or deviation) in tokens from a config.json section.
+
+    The settings are "<key>_tokens" (e.g. "chunk_tokens", "chunk_overlap_tokens"). Older config files
+    only have the plain keys ("chunk_size", "chunk_overlap"), which were characters; those are
+    converted with CHARS_PER_TOKEN so they keep producing chunks of about the same length.
+
+    Parameters:
+        section (dict): The config section, e.g. config["text_splitter"].
+        size_key (str): The chunk size key without the suffix, e.g. "chunk".
+        extra_key (str): The overlap/deviation key without the suffix, e.g. "chunk_overlap".
+        default_size (int): The chunk size in tokens when neither key is set.
+        default_extra (int): The overlap/deviation in tokens when neither key is set.
+
+    Returns:
+        tuple: (chunk size, overlap or deviation), both in tokens.
+    """
+    def read(key, characters_key, default):
+        if f"{key}_tokens" in section:
+            return section[f"{key}_tokens"]
+        if characters_key in section:
+            return section[characters_key] // CHARS_PER_TOKEN
+        return default
+
+    return (max(1, read(size_key, f"{size_key}_size", default_size)),
+            read(extra_key, extra_key, default_extra))
+
+
+def sentence_spans(text):
+    """
+    Finds all sentence boundaries of a text in one regex pass.
+
+    Handles Western (. ! ? …) and CJK (。！？) terminators, closing quotes and brackets,
+    paragraph breaks, and common abbreviations such as "Mr." or initials such as "H.P.".
+
+    Parameters:
+        text (str): The text to split.
+
+    Returns:
+        list: (start, end) offsets of every sentence, covering the text without gaps.
+    """
+    spans = []
+    start = 0
+    for match in _BOUNDARY.finditer(text):
+        first, end = match.span()
+        if end <= start:
+            continue
+        if not _is_boundary(text, first, end):
+            continue
+        spans.append((start, end))
+        start = end
+    if start < len(text):
+        spans.append((start, len(text)))
+    return spans
+
+
+def split_sentences(text):
+    """
+    Splits a text into sentences.
+
+    Parameters:
+        text (str): The text to split.
+
+    Returns:
+        list: The non-empty, stripped sentences.
+    """
+    sentences = (text[start:end].strip() for start, end in sentence_spans(text))
+    return [sentence for sentence in sentences if sentence]
+
+
+def _split_oversized(text, start, end, chunk_size, count_tokens):
+    # A single sentence above the budget is cut between words (or between characters for
+    # unbroken runs such as CJK text without spaces)
+    pieces = []
+    piece_start, piece_tokens = start, 0
+    for match in _WORD.finditer(text, start, end):
+        word_start, word_end = match.span()
+        tokens = count_tokens(match.group())
+        if piece_tokens + tokens > chunk_size and word_start > piece_start:
+            pieces.append((piece_start, word_start))
+            piece_start, piece_tokens = word_start, 0
+        while tokens > chunk_size:
+            cut = word_start + max(1, (word_end - word_start) * chunk_size // tokens)
+            pieces.append((piece_start, cut))
+            piece_start = word_start = cut
+            tokens = count_tokens(text[cut:word_end])
+        piece_tokens += tokens
+    if piece_start < end:
+        pieces.append((piece_start, end))
+    return pieces
+
+
+def _split_by_length(text, chunk_size, chunk_overlap):
+    # split_text() when a token count follows from the length: a chunk of at most
+    # chunk_size * CHARS_PER_TOKEN characters fits, so each chunk ends at the last sentence end
+    # before that offset and only the text around chunk ends is looked at
+    limit = chunk_size * CHARS_PER_TOKEN
+    overlap = chunk_overlap * CHARS_PER_TOKEN
+    chunks = []
+    start = done = 0  # Start of the current chunk, end of the previous one
+    while done < len(text):
+        if len(text) - start <= limit:
+            end = len(text)
+        else:
+            # The chunk has to get past the previous one, whose end it may overlap
+            end = _last_boundary(text, done, start + limit)
+            if end is None and start < done:
+                start = done  # The overlap leaves no room for the next sentence
+                continue
+            if end is None:
+                # A single sentence above the budget is cut between words, or anywhere in unbroken text
+                cut = max(text.rfind(" ", start + 1, start + limit), text.rfind("\n", start + 1, start + limit))
+                end = cut if cut > start else start + limit
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        # Start the next chunk with the trailing sentences that fit in the overlap
+        next_start = _first_boundary(text, max(start, end - overlap), end - 1) if overlap else None
+        start, done = next_start or end, end
+    return chunks
+
+
+@instrumented("split")
+def split_text(text, chunk_size=500, chunk_overlap=50, count_tokens=estimate_tokens):
+    """
+    Packs the sentences of a text into chunks under a token budget.
+
+    Sentence boundaries are indexed once and every sentence is measured once, so the cost is
+    linear in the length of the text. When tokens are estimated from the length alone (no tiktoken,
+    no CJK text), a chunk is instead cut at the last sentence end that fits the budget, and only the
+    text around chunk ends is searched for sentence ends. Chunks are slices of the original text
+    (paragraph breaks are kept) and never cut a sentence unless that sentence alone exceeds the budget.
+
+    Parameters:
+        text (str): The text to split.
+        chunk_size (int): The maximum number of tokens per chunk. Default is 500.
+        chunk_overlap (int): The number of tokens of trailing sentences repeated at the start of
+            the next chunk to preserve context. Default is 50.
+        count_tokens (callable): Measures a string in tokens. Default is rate_limiter.estimate_tokens.
+
+    Returns:
+        list: A list of text chunks.
+    """
+    if count_tokens is estimate_tokens and counts_by_length(text):
+        return _split_by_length(text, chunk_size, chunk_overlap)
+    if count_tokens is estimate_tokens:
+        measure = span_estimator(text)  # Same numbers, without slicing out every sentence
+    else:
+        def measure(start, end):
+            return count_tokens(text[start:end])
+
+    units = []  # (start, end, tokens) of every sentence, oversized ones already cut
+    for start, end in sentence_spans(text):
+        tokens = measure(start, end)
+        if tokens > chunk_size:
+            pieces = _split_oversized(text, start, end, chunk_size, count_tokens)
+            units.extend((s, e, measure(s, e)) for s, e in pieces)
+        else:
+            units.append((start, end, tokens))
+
+    chunks = []
+    first = 0  # Index of the first unit of the current chunk
+    total = 0  # Tokens in units[first:i]
+    for i, (_, _, tokens) in enumerate(units):
+        if total + tokens > chunk_size and i > first:
+            chunk = text[units[first][0]:units[i - 1][1]].strip()
+            if chunk:
+                chunks.append(chunk)
+            # Start the next chunk with as many trailing sentences as fit in the overlap
+            overlap_first, overlap = i, 0
+            while (overlap_first - 1 > first and overlap + units[overlap_first - 1][2] <= chunk_overlap
+                   and overlap + units[overlap_first - 1][2] + tokens <= chunk_size):
+                overlap_first -= 1
+                overlap += units[overlap_first][2]
+            first, total = overlap_first, overlap
+        total += tokens
+    if first < len(units):
+        chunk = text[units[first][0]:units[-1][1]].strip()
+        if chunk:
+            chunks.append(chunk)
+    return chunks
+
+
+def load_and_split_text(file_path, chunk_size=500, chunk_overlap=50):
+    """
+    Reads a novel text file and splits it into sentence-aligned chunks for processing.
+
+    Parameters:
+        file_path (str): The path to the novel text file.
+        chunk_size (int): The maximum number of tokens per chunk. Default is 500.
+        chunk_overlap (int): The number of overlapping tokens between chunks to preserve context. Default is 50.
+
+    Returns:
+        list: A list of text chunks.
+    """
+    with open(file_path, "r", encoding="utf-8") as f:
+        text = f.read()
+    return split_text(text, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
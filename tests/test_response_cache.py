@@ -0,0 +1,19 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from response_cache import ResponseCache  # noqa: E402
+
+
+def test_overwriting_a_key_does_not_grow_the_total(tmp_path):
+    # 950 bytes in the cache: under the bound, but above the 90% eviction drops down to
+    cache = ResponseCache(str(tmp_path), max_bytes=1000)
+    cache.put("image", "aa" * 32, b"x" * 350)
+    key = ResponseCache.make_key(prompt="a lighthouse")
+    for size in (100, 600, 600, 600, 600, 600):
+        cache.put("voice", key, b"y" * size)
+    assert cache._total_bytes == 950
+    # Nothing was evicted: the image is still there
+    assert cache.get("image", "aa" * 32) == b"x" * 350
+    assert cache.stats() == {"image": (1, 350), "voice": (1, 600)}
@@ -0,0 +1,67 @@
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import instrumentation  # noqa: E402
+from Scene_Segmentation import Chatbot, merge_boundary_scenes  # noqa: E402
+
+
+def scene(text, location, characters):
+    return {"scene_id": 1, "summary": location, "characters": characters, "location": location,
+            "events": [], "transition_reason": "", "original_text": text}
+
+
+# Two chunks as Text_Splitter makes them: the second one starts by repeating the last sentence of the first
+FIRST = "Thurston sat alone in the study.\nHe opened his grand-uncle's box. The bas-relief lay inside."
+SECOND = "The bas-relief lay inside.\n\nThree weeks later, the ship reached the islands. Johansen went ashore."
+
+
+def test_scene_change_at_chunk_boundary_is_not_merged():
+    chunk_scenes = [
+        [scene(FIRST, "Boston study", ["Thurston"])],
+        [scene(SECOND, "Pacific island", ["Johansen"])],
+    ]
+    merged = merge_boundary_scenes(chunk_scenes, [FIRST, SECOND])
+    assert len(merged) == 2
+    assert merged[0]["original_text"] == FIRST
+    # Only the repeated sentence is removed from the new scene
+    assert merged[1]["original_text"] == "Three weeks later, the ship reached the islands. Johansen went ashore."
+
+
+def test_scene_cut_by_chunk_boundary_is_merged_keeping_whitespace():
+    chunk_scenes = [
+        [scene(FIRST, "Boston study", ["Thurston"])],
+        [scene(SECOND, "Boston study", ["Thurston"]), scene("Johansen went ashore.", "Pacific island", ["Johansen"])],
+    ]
+    merged = merge_boundary_scenes(chunk_scenes, [FIRST, SECOND])
+    assert len(merged) == 2
+    assert merged[0]["original_text"] == FIRST + "\n\nThree weeks later, the ship reached the islands. Johansen went ashore."
+
+
+def test_scene_inside_the_repeated_text_is_dropped_but_short_new_scenes_are_kept():
+    heading = "The bas-relief lay inside."
+    chunk_scenes = [
+        [scene(FIRST, "Boston study", ["Thurston"])],
+        [scene(heading, "Boston study", []), scene("II.", "Pacific island", []),
+         scene("Three weeks later, the ship reached the islands.", "Pacific island", ["Johansen"])],
+    ]
+    second = heading + "\n\nII.\n\nThree weeks later, the ship reached the islands."
+    merged = merge_boundary_scenes(chunk_scenes, [FIRST, second])
+    assert [s["original_text"] for s in merged] == [
+        FIRST, "II.", "Three weeks later, the ship reached the islands."
+    ]
+
+
+def test_generate_response_is_reported_under_the_callers_stage():
+    chatbot = Chatbot(system_prompt="test")
+    reply = SimpleNamespace(message=SimpleNamespace(content='{"descriptions": []}'))
+    chatbot.request = lambda prompt: SimpleNamespace(choices=[reply])
+    recorder = instrumentation.enable()
+    try:
+        chatbot.generate_response("describe these", stage="index")
+        chatbot.generate_response("segment this")
+    finally:
+        instrumentation.disable()
+    assert [span["stage"] for span in recorder.spans] == ["index", "segmentation"]
@@ -0,0 +1,19 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from translate_novel import Chunk, chapter_heading  # noqa: E402
+
+
+def test_heading_line_is_added_for_a_chapter_without_a_title_paragraph():
+    chunk = Chunk(2, "chapter002.xhtml", "It was a dark and stormy night.")
+    assert chapter_heading(chunk, 1) == "\n# 2. chapter002.xhtml\n\n"
+    assert chapter_heading(chunk, 2) == ""
+
+
+def test_title_paragraph_is_not_repeated_as_a_heading_line():
+    # iter_epub_paragraphs takes the title from the chapter's <h1>, which is also its first paragraph
+    chunk = Chunk(1, "The  Horror in\nClay", "The Horror in Clay\n\nThe most merciful thing in the world...")
+    assert chapter_heading(chunk, None) == ""
+    assert chapter_heading(chunk._replace(chapter=3), 2) == "\n"
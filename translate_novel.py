@@ -1,12 +1,20 @@
-from ebooklib import epub, ITEM_DOCUMENT  # 修正导入
-from bs4 import BeautifulSoup
 import re
-import openai
 import time
 import json
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import instrumentation
+import sentence_splitter
+from llm_batching import RequestStats, TruncatedResponse, iter_batches, run_batched
+from rate_limiter import RateLimiter, call_with_rate_limit, estimate_tokens
+from response_cache import ResponseCache, load_cache
 
 
 def read_epub(file_path):
+    # ebooklib / bs4 / openai 都在用到时才导入，只处理 TXT 或全部命中缓存时不必付出导入开销
+    from ebooklib import epub, ITEM_DOCUMENT  # 修正导入
+
     # 打开 EPUB 文件
     book = epub.read_epub(file_path)
 
@@ -24,6 +32,8 @@ def read_epub(file_path):
 
 
 def clean_html(html):
+    from bs4 import BeautifulSoup
+
     # 使用 BeautifulSoup 清理 HTML 标签
     soup = BeautifulSoup(html, 'html.parser')
     return soup.get_text()
@@ -35,115 +45,328 @@ def save_to_txt(text, output_path):
         file.write(text)
 
 
-def load_and_split_text(file_path, chunk_size=1000, max_deviation=100):
+# 流式读取 EPUB 时产出的段落和文本块，chapter 为从 1 开始的章节序号
+Paragraph = namedtuple("Paragraph", ["chapter", "title", "text"])
+Chunk = namedtuple("Chunk", ["chapter", "title", "text"])
+
+# 视为独立段落的 HTML 块级元素
+_BLOCK_TAGS = ["p", "h1", "h2", "h3", "h4", "h5", "h6", "li", "blockquote", "pre", "dd", "dt"]
+_HEADING_TAGS = ["h1", "h2", "h3", "h4", "h5", "h6"]
+
+
+def iter_epub_paragraphs(file_path):
+    """
+    按阅读顺序（spine）逐个解析 EPUB 文档，逐段产出清理后的文本，不拼接整本书。
+    跳过 linear="no" 的辅助文档（注释、弹出内容等）和 EPUB3 导航文档（目录），它们不是正文章节。
+
+    :param file_path: EPUB 文件路径
+    :return: Paragraph(chapter, title, text) 生成器，每个 spine 文档视为一章
     """
-    从文本文件中加载内容并按指定大小拆分文本。
-    在句号处截停，允许在 chunk_size 附近波动，统一换行符为 \n，并确保段落之间有双换行符。
+    from bs4 import BeautifulSoup
+    from ebooklib import epub, ITEM_DOCUMENT
+
+    book = epub.read_epub(file_path)
+    chapter = 0
+
+    for idref, linear in book.spine:
+        if linear == "no":
+            continue
+        item = book.get_item_with_id(idref)
+        # 只处理文档类型的项目（通常是 HTML 或 XHTML），目录页（nav.xhtml）也是文档，需单独排除
+        if item is None or item.get_type() != ITEM_DOCUMENT or isinstance(item, epub.EpubNav):
+            continue
+
+        # 每个文档单独解析，解析完即可释放
+        soup = BeautifulSoup(item.get_content(), 'html.parser')
+        # 只取最内层的块级元素，避免 <li><p>..</p></li> 这类嵌套被重复输出
+        blocks = [tag for tag in soup.find_all(_BLOCK_TAGS) if tag.find(_BLOCK_TAGS) is None]
+        if blocks:
+            texts = [tag.get_text(" ", strip=True) for tag in blocks]
+        else:
+            # 没有块级元素时退回到按空行分段
+            texts = [part.strip() for part in re.split(r'\n\s*\n', soup.get_text())]
+        texts = [" ".join(text.split()) for text in texts if text and text.strip()]
+        if not texts:
+            continue
+
+        chapter += 1
+        heading = soup.find(_HEADING_TAGS) or soup.find("title")
+        title = heading.get_text(" ", strip=True) if heading else item.get_name()
+        for text in texts:
+            yield Paragraph(chapter, title, text)
+
+
+def tee_to_txt(paragraphs, output_path):
+    """
+    在段落流经时顺便写入 TXT 文件（段落之间双换行），不需要先生成整本书的字符串。
+
+    :param paragraphs: Paragraph 可迭代对象
+    :param output_path: TXT 文件路径
+    :return: 原样产出的 Paragraph 生成器
+    """
+    with open(output_path, 'w', encoding='utf-8') as file:
+        for paragraph in paragraphs:
+            file.write(paragraph.text)
+            file.write("\n\n")
+            yield paragraph
+
+
+def iter_paragraph_chunks(paragraphs, chunk_size=250, max_deviation=25):
+    """
+    把段落流打包成 chunk：按段落边界拼接到 chunk_size 左右，不跨越章节；
+    超长段落再按句子拆分。
+
+    :param paragraphs: Paragraph 可迭代对象（例如 iter_epub_paragraphs 的输出）
+    :param chunk_size: 每个 chunk 的目标 token 数
+    :param max_deviation: 允许超出 chunk_size 的 token 数
+    :return: Chunk(chapter, title, text) 生成器
+    """
+    buffer = []  # 当前 chunk 的段落
+    length = 0
+    chapter, title = None, None
+
+    for paragraph in paragraphs:
+        tokens = estimate_tokens(paragraph.text)
+        # 章节变化或加上该段会超出上限时，先输出当前 chunk
+        if buffer and (paragraph.chapter != chapter or length + tokens > chunk_size + max_deviation):
+            yield Chunk(chapter, title, "\n\n".join(buffer))
+            buffer, length = [], 0
+        chapter, title = paragraph.chapter, paragraph.title
+
+        if tokens > chunk_size + max_deviation:
+            # 超长段落单独按句子拆分
+            for piece in split_text(paragraph.text, chunk_size, max_deviation):
+                yield Chunk(chapter, title, piece)
+            continue
+
+        buffer.append(paragraph.text)
+        length += tokens
+
+    if buffer:
+        yield Chunk(chapter, title, "\n\n".join(buffer))
+
+
+def iter_epub_chunks(file_path, chunk_size=250, max_deviation=25, txt_path=None):
+    """
+    EPUB → 段落 → chunk 的流式管道，可选地同时写出清理后的 TXT。
+
+    :param file_path: EPUB 文件路径
+    :param chunk_size: 每个 chunk 的目标 token 数
+    :param max_deviation: 允许超出 chunk_size 的 token 数
+    :param txt_path: 可选的 TXT 输出路径
+    :return: Chunk(chapter, title, text) 生成器
+    """
+    paragraphs = iter_epub_paragraphs(file_path)
+    if txt_path:
+        paragraphs = tee_to_txt(paragraphs, txt_path)
+    return iter_paragraph_chunks(paragraphs, chunk_size, max_deviation)
+
+
+def load_and_split_text(file_path, chunk_size=250, max_deviation=25):
+    """
+    从文本文件中加载内容并按 token 预算拆分文本，在句子边界处截停。
 
     :param file_path: 文本文件路径
-    :param chunk_size: 每个 chunk 的目标字符数
-    :param max_deviation: 允许的 chunk_size 波动范围（正负值）
+    :param chunk_size: 每个 chunk 的目标 token 数
+    :param max_deviation: 允许超出 chunk_size 的 token 数
     :return: 拆分后的文本列表
     """
     # 读取文件内容
     with open(file_path, 'r', encoding='utf-8') as file:
         text = file.read()
+    return split_text(text, chunk_size, max_deviation)
 
-    # 统一换行符为 \n
-    text = text.replace('\r\n', '\n').replace('\r', '\n')
-
-    # 确保段落之间有双换行符
-    text = re.sub(r'\n+', '\n\n', text)
-    # 将双换行符替换为单换行符
-    # text = text.replace('\n\n', '\n')
-
-    chunks = []
-    start = 0
-
-    while start < len(text):
-        # 计算当前 chunk 的结束位置
-        end = start + chunk_size
-
-        # 如果结束位置超出文本长度，直接取到文本末尾
-        if end >= len(text):
-            chunks.append(text[start:])
-            break
-
-        # 在 chunk_size 附近查找最近的句号
-        # 向前查找
-        stop_index_forward = text.rfind('.', start, end + max_deviation) + 1  # +1 是为了包含句号
-        # 向后查找
-        stop_index_backward = text.find('.', end - max_deviation, end + max_deviation) + 1  # +1 是为了包含句号
-
-        # 选择最接近 chunk_size 的句号位置
-        if stop_index_forward == 0:  # 向前查找未找到句号
-            stop_index = stop_index_backward if stop_index_backward != 0 else end
-        elif stop_index_backward == 0:  # 向后查找未找到句号
-            stop_index = stop_index_forward
-        else:
-            # 选择距离 chunk_size 更近的句号位置
-            stop_index = (
-                stop_index_forward
-                if abs(stop_index_forward - end) < abs(stop_index_backward - end)
-                else stop_index_backward
-            )
-
-        # 如果找不到句号，则直接截取到 end
-        if stop_index <= start:
-            stop_index = end
 
-        # 提取 chunk
-        chunk = text[start:stop_index].strip()
-        if chunk:  # 忽略空 chunk
-            chunks.append(chunk)
-
-        # 更新 start 位置，紧挨着上一次截取的结束位置
-        start = stop_index
+def split_text(text, chunk_size=250, max_deviation=25):
+    """
+    按 token 预算拆分文本：整句打包，支持中英文标点和常见缩写（见 sentence_splitter），
+    一次遍历完成。chunk 之间不重叠，避免译文重复。
 
-    return chunks
+    :param text: 待拆分的文本
+    :param chunk_size: 每个 chunk 的目标 token 数
+    :param max_deviation: 允许超出 chunk_size 的 token 数
+    :return: 拆分后的文本列表
+    """
+    return sentence_splitter.split_text(text, chunk_size=chunk_size + max_deviation, chunk_overlap=0)
 
 
 class Translator:
-    def __init__(self, api_key, system_prompt="You are a helpful assistant that translates text."):
+    def __init__(self, api_key, system_prompt="You are a helpful assistant that translates text.",
+                 model="gpt-4-turbo", base_url=None, cache=None):
         self.api_key = api_key
         self.system_prompt = system_prompt
+        self.model = model
+        self.cache = cache  # 可选的 ResponseCache，相同输入直接从磁盘返回
+        self.params = {
+            "temperature": 0.5,  # 降低随机性以确保结构化和稳定的响应
+            "top_p": 0.9,  # 防止极端或高度不可能的输出
+            "n": 1,  # 只生成一个响应
+            "presence_penalty": 0.2,  # 稍微鼓励响应中的新内容
+            "frequency_penalty": 0.2,  # 稍微减少重复短语
+        }
+        self.stats = RequestStats()  # 请求数与 token 消耗统计
+        import openai
+
         openai.api_key = self.api_key
+        if base_url:
+            # 指向兼容 OpenAI 的服务（例如本地 stub 服务器）
+            openai.base_url = base_url
+
+    def _prompt(self, text, target_language):
+        return f"Translate the following text to {target_language}. Only return the translated text, do not include any additional explanations or notes. Text to translate: {text}"
+
+    def _cache_key(self, text, target_language):
+        # 单条翻译与批量翻译共用同一个缓存键，两种模式的结果可以互相复用
+        return ResponseCache.make_key(
+            model=self.model, params=self.params, system_prompt=self.system_prompt,
+            prompt=self._prompt(text, target_language)
+        )
 
+    @instrumentation.instrumented("translation")
     def translate_text(self, text, target_language="Chinese"):
-        prompt = f"Translate the following text to {target_language}. Only return the translated text, do not include any additional explanations or notes. Text to translate: {text}"
+        prompt = self._prompt(text, target_language)
+
+        key = self._cache_key(text, target_language)
+        if self.cache is not None:
+            cached = self.cache.get_text("translation", key)
+            if cached is not None:
+                instrumentation.annotate(cached=True)
+                return cached
+
+        instrumentation.annotate(model=self.model)
+        import openai
 
         response = openai.chat.completions.create(
-            model="gpt-4-turbo",  # 使用 GPT-4 Turbo 模型以获得优化的性能
+            model=self.model,  # 默认使用 GPT-4 Turbo 模型以获得优化的性能
             messages=[
                 {"role": "system", "content": self.system_prompt},  # 定义系统级行为
                 {"role": "user", "content": prompt}  # 用户输入提示
             ],
-            temperature=0.5,  # 降低随机性以确保结构化和稳定的响应
-            top_p=0.9,  # 防止极端或高度不可能的输出
-            n=1,  # 只生成一个响应
-            # response_format={"type": "json_object"},  # 强制 GPT 返回 JSON 对象
-            presence_penalty=0.2,  # 稍微鼓励响应中的新内容
-            frequency_penalty=0.2,  # 稍微减少重复短语
-            # stop=["\n\n"]  # 在段落结束时停止响应
+            **self.params
         )
+        self.stats.record(response)
 
         # 提取翻译后的文本
         translated_text = response.choices[0].message.content
         finish_reason = response.choices[0].finish_reason
+        # 只提示异常情况，完整的响应（stop）不打印，避免每个 chunk 刷屏
         if finish_reason == 'length':
             print("响应被截断，可能需要增加 max_tokens 或分页处理。")
-        elif finish_reason == 'stop':
-            print("响应完整。")
-        else:
+        elif finish_reason != 'stop':
             print(f"响应状态: {finish_reason}")
+        # 只缓存完整的响应，被截断的结果下次重新请求
+        if self.cache is not None and finish_reason == 'stop':
+            self.cache.put_text("translation", key, translated_text)
         return translated_text
 
+    @instrumentation.instrumented("translation")
+    def translate_batch(self, texts, target_language="Chinese"):
+        """
+        在一次请求中翻译多段文本：以 JSON 数组发送，要求返回等长的 JSON 数组，
+        省去每段文本重复的 system prompt 和指令开销。
+
+        :param texts: 待翻译的文本列表
+        :param target_language: 目标语言
+        :return: 与 texts 一一对应的译文列表
+        :raises TruncatedResponse: 响应被截断（finish_reason == 'length'）
+        :raises ValueError: 响应无法按输入拆分
+        """
+        prompt = (
+            f"Translate each string of the following JSON array to {target_language}. "
+            'Return a JSON object {"translations": [...]} holding exactly one translated string per input string, '
+            "in the same order. Do not merge, split or skip strings and do not include any additional explanations "
+            f"or notes. Texts to translate: {json.dumps(texts, ensure_ascii=False)}"
+        )
+        import openai
+
+        response = openai.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": self.system_prompt},
+                {"role": "user", "content": prompt}
+            ],
+            response_format={"type": "json_object"},  # 强制 GPT 返回 JSON 对象
+            **self.params
+        )
+        self.stats.record(response)
+        if response.choices[0].finish_reason == 'length':
+            raise TruncatedResponse(f"{len(texts)} 段文本的批量翻译被截断")
+
+        try:
+            translations = json.loads(response.choices[0].message.content)["translations"]
+        except (TypeError, KeyError, json.JSONDecodeError) as e:
+            raise ValueError(f"批量翻译的响应不是预期的 JSON: {e}")
+        if (not isinstance(translations, list) or len(translations) != len(texts)
+                or not all(isinstance(t, str) for t in translations)):
+            raise ValueError(f"批量翻译返回了 {len(translations) if isinstance(translations, list) else 0} 段译文，"
+                             f"预期 {len(texts)} 段")
+        return translations
+
+    def translate_texts(self, texts, target_language="Chinese", batch_tokens=2000, call=None):
+        """
+        按 token 预算把多段文本打包翻译；批次被截断或无法拆分时自动二分重试，
+        单段仍失败时退回到 translate_text。已缓存的文本不会再次请求。
+
+        :param texts: 待翻译的文本列表
+        :param target_language: 目标语言
+        :param batch_tokens: 每个请求中原文的最大 token 数
+        :param call: 可选的包装函数，例如用于速率限制：call(fn, texts) -> fn()
+        :return: 与 texts 一一对应的译文列表
+        """
+        call = call or (lambda fn, batch: fn())
+        results = [None] * len(texts)
+        missing = []
+        for i, text in enumerate(texts):
+            cached = self.cache.get_text("translation", self._cache_key(text, target_language)) if self.cache else None
+            if cached is None:
+                missing.append(i)
+            else:
+                results[i] = cached
+
+        def call_batch(batch):
+            translations = call(lambda: self.translate_batch(batch, target_language), batch)
+            if self.cache is not None:
+                for text, translated in zip(batch, translations):
+                    self.cache.put_text("translation", self._cache_key(text, target_language), translated)
+            return translations
+
+        translated = run_batched(
+            [texts[i] for i in missing], call_batch, batch_tokens,
+            fallback=lambda text: call(lambda: self.translate_text(text, target_language), [text]),
+        )
+        for i, text in zip(missing, translated):
+            results[i] = text
+        return results
+
+
+def chapter_heading(chunk, chapter):
+    """
+    chunk 是新章节的第一个 Chunk 时，返回写在其译文之前的章节标题行，使译文保留 EPUB 的章节划分。
 
-def save_translated_chunks(novel_chunks, output_file, target_language="Chinese", delay_seconds=2, api_key=None):
-    translator = Translator(api_key)
+    :param chunk: Chunk（例如 iter_epub_chunks 的输出）或纯文本
+    :param chapter: 上一个 chunk 的章节序号，第一个 chunk 时为 None
+    :return: "# 序号. 标题" 行；章节第一段就是标题时只返回章节之间的空行；不需要时为空字符串
+    """
+    if isinstance(chunk, Chunk) and chunk.chapter != chapter:
+        # 除第一章外，标题行与上一章之间空一行
+        separator = "" if chapter is None else "\n"
+        # 章节的第一段就是标题（<h1> 等标题元素）时，译文里已经有标题，不再重复
+        if chunk.text.split("\n\n", 1)[0] == " ".join(chunk.title.split()):
+            return separator
+        return separator + f"# {chunk.chapter}. {chunk.title}\n\n"
+    return ""
+
+
+def save_translated_chunks(novel_chunks, output_file, target_language="Chinese", delay_seconds=2, api_key=None,
+                           cache=None):
+    translator = Translator(api_key, cache=cache)
+    chapter = None
     with open(output_file, 'w', encoding='utf-8') as file:
         for i, chunk in enumerate(novel_chunks):
             print(f"正在翻译第 {i+1}/{len(novel_chunks)} 个文本块...")
+            file.write(chapter_heading(chunk, chapter))
+            if isinstance(chunk, Chunk):
+                chapter, chunk = chunk.chapter, chunk.text
             try:
                 # 翻译每个 chunk
                 translated_chunk = translator.translate_text(chunk, target_language=target_language)
@@ -166,6 +389,116 @@ def save_translated_chunks(novel_chunks, output_file, target_language="Chinese",
     print(f"翻译后的文本已保存到 {output_file}")
 
 
+def translate_with_retry(translator, chunk, limiter, target_language="Chinese", max_retries=5):
+    """
+    在速率预算内翻译一个 chunk，遇到 429 时按指数退避（带抖动）重试。
+
+    :param translator: Translator 实例
+    :param chunk: 待翻译文本
+    :param limiter: RateLimiter 实例，所有线程共享
+    :param target_language: 目标语言
+    :param max_retries: 429 之后的最大重试次数
+    :return: 翻译后的文本
+    """
+    # 预估 prompt + 输出的 token 消耗（译文长度与原文相近）
+    tokens = 2 * estimate_tokens(chunk) + estimate_tokens(translator.system_prompt)
+    return call_with_rate_limit(
+        lambda: translator.translate_text(chunk, target_language=target_language), limiter, tokens, max_retries
+    )
+
+
+def save_translated_chunks_concurrent(novel_chunks, output_file, target_language="Chinese", api_key=None,
+                                      max_workers=4, requests_per_minute=None, tokens_per_minute=None,
+                                      max_retries=5, base_url=None, cache=None, batch_tokens=None):
+    """
+    并发翻译所有 chunk：同时保持 max_workers 个请求在途，遵守 RPM/TPM 预算，
+    并严格按照原始顺序写入输出文件。
+
+    :param novel_chunks: 待翻译的文本或 Chunk 的列表或生成器（例如 iter_epub_chunks 的输出），
+        Chunk 的章节在译文中以标题行分隔（见 chapter_heading）
+    :param output_file: 输出文件路径
+    :param target_language: 目标语言
+    :param api_key: OpenAI API key
+    :param max_workers: 同时在途的最大请求数
+    :param requests_per_minute: 每分钟请求数上限，None 表示不限制
+    :param tokens_per_minute: 每分钟 token 数上限，None 表示不限制
+    :param max_retries: 每个 chunk 遇到 429 后的最大重试次数
+    :param base_url: 可选的 OpenAI 兼容服务地址（例如本地 stub 服务器）
+    :param cache: 可选的 ResponseCache
+    :param batch_tokens: 若设置，把多个短 chunk 打包进一个请求，每个请求的原文不超过该 token 数
+    :return: Translator 的 RequestStats（请求数与 token 消耗）
+    """
+    translator = Translator(api_key, base_url=base_url, cache=cache)
+    limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+    total = len(novel_chunks) if hasattr(novel_chunks, "__len__") else "?"
+    max_pending = 2 * max_workers  # 流式输入时最多预取的请求数，避免一次性读入整本书
+    pending = {}  # 在途请求：future -> [(index, 原文), ...]
+    finished = {}  # 已完成但尚未写入的结果：index -> 文本
+    headings = {}  # 新章节第一个 chunk 的标题行：index -> 标题行
+    next_index = 0  # 下一个应写入文件的 chunk 序号
+
+    def rate_limited(fn, texts):
+        # 预估 prompt + 输出的 token 消耗（译文长度与原文相近）
+        tokens = 2 * sum(estimate_tokens(text) for text in texts) + estimate_tokens(translator.system_prompt)
+        return call_with_rate_limit(fn, limiter, tokens, max_retries)
+
+    def translate_job(batch):
+        texts = [chunk for _, chunk in batch]
+        if batch_tokens is None:
+            return [translate_with_retry(translator, texts[0], limiter, target_language, max_retries)]
+        return translator.translate_texts(texts, target_language, batch_tokens, call=rate_limited)
+
+    def texts(chunks):
+        # 取出 Chunk 的正文送去翻译，章节信息留在 headings 里等写出时使用
+        chapter = None
+        for i, chunk in enumerate(chunks):
+            heading = chapter_heading(chunk, chapter)
+            if heading:
+                headings[i] = heading
+            if isinstance(chunk, Chunk):
+                chapter, chunk = chunk.chapter, chunk.text
+            yield chunk
+
+    def collect(file, done):
+        nonlocal next_index
+        for future in done:
+            batch = pending.pop(future)
+            try:
+                for (i, _), translated in zip(batch, future.result()):
+                    finished[i] = translated
+                    print(f"第 {i+1}/{total} 个文本块翻译完成")
+            except Exception as e:
+                for i, chunk in batch:
+                    print(f"处理第 {i+1} 个文本块时出错: {e}")
+                    finished[i] = chunk  # 如果翻译失败，写入原文
+
+        # 按原始顺序写出所有已连续完成的 chunk
+        while next_index in finished:
+            file.write(headings.pop(next_index, ""))
+            file.write(finished.pop(next_index))
+            file.write("\n")  # 保留原文本中的换行符
+            next_index += 1
+        file.flush()  # 确保内容立即写入文件
+
+    if batch_tokens is None:
+        batches = ([(i, chunk)] for i, chunk in enumerate(texts(novel_chunks)))
+    else:
+        batches = iter_batches(texts(novel_chunks), batch_tokens)
+
+    with open(output_file, 'w', encoding='utf-8') as file, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for batch in batches:
+            if len(pending) >= max_pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(file, done)
+            pending[executor.submit(translate_job, batch)] = batch
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            collect(file, done)
+
+    print(f"翻译后的文本已保存到 {output_file}")
+    return translator.stats
+
+
 if __name__ == "__main__":
     # 读取 JSON 文件
     with open("trans.json", "r", encoding="utf-8") as f:
@@ -173,24 +506,33 @@ if __name__ == "__main__":
     # 使用函数读取 EPUB 文件
     file_path = config["Trans"]["epub_path"]  # 替换为你的 EPUB 文件路径
     output_path = config["Trans"]["txt_path"]  # 替换为你想保存的 TXT 文件路径
-    # 读取 EPUB 文件内容
-    text = read_epub(file_path)
-    # 清理 HTML 标签
-    cleaned_text = clean_html(text)
-    # 将清理后的文本保存到 TXT 文件
-    save_to_txt(cleaned_text, output_path)
-    print(f"文本已保存到 {output_path}")
-    # 访问配置数据
-    novel_pth = output_path
-    chunk_size = config["Trans"]["chunk_size"]
-    max_deviation = config["Trans"]["max_deviation"]
-    # 读取小说文本并拆分成片段
-    novel_chunks = load_and_split_text(novel_pth, chunk_size=chunk_size, max_deviation=max_deviation)
-    print("chunk_size:", chunk_size)
-    print("max_deviation:", max_deviation)
-    print(f"Total {len(novel_chunks)} scene segments extracted")  # Display the number of text chunks
-    
+    # chunk_tokens / max_deviation_tokens；旧的 chunk_size / max_deviation 是字符数，按 CHARS_PER_TOKEN 换算
+    chunk_size, max_deviation = sentence_splitter.token_settings(
+        config["Trans"], "chunk", "max_deviation", 250, 25
+    )
+    print("chunk_tokens:", chunk_size)
+    print("max_deviation_tokens:", max_deviation)
+    # 流式管道：逐个解析 spine 文档 → 清理后的段落 → chunk，同时写出 TXT，不再回读；
+    # 保留 Chunk 的章节信息，译文中每章以标题行开头
+    novel_chunks = iter_epub_chunks(file_path, chunk_size, max_deviation, txt_path=output_path)
+
     output_file = config["Trans"]["output"]
     target_language = config["Trans"]["target_language"]
     api_key = config["Trans"]["OPENAI_API_KEY"]
-    save_translated_chunks(novel_chunks, output_file, target_language, delay_seconds=1, api_key=api_key)
\ No newline at end of file
+    max_workers = config["Trans"].get("max_workers", 1)
+    cache = load_cache(config)
+    if max_workers > 1:
+        # 并发模式：吞吐量由并发数和速率预算决定，而不是固定的 sleep
+        save_translated_chunks_concurrent(
+            novel_chunks, output_file, target_language, api_key=api_key, max_workers=max_workers,
+            requests_per_minute=config["Trans"].get("requests_per_minute"),
+            tokens_per_minute=config["Trans"].get("tokens_per_minute"),
+            base_url=config["Trans"].get("base_url"), cache=cache,
+            batch_tokens=config["Trans"].get("batch_tokens"),
+        )
+    else:
+        novel_chunks = list(novel_chunks)
+        print(f"Total {len(novel_chunks)} scene segments extracted")  # Display the number of text chunks
+        save_translated_chunks(novel_chunks, output_file, target_language, delay_seconds=1, api_key=api_key,
+                               cache=cache)
+    print(f"文本已保存到 {output_path}")
@@ -0,0 +1,252 @@
+import os
+import re
+import shutil
+import subprocess
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import instrumentation
+from media_utils import available_cores, run_ffmpeg
+from mp3_stream import Mp3Writer
+from response_cache import ResponseCache
+from sentence_splitter import split_sentences
+
+
+class TTSBackend(ABC):
+    """
+    Turns one piece of text into MP3 bytes.
+
+    A backend sets `name`, `cache_stage` (its response cache stage), `segment_chars` (how much text one
+    synthesize() call should get), `max_chars` (the hard per-request limit of the engine) and
+    `max_workers` (how many calls may run at once), and implements synthesize().
+    """
+    name = None
+    cache_stage = None
+    segment_chars = 400
+    max_chars = 4096
+    max_workers = 4
+
+    @abstractmethod
+    def synthesize(self, text):
+        """
+        Synthesizes one segment. It is called from several threads at once (up to `max_workers`).
+
+        Parameters:
+            text (str): The segment, at most `max_chars` characters.
+
+        Returns:
+            bytes: The audio as an MP3 file; Mp3Writer drops its tags when the segments are joined.
+        """
+
+    def cache_params(self):
+        """
+        Returns everything besides the text that determines the audio, for cache keys and fingerprints.
+        """
+        return {"engine": self.name}
+
+
+class OpenAITTS(TTSBackend):
+    name = "openai"
+    cache_stage = "voice"
+    max_chars = 4096
+
+    def __init__(self, params=None, max_workers=4):
+        """
+        OpenAI's speech endpoint.
+
+        Parameters:
+            params (dict): model and voice. Default is Gen_voice.voice_params.
+            max_workers (int): Concurrent requests per scene. Default is 4.
+        """
+        if params is None:
+            from Gen_voice import voice_params as params
+        self.params = dict(params)
+        self.max_workers = max_workers
+
+    def synthesize(self, text):
+        import openai
+
+        response = openai.audio.speech.create(input=text, response_format="mp3", **self.params)
+        instrumentation.annotate(model=self.params["model"], characters=len(text))
+        return response.content
+
+    def cache_params(self):
+        return {"engine": self.name, "params": self.params}
+
+
+class GTTSBackend(TTSBackend):
+    name = "gtts"
+    cache_stage = "gtts"
+    max_chars = 5000
+
+    def __init__(self, lang="en", max_workers=4):
+        """
+        Google Text-to-Speech (gtts package).
+
+        Parameters:
+            lang (str): The gTTS language code. Default is "en".
+            max_workers (int): Concurrent requests per scene. Default is 4.
+        """
+        self.lang = lang
+        self.max_workers = max_workers
+
+    def synthesize(self, text):
+        from gtts import gTTS
+
+        buffer = BytesIO()
+        gTTS(text=text, lang=self.lang).write_to_fp(buffer)
+        instrumentation.annotate(characters=len(text))
+        return buffer.getvalue()
+
+    def cache_params(self):
+        return {"engine": self.name, "lang": self.lang}
+
+
+class EspeakTTS(TTSBackend):
+    name = "espeak"
+    cache_stage = "espeak"
+    segment_chars = 200
+    max_chars = 20000
+
+    def __init__(self, voice="en-us", speed=160, pitch=50, bitrate="64k", binary=None, max_workers=None):
+        """
+        A local engine that runs offline on the CPU: espeak-ng synthesizes WAV, FFmpeg encodes it to MP3.
+
+        Parameters:
+            voice (str): The espeak-ng voice, e.g. "en-us" or "cmn". Default is "en-us".
+            speed (int): Words per minute. Default is 160.
+            pitch (int): 0-99. Default is 50.
+            bitrate (str): The MP3 bitrate. Default is "64k".
+            binary (str): The espeak executable. Default is espeak-ng, or espeak if that is missing.
+            max_workers (int): Concurrent synthesis processes. Default is the number of available cores.
+
+        Raises:
+            FileNotFoundError: If no espeak executable is installed.
+        """
+        self.binary = binary or shutil.which("espeak-ng") or shutil.which("espeak")
+        if not self.binary:
+            raise FileNotFoundError("espeak-ng is not installed (e.g. apt install espeak-ng)")
+        self.voice = voice
+        self.speed = speed
+        self.pitch = pitch
+        self.bitrate = bitrate
+        self.max_workers = max_workers or available_cores()
+
+    def synthesize(self, text):
+        wav = subprocess.run(
+            [self.binary, "--stdout", "-v", self.voice, "-s", str(self.speed), "-p", str(self.pitch)],
+            input=text.encode("utf-8"), capture_output=True, check=True
+        ).stdout
+        mp3 = run_ffmpeg(
+            "ffmpeg.mp3",
+            ["ffmpeg", "-v", "error", "-f", "wav", "-i", "pipe:0", "-c:a", "libmp3lame", "-b:a", self.bitrate,
+             "-write_xing", "0", "-id3v2_version", "0", "-f", "mp3", "pipe:1"],  # Bare frames, ready to concatenate
+            input=wav, capture_output=True
+        ).stdout
+        instrumentation.annotate(characters=len(text))
+        return mp3
+
+    def cache_params(self):
+        return {"engine": self.name, "voice": self.voice, "speed": self.speed, "pitch": self.pitch,
+                "bitrate": self.bitrate}
+
+
+BACKENDS = {"openai": OpenAITTS, "gtts": GTTSBackend, "espeak": EspeakTTS}
+
+
+def load_backend(name, config=None):
+    """
+    Builds a TTS backend from its name and the optional "tts" section of config.json,
+    e.g. {"tts": {"espeak": {"voice": "en-gb", "speed": 150}}}.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown TTS engine {name!r}, expected one of {sorted(BACKENDS)}")
+    return BACKENDS[name](**(config or {}).get("tts", {}).get(name, {}))
+
+
+def plan_segments(text, segment_chars, max_chars):
+    """
+    Splits a scene's text into sentence-aligned segments for parallel synthesis.
+
+    Consecutive short sentences are packed together up to `segment_chars`, so each request still
+    gets a natural phrase to intonate; a sentence longer than `max_chars` is cut between words.
+
+    Returns:
+        list: The segments, in reading order.
+    """
+    segments = []
+    current = ""
+    for sentence in split_sentences(text):
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            segments.append(sentence[:cut].strip())
+            sentence = sentence[cut:].strip()
+        if current and len(current) + 1 + len(sentence) > segment_chars:
+            segments.append(current)
+            current = ""
+        current = f"{current} {sentence}" if current else sentence
+    if current:
+        segments.append(current)
+    return [segment for segment in segments if re.search(r"\w", segment)]
+
+
+def synthesize_segment(backend, text, cache=None):
+    """
+    Synthesizes one segment, reusing the cached audio when this exact text was already synthesized.
+    """
+    with instrumentation.span("voice.segment", engine=backend.name):
+        key = ResponseCache.make_key(**backend.cache_params(), input=text)
+        audio = cache.get(backend.cache_stage, key) if cache is not None else None
+        instrumentation.annotate(cached=audio is not None)
+        if audio is None:
+            audio = backend.synthesize(text)
+            if cache is not None:
+                cache.put(backend.cache_stage, key, audio)
+        instrumentation.annotate(bytes=len(audio))
+        return audio
+
+
+@instrumentation.instrumented("voice")
+def synthesize_to_mp3(text, output_path, backend, cache=None):
+    """
+    Synthesizes a scene sentence by sentence in parallel and streams the audio into one MP3 file.
+
+    Segments are written in reading order as soon as they and all segments before them are done,
+    so the start of the file is playable while the rest is still being synthesized. The total
+    duration is stored in the file's ID3 TLEN frame (see mp3_stream.read_duration), which lets
+    Gen_video use it without running ffprobe.
+
+    Parameters:
+        text (str): The scene text.
+        output_path (str): The MP3 file to write.
+        backend (TTSBackend): The engine, e.g. load_backend("espeak").
+        cache (ResponseCache): Optional response cache, keyed per segment.
+
+    Returns:
+        float: The duration of the audio in seconds.
+    """
+    segments = plan_segments(text, backend.segment_chars, backend.max_chars)
+    if not segments:
+        raise ValueError(f"No text to synthesize for {output_path}")
+    context = instrumentation.current_context()
+
+    def synthesize(segment):
+        with instrumentation.context(**context):
+            return synthesize_segment(backend, segment, cache)
+
+    with ThreadPoolExecutor(max_workers=min(backend.max_workers, len(segments))) as executor:
+        writer = Mp3Writer(output_path)
+        try:
+            for audio in executor.map(synthesize, segments):  # map yields in submission order
+                writer.append(audio)
+        except BaseException:
+            # A partial MP3 would still look complete to players and Gen_video
+            writer.close()
+            os.remove(output_path)
+            raise
+        writer.close()
+    instrumentation.annotate(engine=backend.name, segments=len(segments), bytes=writer.bytes,
+                             audio_seconds=writer.duration)
+    return writer.duration
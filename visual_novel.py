@@ -0,0 +1,168 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import instrumentation
+from pipeline import add_arguments, parse_stages, reporting, run_novel
+
+# Heavy libraries (openai, langchain, ebooklib, bs4, sentence-transformers) are imported by the stage
+# that needs them, so starting this CLI and skipping up-to-date novels costs tens of milliseconds.
+
+
+def iter_queue(novels, queue_path):
+    """
+    Yields the novels to build: the --novel names first, then one name per line of the queue file.
+
+    With "-" the queue is read from stdin line by line, so a long-lived process can be fed novels
+    as they arrive (blank lines and # comments are skipped).
+    """
+    seen = set()
+    lines = []
+    if queue_path == "-":
+        lines = sys.stdin
+    elif queue_path:
+        with open(queue_path, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+    for name in list(novels or []) + [line.split("#", 1)[0] for line in lines]:
+        name = name.strip()
+        if name.endswith(".txt"):
+            name = os.path.splitext(os.path.basename(name))[0]
+        if name and name not in seen:
+            seen.add(name)
+            yield name
+
+
+def build(novel, config, args, stages):
+    """
+    Builds one novel; errors are returned instead of raised so one broken novel does not stop the queue.
+
+    Returns:
+        tuple: (number of rebuilt artifacts, error message or None, seconds)
+    """
+    start = time.perf_counter()
+    try:
+        built = run_novel(novel, config, args, stages)
+        return len(built), None, time.perf_counter() - start
+    except Exception as e:
+        print(f"❌ {novel}: {type(e).__name__}: {e}")
+        return 0, f"{type(e).__name__}: {e}", time.perf_counter() - start
+
+
+def build_in_worker(novel, config, args, stages, prices=None, record=False):
+    """
+    build() for a ProcessPoolExecutor worker: the spans recorded in the worker are returned
+    with the result so the parent can merge them into its report.
+
+    Returns:
+        tuple: build()'s result, the spans and the worker recorder's start time.
+    """
+    recorder = instrumentation.enable(prices) if record else None
+    try:
+        with instrumentation.context(process=os.getpid()):
+            result = build(novel, config, args, stages)
+    finally:
+        instrumentation.disable()
+    if recorder is None:
+        return result, [], None
+    return result, recorder.spans, recorder.started
+
+
+def run_queue(novels, config, args, stages, jobs=1, processes=False, recorder=None):
+    """
+    Builds a queue of novels in this process, `jobs` novels at a time.
+
+    Config is parsed and modules are imported once for the whole queue; every novel's spans carry
+    its name. Novels are taken from the iterable as workers become free, so it may be a live stream.
+
+    Parameters:
+        novels (iterable): Novel names.
+        config (dict): The parsed config.json.
+        args (argparse.Namespace): The options added by pipeline.add_arguments().
+        stages (list): The stages to run.
+        jobs (int): Novels built at the same time. Default is 1.
+        processes (bool): Build each novel in a worker process instead of a thread, for CPU-bound
+            stages such as the local espeak engine.
+        recorder (Recorder): The active recorder, which also receives the spans of worker processes.
+
+    Returns:
+        dict: {novel: (number of rebuilt artifacts, error message or None, seconds)}, in queue order.
+    """
+    results = {}
+    if processes:
+        executor = ProcessPoolExecutor(max_workers=jobs)
+        prices = recorder.prices if recorder is not None else None
+
+        def submit(novel):
+            return executor.submit(build_in_worker, novel, config, args, stages, prices, recorder is not None)
+    else:
+        executor = ThreadPoolExecutor(max_workers=jobs)
+
+        def submit(novel):
+            return executor.submit(build, novel, config, args, stages)
+
+    with executor:
+        pending = {}
+        novels = iter(novels)
+        exhausted = False
+        while pending or not exhausted:
+            while not exhausted and len(pending) < jobs:
+                novel = next(novels, None)
+                if novel is None:
+                    exhausted = True
+                else:
+                    results[novel] = None
+                    pending[submit(novel)] = novel
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                novel = pending.pop(future)
+                result = future.result()
+                if processes:
+                    result, spans, started = result
+                    if recorder is not None and spans:
+                        recorder.merge(spans, started)
+                results[novel] = result
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="visual-novel",
+        description="Build the visual novel videos of one or more novels in one process."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="Run the pipeline stages for a queue of novels")
+    run.add_argument("--novel", action="append", default=[],
+                     help="Novel name, repeatable (derives all paths from Input/<novel>.txt)")
+    run.add_argument("--queue", metavar="FILE",
+                     help="File with one novel name per line, or - to read novels from stdin as they arrive")
+    run.add_argument("--all", action="store_true", help="Queue every Input/*.txt")
+    run.add_argument("--jobs", type=int, default=1, help="Novels built at the same time (default: 1)")
+    run.add_argument("--processes", action="store_true",
+                     help="Build novels in worker processes instead of threads (for CPU-bound stages)")
+    add_arguments(run)
+    args = parser.parse_args()
+
+    with open(args.config, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    stages = parse_stages(run, args.stages)
+    if args.all:
+        args.novel += sorted(name for name in os.listdir("Input") if name.endswith(".txt"))
+    if not args.novel and not args.queue:
+        run.error("give at least one --novel, --queue or --all")
+
+    start = time.perf_counter()
+    with reporting(args, config, args.report or os.path.join("Output", "report")) as recorder:
+        results = run_queue(iter_queue(args.novel, args.queue), config, args, stages,
+                            jobs=max(1, args.jobs), processes=args.processes, recorder=recorder)
+
+    failed = [novel for novel, (_, error, _) in results.items() if error]
+    print(f"📦 {len(results)} novel(s) in {time.perf_counter() - start:.1f}s, {len(failed)} failed")
+    for novel, (built, error, seconds) in results.items():
+        print(f"{'❌' if error else '✅'} {novel}: {built} artifact(s) rebuilt in {seconds:.1f}s"
+              + (f" ({error})" if error else ""))
+    sys.exit(1 if failed else 0)